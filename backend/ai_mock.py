@@ -1,19 +1,19 @@
 """
-Mock AI services for content generation
+Mock AI services for content generation (asyncio-based)
 """
+import asyncio
 import random
-import time
 import uuid
 from typing import Optional, Dict, List
 
 
 class AIMock:
-    """Mock AI service for content generation"""
+    """Mock AI service for content generation; awaits instead of blocking a thread"""
     
     @staticmethod
-    def generate_static_image(prompt: str, parameters: Optional[Dict] = None) -> Dict:
+    async def generate_static_image(prompt: str, parameters: Optional[Dict] = None) -> Dict:
         """Mock static image generation"""
-        time.sleep(0.5)  # Simulate processing
+        await asyncio.sleep(0.5)  # Simulate processing
         image_id = uuid.uuid4().hex[:12]
         return {
             "url": f"https://mock-storage.example.com/images/{image_id}.jpg",
@@ -26,9 +26,9 @@ class AIMock:
         }
     
     @staticmethod
-    def generate_animated_image(prompt: str, parameters: Optional[Dict] = None) -> Dict:
+    async def generate_animated_image(prompt: str, parameters: Optional[Dict] = None) -> Dict:
         """Mock animated image generation (GIF/MP4)"""
-        time.sleep(1.0)  # Simulate longer processing
+        await asyncio.sleep(1.0)  # Simulate longer processing
         animation_id = uuid.uuid4().hex[:12]
         format_type = parameters.get("format", "gif") if parameters else "gif"
         return {
@@ -43,9 +43,9 @@ class AIMock:
         }
     
     @staticmethod
-    def generate_video_morph(start_image: str, end_image: str, parameters: Optional[Dict] = None) -> Dict:
+    async def generate_video_morph(start_image: str, end_image: str, parameters: Optional[Dict] = None) -> Dict:
         """Mock video morphing between two images"""
-        time.sleep(2.0)  # Simulate complex processing
+        await asyncio.sleep(2.0)  # Simulate complex processing
         video_id = uuid.uuid4().hex[:12]
         return {
             "url": f"https://mock-storage.example.com/videos/{video_id}.mp4",
@@ -60,9 +60,9 @@ class AIMock:
         }
     
     @staticmethod
-    def generate_contextual_photo(url: str, prompt: str, parameters: Optional[Dict] = None) -> Dict:
+    async def generate_contextual_photo(url: str, prompt: str, parameters: Optional[Dict] = None) -> Dict:
         """Mock contextual photo creative based on URL analysis"""
-        time.sleep(1.5)  # Simulate URL analysis and generation
+        await asyncio.sleep(1.5)  # Simulate URL analysis and generation
         photo_id = uuid.uuid4().hex[:12]
         return {
             "url": f"https://mock-storage.example.com/contextual/{photo_id}.jpg",
@@ -77,9 +77,9 @@ class AIMock:
         }
     
     @staticmethod
-    def analyze_conversion_score(image_url: str, parameters: Optional[Dict] = None) -> Dict:
+    async def analyze_conversion_score(image_url: str, parameters: Optional[Dict] = None) -> Dict:
         """Mock AI scoring for conversion analysis"""
-        time.sleep(0.3)  # Quick analysis
+        await asyncio.sleep(0.3)  # Quick analysis
         
         # Generate random score between 70-95
         score = random.randint(70, 95)
@@ -104,7 +104,46 @@ class AIMock:
             },
             "status": "completed"
         }
+    
+    @staticmethod
+    async def generate_vector_creative(generation_id: int, parameters: Optional[Dict] = None) -> Dict:
+        """Mock vector creative generation (Recraft.ai)"""
+        await asyncio.sleep(0.5)  # Simulate processing
+        vector_id = uuid.uuid4().hex[:12]
+        return {
+            "url": f"https://mock-storage.example.com/vector/{generation_id}/{vector_id}.svg",
+            "format": "SVG",
+            "scalable": True,
+            "message": "Векторный креатив сгенерирован через Recraft.ai"
+        }
+    
+    @staticmethod
+    async def generate_branded_set(generation_id: int, parameters: Optional[Dict] = None) -> Dict:
+        """Mock branded set generation (Fusion: Recraft + Brand Colors)"""
+        return {
+            "url": f"https://mock-storage.example.com/branded-set/{generation_id}/",
+            "creatives": [
+                f"https://mock-storage.example.com/branded-set/{generation_id}/creative_1.svg",
+                f"https://mock-storage.example.com/branded-set/{generation_id}/creative_2.svg",
+                f"https://mock-storage.example.com/branded-set/{generation_id}/creative_3.svg"
+            ],
+            "message": "Брендовый Сет из 3 креативов в едином стиле (Recraft.ai + Brand Colors)"
+        }
 
+    
+    @staticmethod
+    async def post_process(engine_name: str, inputs: List[str], parameters: Optional[Dict] = None) -> Dict:
+        """Mock post-processing step of a fusion chain (brand colors, consistency check)"""
+        await asyncio.sleep(0.2)  # Simulate processing
+        asset_id = uuid.uuid4().hex[:12]
+        return {
+            "url": f"https://mock-storage.example.com/processed/{asset_id}.svg",
+            "status": "completed",
+            "metadata": {
+                "processor": engine_name,
+                "inputs": inputs
+            }
+        }
 
 # Generation costs mapping
 GENERATION_COSTS = {
@@ -0,0 +1,33 @@
+"""Add BUNDLE_PURCHASE transaction type
+
+Revision ID: 0018_add_bundle_purchase_type
+Revises: 0017_fix_creative_search_rank
+Create Date: 2026-10-18 23:55:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0018_add_bundle_purchase_type'
+down_revision = '0017_fix_creative_search_rank'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Покупки бандлов получают собственный тип транзакции (отчет о марже
+    находил их по тексту описания). Существующие покупки переразмечаются.
+    """
+    # ALTER TYPE ... ADD VALUE нельзя выполнять внутри транзакции (Postgres < 12)
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE transactiontype ADD VALUE IF NOT EXISTS 'BUNDLE_PURCHASE'")
+    op.execute("""
+        UPDATE transactions SET type = 'BUNDLE_PURCHASE'
+        WHERE type = 'CREDIT_USAGE' AND description LIKE 'Bundle purchase:%'
+    """)
+
+
+def downgrade() -> None:
+    op.execute("UPDATE transactions SET type = 'CREDIT_USAGE' WHERE type = 'BUNDLE_PURCHASE'")
+    # Postgres не поддерживает удаление значений из enum
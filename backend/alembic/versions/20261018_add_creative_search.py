@@ -0,0 +1,44 @@
+"""Add full-text search over top creatives
+
+Revision ID: 0014_add_creative_search
+Revises: 0013_add_library_unlocks
+Create Date: 2026-10-18 23:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0014_add_creative_search'
+down_revision = '0013_add_library_unlocks'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    top_creatives.search_vector: генерируемый tsvector по названию (вес A),
+    описанию (B) и промпту (C) с GIN индексом для поиска библиотеки.
+    Конфигурация russian стеммит и русские, и латинские (english_stem) слова.
+    Частичный индекс (ai_score, id) по одобренным креативам обслуживает
+    сортировку и keyset-пагинацию.
+    """
+    op.execute("""
+        ALTER TABLE top_creatives ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce(description, '')), 'B') ||
+            setweight(to_tsvector('russian', coalesce(prompt, '')), 'C')
+        ) STORED
+    """)
+    op.execute("CREATE INDEX ix_top_creatives_search_vector ON top_creatives USING gin (search_vector)")
+    op.execute("""
+        CREATE INDEX ix_top_creatives_approved_rank
+        ON top_creatives (ai_score DESC, id DESC)
+        WHERE is_approved
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_top_creatives_approved_rank")
+    op.execute("DROP INDEX IF EXISTS ix_top_creatives_search_vector")
+    op.execute("ALTER TABLE top_creatives DROP COLUMN search_vector")
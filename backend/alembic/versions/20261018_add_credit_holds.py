@@ -0,0 +1,55 @@
+"""Add credit holds (reservations)
+
+Revision ID: 0008_add_credit_holds
+Revises: 0007_add_engine_limits
+Create Date: 2026-10-18 17:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0008_add_credit_holds'
+down_revision = '0007_add_engine_limits'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Резервирование кредитов на время генерации (hold -> capture / release).
+    users.credits_held: сумма открытых резервов; доступный баланс =
+    credits_balance - credits_held.
+    """
+    op.add_column('users', sa.Column('credits_held', sa.Integer(), nullable=False, server_default='0'))
+
+    op.create_table(
+        'credit_holds',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('generation_id', sa.Integer(), nullable=True),
+        sa.Column('amount', sa.Integer(), nullable=False),
+        sa.Column('captured_amount', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True, server_default='open'),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True, server_default=sa.text('now()')),
+        sa.Column('settled_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['generation_id'], ['generations.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_credit_holds_id', 'credit_holds', ['id'])
+    op.create_index('ix_credit_holds_user_id', 'credit_holds', ['user_id'])
+    op.create_index('ix_credit_holds_generation_id', 'credit_holds', ['generation_id'])
+    op.create_index('ix_credit_holds_status', 'credit_holds', ['status'])
+    op.create_index('ix_credit_holds_expires_at', 'credit_holds', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_credit_holds_expires_at', table_name='credit_holds')
+    op.drop_index('ix_credit_holds_status', table_name='credit_holds')
+    op.drop_index('ix_credit_holds_generation_id', table_name='credit_holds')
+    op.drop_index('ix_credit_holds_user_id', table_name='credit_holds')
+    op.drop_index('ix_credit_holds_id', table_name='credit_holds')
+    op.drop_table('credit_holds')
+    op.drop_column('users', 'credits_held')
@@ -0,0 +1,50 @@
+"""Add sharded credit counters
+
+Revision ID: 0009_add_credit_shards
+Revises: 0008_add_credit_holds
+Create Date: 2026-10-18 18:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0009_add_credit_shards'
+down_revision = '0008_add_credit_holds'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Шардированный баланс для аккаунтов с большим числом параллельных списаний:
+    credit_shards (N строк-счетчиков на пользователя), users.credit_shard_count
+    и credit_holds.sharded.
+    """
+    op.add_column('users', sa.Column('credit_shard_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('credit_holds', sa.Column('sharded', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+    op.create_table(
+        'credit_shards',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('shard_no', sa.Integer(), nullable=False),
+        sa.Column('balance', sa.Integer(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'shard_no', name='uq_credit_shards_user_shard')
+    )
+    op.create_index('ix_credit_shards_id', 'credit_shards', ['id'])
+
+
+def downgrade() -> None:
+    # Возвращаем остатки шардов в основной баланс
+    op.execute("""
+        UPDATE users SET credits_balance = credits_balance + s.total
+        FROM (SELECT user_id, SUM(balance) AS total FROM credit_shards GROUP BY user_id) s
+        WHERE users.id = s.user_id
+    """)
+    op.drop_index('ix_credit_shards_id', table_name='credit_shards')
+    op.drop_table('credit_shards')
+    op.drop_column('credit_holds', 'sharded')
+    op.drop_column('users', 'credit_shard_count')
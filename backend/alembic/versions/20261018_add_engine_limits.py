@@ -0,0 +1,35 @@
+"""Add bulkhead and circuit breaker settings to ai_engines
+
+Revision ID: 0007_add_engine_limits
+Revises: 0006_add_generation_job_priority
+Create Date: 2026-10-18 16:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0007_add_engine_limits'
+down_revision = '0006_add_generation_job_priority'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Лимиты изоляции AI-движков: одновременные вызовы, очередь ожидания
+    и пороги circuit breaker.
+    """
+    op.add_column('ai_engines', sa.Column('max_concurrency', sa.Integer(), nullable=False, server_default='10'))
+    op.add_column('ai_engines', sa.Column('max_queue', sa.Integer(), nullable=False, server_default='100'))
+    op.add_column('ai_engines', sa.Column('breaker_error_threshold', sa.Float(), nullable=False, server_default='0.5'))
+    op.add_column('ai_engines', sa.Column('breaker_latency_ms', sa.Integer(), nullable=False, server_default='30000'))
+    op.add_column('ai_engines', sa.Column('breaker_cooldown_seconds', sa.Integer(), nullable=False, server_default='30'))
+
+
+def downgrade() -> None:
+    op.drop_column('ai_engines', 'breaker_cooldown_seconds')
+    op.drop_column('ai_engines', 'breaker_latency_ms')
+    op.drop_column('ai_engines', 'breaker_error_threshold')
+    op.drop_column('ai_engines', 'max_queue')
+    op.drop_column('ai_engines', 'max_concurrency')
@@ -0,0 +1,78 @@
+"""Derive fusion chain costs from their engines
+
+Revision ID: 0012_add_fusion_chain_engines
+Revises: 0011_add_price_snapshots
+Create Date: 2026-10-18 21:00:00
+
+"""
+from collections import Counter
+import json
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0012_add_fusion_chain_engines'
+down_revision = '0011_add_price_snapshots'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Индекс агент -> цепочки (fusion_chain_engines) и fusion_chains.cost_adjustment_usd.
+    Себестоимость цепочки = сумма себестоимости агентов шагов + поправка;
+    поправка заполняется так, чтобы текущие цены цепочек не изменились.
+    """
+    op.add_column('fusion_chains', sa.Column('cost_adjustment_usd', sa.Float(), nullable=False, server_default='0'))
+    op.create_table(
+        'fusion_chain_engines',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('chain_id', sa.Integer(), nullable=False),
+        sa.Column('engine_id', sa.Integer(), nullable=False),
+        sa.Column('steps', sa.Integer(), nullable=False, server_default='1'),
+        sa.ForeignKeyConstraint(['chain_id'], ['fusion_chains.id']),
+        sa.ForeignKeyConstraint(['engine_id'], ['ai_engines.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('chain_id', 'engine_id', name='uq_fusion_chain_engines_chain_engine')
+    )
+    op.create_index('ix_fusion_chain_engines_id', 'fusion_chain_engines', ['id'])
+    op.create_index('ix_fusion_chain_engines_chain_id', 'fusion_chain_engines', ['chain_id'])
+    op.create_index('ix_fusion_chain_engines_engine_id', 'fusion_chain_engines', ['engine_id'])
+
+    # Заполняем индекс по chain_config существующих цепочек
+    connection = op.get_bind()
+    engines = connection.execute(sa.text("SELECT id, name, internal_cost_usd_per_unit FROM ai_engines")).fetchall()
+    by_id = {row.id: row for row in engines}
+    by_name = {row.name: row for row in engines}
+    chains = connection.execute(sa.text("SELECT id, chain_config, total_cost_usd FROM fusion_chains")).fetchall()
+
+    for chain in chains:
+        try:
+            steps = json.loads(chain.chain_config)
+        except ValueError:
+            continue
+        counts = Counter()
+        for step in steps if isinstance(steps, list) else []:
+            engine = by_id.get(step.get("engine_id")) or by_name.get(step.get("engine_name"))
+            if engine is not None:
+                counts[engine.id] += 1
+
+        engine_cost = 0.0
+        for engine_id, count in counts.items():
+            connection.execute(
+                sa.text("INSERT INTO fusion_chain_engines (chain_id, engine_id, steps) VALUES (:chain_id, :engine_id, :steps)"),
+                {"chain_id": chain.id, "engine_id": engine_id, "steps": count}
+            )
+            engine_cost += count * (by_id[engine_id].internal_cost_usd_per_unit or 0.0)
+        connection.execute(
+            sa.text("UPDATE fusion_chains SET cost_adjustment_usd = :adjustment WHERE id = :id"),
+            {"adjustment": round(chain.total_cost_usd - engine_cost, 6), "id": chain.id}
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_fusion_chain_engines_engine_id', table_name='fusion_chain_engines')
+    op.drop_index('ix_fusion_chain_engines_chain_id', table_name='fusion_chain_engines')
+    op.drop_index('ix_fusion_chain_engines_id', table_name='fusion_chain_engines')
+    op.drop_table('fusion_chain_engines')
+    op.drop_column('fusion_chains', 'cost_adjustment_usd')
@@ -0,0 +1,36 @@
+"""Add tier priority to generation jobs
+
+Revision ID: 0006_add_generation_job_priority
+Revises: 0005_add_generation_result_metadata
+Create Date: 2026-10-18 15:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0006_add_generation_job_priority'
+down_revision = '0005_add_generation_result_metadata'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Приоритет задач по тарифу: задачи выбираются по priority_deadline
+    (время постановки + смещение тарифа), started_at - для статистики ожидания.
+    """
+    subscription_tier_enum = postgresql.ENUM(name='subscriptiontier', create_type=False)
+    op.add_column('generation_jobs', sa.Column('tier', subscription_tier_enum, nullable=True))
+    op.add_column('generation_jobs', sa.Column('priority_deadline', sa.DateTime(), nullable=True))
+    op.add_column('generation_jobs', sa.Column('started_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE generation_jobs SET priority_deadline = available_at WHERE priority_deadline IS NULL")
+    op.create_index('ix_generation_jobs_priority_deadline', 'generation_jobs', ['priority_deadline'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_generation_jobs_priority_deadline', table_name='generation_jobs')
+    op.drop_column('generation_jobs', 'started_at')
+    op.drop_column('generation_jobs', 'priority_deadline')
+    op.drop_column('generation_jobs', 'tier')
@@ -0,0 +1,52 @@
+"""Add durable generation job queue
+
+Revision ID: 0003_add_generation_jobs
+Revises: 0002_add_pricing_models
+Create Date: 2026-10-18 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0003_add_generation_jobs'
+down_revision = '0002_add_pricing_models'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Таблица generation_jobs: очередь задач генерации в Postgres
+    (SELECT ... FOR UPDATE SKIP LOCKED, аренда с heartbeat).
+    """
+    op.create_table(
+        'generation_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('generation_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=True, server_default='queued'),
+        sa.Column('attempts', sa.Integer(), nullable=True, server_default='0'),
+        sa.Column('max_attempts', sa.Integer(), nullable=True, server_default='3'),
+        sa.Column('available_at', sa.DateTime(), nullable=True, server_default=sa.text('now()')),
+        sa.Column('lease_owner', sa.String(), nullable=True),
+        sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True, server_default=sa.text('now()')),
+        sa.Column('updated_at', sa.DateTime(), nullable=True, server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['generation_id'], ['generations.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('generation_id')
+    )
+    op.create_index('ix_generation_jobs_id', 'generation_jobs', ['id'])
+    op.create_index('ix_generation_jobs_status', 'generation_jobs', ['status'])
+    op.create_index('ix_generation_jobs_available_at', 'generation_jobs', ['available_at'])
+    op.create_index('ix_generation_jobs_lease_expires_at', 'generation_jobs', ['lease_expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_generation_jobs_lease_expires_at', table_name='generation_jobs')
+    op.drop_index('ix_generation_jobs_available_at', table_name='generation_jobs')
+    op.drop_index('ix_generation_jobs_status', table_name='generation_jobs')
+    op.drop_index('ix_generation_jobs_id', table_name='generation_jobs')
+    op.drop_table('generation_jobs')
@@ -0,0 +1,27 @@
+"""Add result metadata to generations
+
+Revision ID: 0005_add_generation_result_metadata
+Revises: 0004_add_refund_transaction_type
+Create Date: 2026-10-18 14:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0005_add_generation_result_metadata'
+down_revision = '0004_add_refund_transaction_type'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    generations.result_metadata: JSON с деталями результата движка
+    (в т.ч. тайминги шагов Fusion-цепочки).
+    """
+    op.add_column('generations', sa.Column('result_metadata', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('generations', 'result_metadata')
@@ -0,0 +1,45 @@
+"""Add idempotency keys
+
+Revision ID: 0010_add_idempotency_keys
+Revises: 0009_add_credit_shards
+Create Date: 2026-10-18 19:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0010_add_idempotency_keys'
+down_revision = '0009_add_credit_shards'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Таблица idempotency_keys: сохраненные ответы запросов с заголовком
+    Idempotency-Key (генерации, покупка бандлов, создание платежей).
+    """
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('response_status', sa.Integer(), nullable=True),
+        sa.Column('response_body', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key')
+    )
+    op.create_index('ix_idempotency_keys_id', 'idempotency_keys', ['id'])
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_index('ix_idempotency_keys_id', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
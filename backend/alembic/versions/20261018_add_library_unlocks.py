@@ -0,0 +1,55 @@
+"""Add library unlocks index
+
+Revision ID: 0013_add_library_unlocks
+Revises: 0012_add_fusion_chain_engines
+Create Date: 2026-10-18 22:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0013_add_library_unlocks'
+down_revision = '0012_add_fusion_chain_engines'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    library_unlocks: открытые пользователем креативы библиотеки с уникальным
+    индексом (user_id, creative_id) вместо поиска LIKE по описаниям транзакций.
+    Заполняется из существующих транзакций "Library unlock: creative_id:N"
+    (раньше они записывались с типом CREDIT_USAGE, теперь LIBRARY_UNLOCK).
+    """
+    op.create_table(
+        'library_unlocks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('creative_id', sa.Integer(), nullable=False),
+        sa.Column('cost', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['creative_id'], ['top_creatives.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'creative_id', name='uq_library_unlocks_user_creative')
+    )
+    op.create_index('ix_library_unlocks_id', 'library_unlocks', ['id'])
+
+    op.execute("""
+        INSERT INTO library_unlocks (user_id, creative_id, cost, created_at)
+        SELECT DISTINCT ON (t.user_id, c.id) t.user_id, c.id, -t.credits_change, t.created_at
+        FROM transactions t
+        JOIN top_creatives c
+          ON c.id = CAST(substring(t.description FROM 'creative_id:([0-9]+)') AS INTEGER)
+        WHERE t.description LIKE 'Library unlock: creative_id:%'
+          AND t.user_id IS NOT NULL
+          AND t.status = 'completed'
+        ORDER BY t.user_id, c.id, t.created_at
+        ON CONFLICT (user_id, creative_id) DO NOTHING
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_library_unlocks_id', table_name='library_unlocks')
+    op.drop_table('library_unlocks')
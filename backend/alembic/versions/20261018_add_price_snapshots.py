@@ -0,0 +1,55 @@
+"""Add versioned price snapshots
+
+Revision ID: 0011_add_price_snapshots
+Revises: 0010_add_idempotency_keys
+Create Date: 2026-10-18 20:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0011_add_price_snapshots'
+down_revision = '0010_add_idempotency_keys'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Версии прайса: price_snapshots (курс и цены всех типов на момент
+    изменения) и ссылка на версию в generations и transactions.
+    Первая версия создается приложением при первом обращении к ценам.
+    """
+    op.create_table(
+        'price_snapshots',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exchange_rate', sa.Float(), nullable=False),
+        sa.Column('prices', sa.Text(), nullable=False),
+        sa.Column('reason', sa.String(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_price_snapshots_id', 'price_snapshots', ['id'])
+    op.create_index('ix_price_snapshots_created_at', 'price_snapshots', ['created_at'])
+
+    op.add_column('generations', sa.Column('price_snapshot_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'fk_generations_price_snapshot_id', 'generations', 'price_snapshots', ['price_snapshot_id'], ['id']
+    )
+    op.add_column('transactions', sa.Column('price_snapshot_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'fk_transactions_price_snapshot_id', 'transactions', 'price_snapshots', ['price_snapshot_id'], ['id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('fk_transactions_price_snapshot_id', 'transactions', type_='foreignkey')
+    op.drop_column('transactions', 'price_snapshot_id')
+    op.drop_constraint('fk_generations_price_snapshot_id', 'generations', type_='foreignkey')
+    op.drop_column('generations', 'price_snapshot_id')
+    op.drop_index('ix_price_snapshots_created_at', table_name='price_snapshots')
+    op.drop_index('ix_price_snapshots_id', table_name='price_snapshots')
+    op.drop_table('price_snapshots')
@@ -0,0 +1,66 @@
+"""Add MinHash/LSH index of creative prompts
+
+Revision ID: 0016_add_prompt_dedup
+Revises: 0015_add_trending_score
+Create Date: 2026-10-18 23:45:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0016_add_prompt_dedup'
+down_revision = '0015_add_trending_score'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    creative_signatures: MinHash-сигнатуры промптов креативов библиотеки;
+    creative_lsh_buckets: LSH-корзины полос сигнатур с индексом (band, bucket)
+    для поиска почти одинаковых промптов; top_creatives.duplicate_of_id и
+    duplicate_similarity отмечают вероятные дубликаты. Сигнатуры существующих
+    креативов строятся в Python (prompt_dedup.index_missing) фоновыми задачами
+    API и воркера генераций; новые индексируются при добавлении.
+    """
+    op.add_column('top_creatives', sa.Column('duplicate_of_id', sa.Integer(), nullable=True))
+    op.add_column('top_creatives', sa.Column('duplicate_similarity', sa.Float(), nullable=True))
+    op.create_foreign_key(
+        'fk_top_creatives_duplicate_of_id', 'top_creatives', 'top_creatives', ['duplicate_of_id'], ['id']
+    )
+    op.create_index('ix_top_creatives_duplicate_of_id', 'top_creatives', ['duplicate_of_id'])
+
+    op.create_table(
+        'creative_signatures',
+        sa.Column('creative_id', sa.Integer(), nullable=False),
+        sa.Column('minhash', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['creative_id'], ['top_creatives.id']),
+        sa.PrimaryKeyConstraint('creative_id')
+    )
+
+    op.create_table(
+        'creative_lsh_buckets',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('creative_id', sa.Integer(), nullable=False),
+        sa.Column('band', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['creative_id'], ['top_creatives.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_creative_lsh_buckets_id', 'creative_lsh_buckets', ['id'])
+    op.create_index('ix_creative_lsh_buckets_creative_id', 'creative_lsh_buckets', ['creative_id'])
+    op.create_index('ix_creative_lsh_buckets_band_bucket', 'creative_lsh_buckets', ['band', 'bucket'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_creative_lsh_buckets_band_bucket', table_name='creative_lsh_buckets')
+    op.drop_index('ix_creative_lsh_buckets_creative_id', table_name='creative_lsh_buckets')
+    op.drop_index('ix_creative_lsh_buckets_id', table_name='creative_lsh_buckets')
+    op.drop_table('creative_lsh_buckets')
+    op.drop_table('creative_signatures')
+    op.drop_index('ix_top_creatives_duplicate_of_id', table_name='top_creatives')
+    op.drop_constraint('fk_top_creatives_duplicate_of_id', 'top_creatives', type_='foreignkey')
+    op.drop_column('top_creatives', 'duplicate_similarity')
+    op.drop_column('top_creatives', 'duplicate_of_id')
@@ -0,0 +1,29 @@
+"""Add REFUND transaction type
+
+Revision ID: 0004_add_refund_transaction_type
+Revises: 0003_add_generation_jobs
+Create Date: 2026-10-18 13:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0004_add_refund_transaction_type'
+down_revision = '0003_add_generation_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Возврат кредитов за неудачные элементы пакетной генерации.
+    SQLAlchemy хранит имена членов enum, поэтому значение в верхнем регистре.
+    """
+    # ALTER TYPE ... ADD VALUE нельзя выполнять внутри транзакции (Postgres < 12)
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE transactiontype ADD VALUE IF NOT EXISTS 'REFUND'")
+
+
+def downgrade() -> None:
+    # Postgres не поддерживает удаление значений из enum
+    pass
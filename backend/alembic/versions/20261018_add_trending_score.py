@@ -0,0 +1,41 @@
+"""Add trending score to top creatives
+
+Revision ID: 0015_add_trending_score
+Revises: 0014_add_creative_search
+Create Date: 2026-10-18 23:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0015_add_trending_score'
+down_revision = '0014_add_creative_search'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    top_creatives.trending_score: логарифм суммы весов активности (одобрение,
+    просмотры, разблокировки) с экспоненциальным затуханием, см. trending.py.
+    Обновляется инкрементально при каждом событии. Существующие счетчики
+    относятся к дате создания креатива: ln(10 + просмотры + 20 * разблокировки)
+    + ln(2) / период полураспада (48 ч) * секунды от эпохи 2026-01-01.
+    """
+    op.add_column(
+        'top_creatives',
+        sa.Column('trending_score', sa.Float(), nullable=False, server_default='0')
+    )
+    op.execute("""
+        UPDATE top_creatives
+        SET trending_score = ln(10 + coalesce(views_count, 0) + 20 * coalesce(unlocks_count, 0))
+            + ln(2) / (48 * 3600)
+            * extract(epoch FROM coalesce(created_at, now()) - timestamp '2026-01-01')
+    """)
+    op.create_index('ix_top_creatives_trending_score', 'top_creatives', ['trending_score'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_top_creatives_trending_score', table_name='top_creatives')
+    op.drop_column('top_creatives', 'trending_score')
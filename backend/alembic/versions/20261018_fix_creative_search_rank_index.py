@@ -0,0 +1,38 @@
+"""Rank approved creatives by coalesce(ai_score, 0) for search pagination
+
+Revision ID: 0017_fix_creative_search_rank
+Revises: 0016_add_prompt_dedup
+Create Date: 2026-10-18 23:50:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0017_fix_creative_search_rank'
+down_revision = '0016_add_prompt_dedup'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Поиск сортирует и пагинирует по (coalesce(ai_score, 0), id): NULL в
+    ai_score иначе попадает в начало DESC-сортировки и не проходит сравнение
+    с курсором. Индекс ix_top_creatives_approved_rank пересоздается по тому
+    же выражению.
+    """
+    op.execute("DROP INDEX IF EXISTS ix_top_creatives_approved_rank")
+    op.execute("""
+        CREATE INDEX ix_top_creatives_approved_rank
+        ON top_creatives ((coalesce(ai_score, 0)) DESC, id DESC)
+        WHERE is_approved
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_top_creatives_approved_rank")
+    op.execute("""
+        CREATE INDEX ix_top_creatives_approved_rank
+        ON top_creatives (ai_score DESC, id DESC)
+        WHERE is_approved
+    """)
@@ -0,0 +1,142 @@
+"""
+Fusion chain cost derivation.
+
+A chain's cost is the sum of its steps' engine costs (one unit per step)
+plus the chain's cost_adjustment_usd for work not done by an AiEngine.
+fusion_chain_engines indexes which engines each chain calls and how often,
+so an engine cost change recomputes only the chains that use that engine:
+one indexed lookup for the affected chains and one grouped sum, instead of
+parsing every chain_config.
+
+Steps referencing an engine that does not exist (yet) cost nothing until an
+engine with that name is created and linked by link_engine(); a renamed
+engine is relinked the same way. Inactive engines cost nothing either, so
+deactivating an engine recomputes its chains like a cost change does.
+"""
+import json
+from collections import Counter
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import AiEngine, FusionChain, FusionChainEngine
+from fusion_executor import ChainStep, parse_chain_config
+from logging_config import logger
+
+
+def _engine_step_counts(db: Session, steps: List[ChainStep]) -> Counter:
+    """Steps per engine id; steps are resolved by engine_id, else by engine_name"""
+    ids = {step.engine_id for step in steps if step.engine_id}
+    names = {step.engine_name for step in steps if step.engine_name and not step.engine_id}
+    engines = db.query(AiEngine.id, AiEngine.name).filter(
+        (AiEngine.id.in_(ids)) | (AiEngine.name.in_(names))
+    ).all()
+    known_ids = {engine_id for engine_id, _ in engines}
+    by_name = {name: engine_id for engine_id, name in engines}
+
+    counts = Counter()
+    for step in steps:
+        engine_id = step.engine_id if step.engine_id in known_ids else by_name.get(step.engine_name)
+        if engine_id:
+            counts[engine_id] += 1
+    return counts
+
+
+def engine_cost_usd(db: Session, chain_ids: List[int]) -> Dict[int, float]:
+    """Sum of step engine costs per chain (active engines only), from the index"""
+    rows = db.query(
+        FusionChainEngine.chain_id,
+        func.sum(FusionChainEngine.steps * AiEngine.internal_cost_usd_per_unit)
+    ).join(AiEngine, AiEngine.id == FusionChainEngine.engine_id).filter(
+        FusionChainEngine.chain_id.in_(chain_ids),
+        AiEngine.is_active == True
+    ).group_by(FusionChainEngine.chain_id).all()
+    costs = {chain_id: 0.0 for chain_id in chain_ids}
+    costs.update({chain_id: float(cost or 0.0) for chain_id, cost in rows})
+    return costs
+
+
+def _derived_total(engine_cost: float, adjustment: float) -> float:
+    return round(max(engine_cost + (adjustment or 0.0), 0.0), 6)
+
+
+def index_chain(db: Session, chain: FusionChain, total_cost_usd: Optional[float] = None) -> float:
+    """
+    (Re)build a chain's index rows from its chain_config and set its derived
+    total_cost_usd. With `total_cost_usd` the given total is kept and the part
+    not covered by engines becomes cost_adjustment_usd. The chain must be
+    flushed. Raises ValueError for an invalid chain_config. Does not commit;
+    returns the new total.
+    """
+    counts = _engine_step_counts(db, parse_chain_config(chain.chain_config))
+    db.query(FusionChainEngine).filter(FusionChainEngine.chain_id == chain.id).delete(synchronize_session=False)
+    db.add_all([
+        FusionChainEngine(chain_id=chain.id, engine_id=engine_id, steps=steps)
+        for engine_id, steps in counts.items()
+    ])
+    db.flush()
+
+    engine_cost = engine_cost_usd(db, [chain.id])[chain.id]
+    if total_cost_usd is not None:
+        chain.cost_adjustment_usd = round(total_cost_usd - engine_cost, 6)
+    chain.total_cost_usd = _derived_total(engine_cost, chain.cost_adjustment_usd)
+    return chain.total_cost_usd
+
+
+def recompute_chains_for_engine(db: Session, engine_id: int) -> List[FusionChain]:
+    """
+    Recompute total_cost_usd of the chains calling an engine.
+    Returns the chains whose cost changed. Does not commit.
+    """
+    chain_ids = [
+        chain_id for (chain_id,) in db.query(FusionChainEngine.chain_id).filter(
+            FusionChainEngine.engine_id == engine_id
+        )
+    ]
+    if not chain_ids:
+        return []
+
+    costs = engine_cost_usd(db, chain_ids)
+    changed = []
+    for chain in db.query(FusionChain).filter(FusionChain.id.in_(chain_ids)):
+        total = _derived_total(costs[chain.id], chain.cost_adjustment_usd)
+        if total != chain.total_cost_usd:
+            logger.info(f"Fusion Chain '{chain.name}' cost: {chain.total_cost_usd} -> {total} USD")
+            chain.total_cost_usd = total
+            changed.append(chain)
+    return changed
+
+
+def _references_name(chain: FusionChain, name: str) -> bool:
+    """Whether a chain has a step naming the engine (exact match on the parsed steps)"""
+    try:
+        steps = parse_chain_config(chain.chain_config)
+    except ValueError:
+        return False
+    return any(step.engine_name == name for step in steps)
+
+
+def link_engine(db: Session, engine: AiEngine) -> List[FusionChain]:
+    """
+    Index a new or renamed engine in the chains that reference it by name
+    (steps added before the engine existed) and re-index the chains linked
+    to it under its old name, recomputing their costs. Does not commit.
+    The substring filter only narrows the candidates: a chain is re-indexed
+    if one of its steps names the engine exactly, so "gpt" does not touch
+    chains calling "gpt-4".
+    """
+    linked = {
+        chain_id for (chain_id,) in db.query(FusionChainEngine.chain_id).filter(
+            FusionChainEngine.engine_id == engine.id
+        )
+    }
+    # chain_config may store the name JSON-escaped (non-ASCII as \uXXXX)
+    escaped = json.dumps(engine.name)[1:-1]
+    candidates = db.query(FusionChain).filter(
+        FusionChain.chain_config.contains(engine.name)
+        | FusionChain.chain_config.contains(escaped)
+        | FusionChain.id.in_(linked)
+    ).all()
+    chains = [chain for chain in candidates if chain.id in linked or _references_name(chain, engine.name)]
+    for chain in chains:
+        index_chain(db, chain)
+    return chains
@@ -10,6 +10,46 @@ class Settings(BaseSettings):
     YUKASSA_SHOP_ID: Optional[str] = None
     YUKASSA_SECRET_KEY: Optional[str] = None
     
+    # Background generation execution
+    GENERATION_WORKERS: int = 100  # Max concurrent engine calls per process (asyncio)
+    GENERATION_MAX_PENDING: int = 2000
+    GENERATION_QUEUE_BACKEND: str = "executor"  # executor (in-process) or postgres
+    SCHEDULER_AGING_SECONDS: int = 30  # Max queue wait before any tier is served first
+    JOB_LEASE_SECONDS: int = 60
+    JOB_HEARTBEAT_SECONDS: int = 15
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_MAX_ATTEMPTS: int = 3
+    GENERATION_BATCH_MAX_ITEMS: int = 100
+    GENERATION_BATCH_CONCURRENCY: int = 10  # Per-batch cap on parallel engine calls
+    ENGINE_ROUTING_POLICY: str = "weighted"  # cheapest, fastest or weighted (several engines per type)
+    
+    # Result cache for identical generation requests
+    GENERATION_CACHE_ENABLED: bool = False
+    GENERATION_CACHE_TTL_SECONDS: int = 3600
+    GENERATION_CACHE_MAX_ENTRIES: int = 10000
+    
+    # Credit reservations for generations in progress
+    CREDIT_HOLD_TTL_SECONDS: int = 3600  # Open holds are released automatically after this
+    
+    # In-process price table, also invalidated on every pricing change (see price_table.py)
+    PRICE_TABLE_TTL_SECONDS: int = 300
+    
+    # Library views are buffered in process and flushed in batches (see view_counter.py)
+    LIBRARY_VIEW_FLUSH_SECONDS: float = 10.0
+    
+    # Top-creatives lists served from in-process snapshots (see library_snapshots.py)
+    LIBRARY_SNAPSHOT_SIZE: int = 200  # Ranked creatives kept per category
+    LIBRARY_SNAPSHOT_TTL_SECONDS: int = 300
+    
+    # Library trending ranking: activity loses half its weight every N hours (see trending.py)
+    TRENDING_HALF_LIFE_HOURS: float = 48.0
+    
+    # Stored responses for requests retried with the same Idempotency-Key
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24
+    
+    # Periodic upkeep run by every API process (see maintenance.py)
+    MAINTENANCE_INTERVAL_SECONDS: float = 60.0
+    
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,350 @@
+"""
+Full-text and faceted search over the approved library creatives.
+
+On Postgres, matching uses top_creatives.search_vector (a generated tsvector
+of title, description and prompt; GIN index, migration 0014) and
+websearch_to_tsquery, so users can write "летняя распродажа", quoted phrases
+or -exclusions. The 'russian' configuration stems Russian words and sends
+Latin words through the English stemmer, so one vector serves both
+languages.
+
+Results are ordered like the library (ai_score, then id, descending) and
+paginated by keyset: the cursor is the (ai_score, id) of the last hit, so a
+deep page costs the same as the first one and no OFFSET scan is needed. A
+missing ai_score ranks as 0 in the ORDER BY, the cursor and the index
+(migration 0017) alike, so such rows are neither skipped nor repeated.
+Snippets (ts_headline) are computed only for the rows of the page. Facet
+counts (categories and score ranges) are returned with the first page only;
+each facet ignores its own filter, so the client can show alternatives.
+
+Snippets are HTML: the creative's text is escaped and only the <mark> tags
+are markup, so clients can render them as-is. Prompts are searched but never
+highlighted: they are shown only after an unlock.
+
+Other databases (SQLite in tests) use an in-process inverted index over the
+approved creatives instead: query words match indexed words they prefix (a
+rough stand-in for stemming), all words must match. The index is rebuilt
+when the library snapshots are invalidated or after
+LIBRARY_SNAPSHOT_TTL_SECONDS.
+"""
+import base64
+import bisect
+import html
+import json
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import func, literal_column, tuple_
+from sqlalchemy.orm import Session
+from models import TopCreative
+from library_snapshots import library_version
+from config import settings
+
+MAX_SEARCH_LIMIT = 100
+SCORE_BUCKET = 10
+SNIPPET_WORDS = 30
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+HEADLINE_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}"
+
+
+class SearchError(ValueError):
+    """Raised for an unusable search request"""
+
+
+def encode_cursor(ai_score: Optional[int], creative_id: int) -> str:
+    payload = json.dumps([ai_score or 0, creative_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ai_score, creative_id = json.loads(base64.urlsafe_b64decode(padded))
+        return int(ai_score), int(creative_id)
+    except (ValueError, TypeError):
+        raise SearchError("Invalid cursor")
+
+
+def _score_bucket(ai_score: Optional[int]) -> str:
+    low = (ai_score or 0) // SCORE_BUCKET * SCORE_BUCKET
+    return f"{low}-{low + SCORE_BUCKET - 1}"
+
+
+def _page_result(
+    hits: List[TopCreative],
+    highlights: Dict[int, Dict[str, Optional[str]]],
+    limit: int,
+    facets: Optional[Dict]
+) -> Dict:
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_cursor(hits[-1].ai_score, hits[-1].id)
+    return {
+        "items": [(creative, highlights.get(creative.id, {})) for creative in hits],
+        "next_cursor": next_cursor,
+        "facets": facets
+    }
+
+
+# Postgres
+
+def _escape_html(column):
+    """SQL counterpart of html.escape(): the text ts_headline marks up must not carry markup of its own"""
+    for char, entity in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"), ('"', "&quot;"), ("'", "&#x27;")):
+        column = func.replace(column, char, entity)
+    return column
+
+
+def _rank_score():
+    """Ranking score of a creative; NULL ranks as 0, matching encode_cursor()"""
+    return func.coalesce(TopCreative.ai_score, literal_column("0"))
+
+
+def _ts_query(q: str):
+    return func.websearch_to_tsquery("russian", q)
+
+
+def _pg_filters(
+    q: Optional[str],
+    category: Optional[str],
+    min_score: Optional[int],
+    max_score: Optional[int],
+    skip: str = ""
+) -> List:
+    """Filter clauses; `skip` names the facet ("category" or "score") whose own filter is left out"""
+    filters = [TopCreative.is_approved == True]
+    if q:
+        filters.append(literal_column("top_creatives.search_vector").op("@@")(_ts_query(q)))
+    if category and skip != "category":
+        filters.append(TopCreative.category == category)
+    if skip != "score":
+        if min_score is not None:
+            filters.append(_rank_score() >= min_score)
+        if max_score is not None:
+            filters.append(_rank_score() <= max_score)
+    return filters
+
+
+def _pg_facets(db: Session, q, category, min_score, max_score) -> Dict:
+    categories = db.query(TopCreative.category, func.count(TopCreative.id)).filter(
+        *_pg_filters(q, category, min_score, max_score, skip="category")
+    ).group_by(TopCreative.category).all()
+
+    bucket = _rank_score() // SCORE_BUCKET
+    buckets = db.query(bucket, func.count(TopCreative.id)).filter(
+        *_pg_filters(q, category, min_score, max_score, skip="score")
+    ).group_by(bucket).all()
+
+    return {
+        "categories": {name: count for name, count in categories if name},
+        "score_ranges": {
+            _score_bucket(low * SCORE_BUCKET): count for low, count in sorted(buckets, reverse=True)
+        }
+    }
+
+
+def _pg_search(db, q, category, min_score, max_score, limit, after) -> Dict:
+    query = db.query(TopCreative).filter(*_pg_filters(q, category, min_score, max_score))
+    if after is not None:
+        query = query.filter(tuple_(_rank_score(), TopCreative.id) < tuple_(*after))
+    hits = query.order_by(_rank_score().desc(), TopCreative.id.desc()).limit(limit + 1).all()
+
+    highlights = {}
+    page_ids = [creative.id for creative in hits[:limit]]
+    if q and page_ids:
+        ts_query = _ts_query(q)
+        rows = db.query(
+            TopCreative.id,
+            func.ts_headline("russian", _escape_html(TopCreative.title), ts_query, f"{HEADLINE_OPTIONS}, HighlightAll=true"),
+            func.ts_headline(
+                "russian",
+                _escape_html(func.coalesce(TopCreative.description, "")),
+                ts_query,
+                f"{HEADLINE_OPTIONS}, MaxWords={SNIPPET_WORDS}, MinWords=10"
+            )
+        ).filter(TopCreative.id.in_(page_ids)).all()
+        highlights = {
+            creative_id: {"title": title, "description": description or None}
+            for creative_id, title, description in rows
+        }
+
+    facets = _pg_facets(db, q, category, min_score, max_score) if after is None else None
+    return _page_result(hits, highlights, limit, facets)
+
+
+# In-process fallback
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    return _TOKEN_RE.findall((value or "").lower().replace("ё", "е"))
+
+
+class InvertedIndex:
+    """Word -> creative ids index of the approved creatives"""
+
+    def __init__(self, creatives: List[TopCreative], version: int):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.postings: Dict[str, Set[int]] = {}
+        # id -> (ai_score, category)
+        self.documents: Dict[int, Tuple[int, Optional[str]]] = {}
+        for creative in creatives:
+            self.documents[creative.id] = (creative.ai_score or 0, creative.category)
+            for word in set(tokenize(creative.title) + tokenize(creative.description) + tokenize(creative.prompt)):
+                self.postings.setdefault(word, set()).add(creative.id)
+        self.vocabulary = sorted(self.postings)
+
+    def lookup(self, term: str) -> Set[int]:
+        """Ids of the creatives containing a word starting with `term`"""
+        ids = set()
+        position = bisect.bisect_left(self.vocabulary, term)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(term):
+            ids |= self.postings[self.vocabulary[position]]
+            position += 1
+        return ids
+
+    def match(self, q: Optional[str]) -> Set[int]:
+        """Ids containing every word of the query (every creative for an empty query)"""
+        terms = tokenize(q)
+        if not terms:
+            return set(self.documents)
+        ids = self.lookup(terms[0])
+        for term in terms[1:]:
+            if not ids:
+                break
+            ids &= self.lookup(term)
+        return ids
+
+
+_index: Optional[InvertedIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index(db: Session) -> InvertedIndex:
+    global _index
+    index = _index
+    version = library_version()
+    if (
+        index is not None
+        and index.version == version
+        and time.monotonic() - index.built_at < settings.LIBRARY_SNAPSHOT_TTL_SECONDS
+    ):
+        return index
+    with _index_lock:
+        creatives = db.query(TopCreative).filter(TopCreative.is_approved == True).all()
+        _index = InvertedIndex(creatives, version)
+        return _index
+
+
+def highlight(value: Optional[str], terms: List[str], max_words: Optional[int] = None) -> Optional[str]:
+    """
+    HTML-escape a value and mark the words starting with a query term; with
+    max_words, cut a snippet around the first one
+    """
+    if not value:
+        return None
+    parts = re.split(r"(\w+)", value)
+    words = [index for index in range(1, len(parts), 2)]
+    matched = [
+        index for index in words
+        if any(parts[index].lower().replace("ё", "е").startswith(term) for term in terms)
+    ]
+    # Escape every part first: only the highlight tags may be markup
+    parts = [html.escape(part) for part in parts]
+    for index in matched:
+        parts[index] = f"{HIGHLIGHT_START}{parts[index]}{HIGHLIGHT_STOP}"
+
+    if max_words is None or len(words) <= max_words:
+        return "".join(parts)
+    first = words.index(matched[0]) if matched else 0
+    start = max(0, min(first - max_words // 3, len(words) - max_words))
+    begin = words[start]
+    end = words[start + max_words - 1] + 1
+    return "".join(parts[begin:end])
+
+
+def _fallback_search(db, q, category, min_score, max_score, limit, after) -> Dict:
+    index = get_index(db)
+    matched = index.match(q)
+
+    def in_scores(creative_id: int) -> bool:
+        ai_score = index.documents[creative_id][0]
+        return (min_score is None or ai_score >= min_score) and (max_score is None or ai_score <= max_score)
+
+    def in_category(creative_id: int) -> bool:
+        return not category or index.documents[creative_id][1] == category
+
+    ranked = sorted(
+        (
+            (index.documents[creative_id][0], creative_id) for creative_id in matched
+            if in_scores(creative_id) and in_category(creative_id)
+        ),
+        reverse=True
+    )
+    if after is not None:
+        ranked = [key for key in ranked if key < after]
+    page_ids = [creative_id for _, creative_id in ranked[:limit + 1]]
+
+    creatives = {
+        creative.id: creative
+        for creative in db.query(TopCreative).filter(TopCreative.id.in_(page_ids))
+    } if page_ids else {}
+    hits = [creatives[creative_id] for creative_id in page_ids if creative_id in creatives]
+
+    terms = tokenize(q)
+    highlights = {
+        creative.id: {
+            "title": highlight(creative.title, terms),
+            "description": highlight(creative.description, terms, SNIPPET_WORDS)
+        }
+        for creative in hits[:limit]
+    } if terms else {}
+
+    facets = None
+    if after is None:
+        categories = Counter(
+            index.documents[creative_id][1] for creative_id in matched if in_scores(creative_id)
+        )
+        buckets = Counter(
+            index.documents[creative_id][0] // SCORE_BUCKET for creative_id in matched if in_category(creative_id)
+        )
+        facets = {
+            "categories": {name: count for name, count in categories.items() if name},
+            "score_ranges": {
+                _score_bucket(low * SCORE_BUCKET): count for low, count in sorted(buckets.items(), reverse=True)
+            }
+        }
+    return _page_result(hits, highlights, limit, facets)
+
+
+def search_creatives(
+    db: Session,
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    min_score: Optional[int] = None,
+    max_score: Optional[int] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> Dict:
+    """
+    One page of approved creatives matching the query and filters.
+    Returns items as (creative, highlight) pairs, next_cursor (None on the
+    last page) and facets (first page only). Raises SearchError.
+    """
+    if limit < 1 or limit > MAX_SEARCH_LIMIT:
+        raise SearchError(f"limit must be between 1 and {MAX_SEARCH_LIMIT}")
+    if min_score is not None and max_score is not None and min_score > max_score:
+        raise SearchError("min_score must not exceed max_score")
+    q = (q or "").strip() or None
+    after = decode_cursor(cursor) if cursor else None
+
+    if db.get_bind().dialect.name == "postgresql":
+        return _pg_search(db, q, category, min_score, max_score, limit, after)
+    return _fallback_search(db, q, category, min_score, max_score, limit, after)
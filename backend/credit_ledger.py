@@ -0,0 +1,316 @@
+"""
+Credit ledger: atomic balance changes.
+
+Balances are changed with a single conditional UPDATE ... RETURNING instead
+of read-modify-write in Python, so parallel requests from one account can
+neither overdraw it nor overwrite each other's changes. Every change adds its
+Transaction row to the same session; nothing here commits, the caller commits
+the balance change together with the rest of its work.
+
+Long-running work reserves credits with a hold instead of debiting up front:
+place_hold() moves the amount into users.credits_held (available balance is
+credits_balance - credits_held), capture_hold() turns it into a debit when the
+work succeeds and release_hold() frees it on failure. Each step is one short
+UPDATE, so no row lock is held while an engine runs. Holds left open past
+their expiry are released by release_expired_holds().
+
+Accounts with sharded balances (credit_shards.py) take and return credits
+through their shard rows instead of users.credits_balance; the functions
+here dispatch on that, so callers do not need to know.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from models import User, Transaction, TransactionType, CreditHold, Generation
+from config import settings
+from logging_config import logger
+import credit_shards
+
+
+class InsufficientCreditsError(Exception):
+    """Raised when a debit would take the balance below zero"""
+
+    def __init__(self, required: int, available: Optional[int] = None):
+        self.required = required
+        self.available = available
+        message = f"Insufficient credits. Required: {required}"
+        if available is not None:
+            message += f", Available: {available}"
+        super().__init__(message)
+
+
+def available_credits(db: Session, user: User) -> int:
+    """Balance that is not reserved by open holds"""
+    if credit_shards.is_sharded(user):
+        balance, held = credit_shards.balance_summary(db, user)
+        return balance - held
+    return (user.credits_balance or 0) - (user.credits_held or 0)
+
+
+def refresh_balance(db: Session, user: User) -> int:
+    """
+    Load the account's current balance and holds into `user` (sums the
+    shards of a sharded account) without marking it dirty. Returns the balance.
+    """
+    if credit_shards.is_sharded(user):
+        balance, held = credit_shards.balance_summary(db, user)
+    else:
+        balance, held = db.query(User.credits_balance, User.credits_held).filter(User.id == user.id).first()
+    _sync_user(user, balance, held)
+    return balance
+
+
+def _sync_user(user: Optional[User], balance: int, held: Optional[int] = None) -> None:
+    # Update the loaded object without marking it dirty: a flush must never
+    # write an absolute balance back over concurrent changes
+    if user is not None:
+        set_committed_value(user, "credits_balance", balance)
+        if held is not None:
+            set_committed_value(user, "credits_held", held)
+
+
+def debit(
+    db: Session,
+    user: User,
+    amount: int,
+    description: str,
+    transaction_type: TransactionType = TransactionType.CREDIT_USAGE,
+    price_snapshot_id: Optional[int] = None
+) -> int:
+    """
+    Take `amount` credits if the available balance covers it and record the
+    usage (with the price version it was based on, if any). Returns the new
+    balance; raises InsufficientCreditsError otherwise.
+    """
+    if credit_shards.is_sharded(user):
+        if not credit_shards.take(db, user, amount):
+            raise InsufficientCreditsError(amount, available_credits(db, user))
+        balance = None
+    else:
+        balance = db.execute(
+            update(User)
+            .where(User.id == user.id, User.credits_balance - User.credits_held >= amount)
+            .values(credits_balance=User.credits_balance - amount)
+            .returning(User.credits_balance),
+            execution_options={"synchronize_session": False}
+        ).scalar()
+
+        if balance is None:
+            raise InsufficientCreditsError(amount, available_credits(db, user))
+
+    db.add(Transaction(
+        user_id=user.id,
+        type=transaction_type,
+        amount=0,
+        credits_change=-amount,
+        description=description,
+        status="completed",
+        price_snapshot_id=price_snapshot_id
+    ))
+    if balance is None:
+        return refresh_balance(db, user)
+    _sync_user(user, balance)
+    return balance
+
+
+def credit(
+    db: Session,
+    user: User,
+    amount: int,
+    description: str,
+    transaction_type: TransactionType = TransactionType.REFUND,
+    payment_amount: float = 0,
+    payment_id: Optional[str] = None
+) -> int:
+    """Add `amount` credits and record where they came from. Returns the new balance."""
+    if credit_shards.is_sharded(user):
+        credit_shards.give(db, user, amount)
+        balance = None
+    else:
+        balance = db.execute(
+            update(User)
+            .where(User.id == user.id)
+            .values(credits_balance=User.credits_balance + amount)
+            .returning(User.credits_balance),
+            execution_options={"synchronize_session": False}
+        ).scalar()
+
+    db.add(Transaction(
+        user_id=user.id,
+        type=transaction_type,
+        amount=payment_amount,
+        credits_change=amount,
+        description=description,
+        payment_id=payment_id,
+        status="completed"
+    ))
+    if balance is None:
+        return refresh_balance(db, user)
+    _sync_user(user, balance)
+    return balance
+
+
+def _reserve(db: Session, user_id: int, amount: int) -> Optional[tuple]:
+    return db.execute(
+        update(User)
+        .where(User.id == user_id, User.credits_balance - User.credits_held >= amount)
+        .values(credits_held=User.credits_held + amount)
+        .returning(User.credits_balance, User.credits_held),
+        execution_options={"synchronize_session": False}
+    ).first()
+
+
+def place_hold(
+    db: Session,
+    user: User,
+    amount: int,
+    generation: Optional[Generation] = None,
+    ttl_seconds: Optional[int] = None
+) -> CreditHold:
+    """
+    Reserve `amount` credits. Raises InsufficientCreditsError if the
+    available balance does not cover it (after releasing the user's expired
+    holds). Does not commit.
+    """
+    sharded = credit_shards.is_sharded(user)
+
+    def reserve():
+        if sharded:
+            return credit_shards.take(db, user, amount)
+        return _reserve(db, user.id, amount)
+
+    row = reserve()
+    if not row and release_expired_holds(db, user_id=user.id):
+        row = reserve()
+    if not row:
+        raise InsufficientCreditsError(amount, available_credits(db, user))
+
+    hold = CreditHold(
+        user_id=user.id,
+        generation_id=generation.id if generation is not None else None,
+        amount=amount,
+        status="open",
+        sharded=sharded,
+        expires_at=datetime.utcnow() + timedelta(seconds=ttl_seconds or settings.CREDIT_HOLD_TTL_SECONDS)
+    )
+    db.add(hold)
+    if not sharded:
+        _sync_user(user, *row)
+    return hold
+
+
+def _settle(db: Session, hold: CreditHold, status: str, captured: int = 0) -> bool:
+    """
+    Move an open hold to a final state; False if it was settled already.
+    Refreshes hold.sharded from the row, since unsharding the account turns
+    open sharded holds into regular ones.
+    """
+    settled = db.execute(
+        update(CreditHold)
+        .where(CreditHold.id == hold.id, CreditHold.status == "open")
+        .values(status=status, captured_amount=captured, settled_at=datetime.utcnow())
+        .returning(CreditHold.sharded),
+        execution_options={"synchronize_session": False}
+    ).first()
+    if settled is None:
+        return False
+    set_committed_value(hold, "status", status)
+    set_committed_value(hold, "sharded", bool(settled[0]))
+    return True
+
+
+def capture_hold(
+    db: Session,
+    user: User,
+    hold: CreditHold,
+    description: str,
+    amount: Optional[int] = None,
+    price_snapshot_id: Optional[int] = None
+) -> int:
+    """
+    Debit `amount` (default: the whole hold) against the hold and free the
+    rest of it. If the hold was already released (it expired), falls back
+    to a regular debit. Returns the new balance. Does not commit.
+    """
+    amount = hold.amount if amount is None else min(amount, hold.amount)
+    if not _settle(db, hold, "captured", amount):
+        return debit(db, user, amount, description, price_snapshot_id=price_snapshot_id)
+
+    if hold.sharded:
+        # The held amount already left the shards: return only the unused part
+        if hold.amount > amount:
+            credit_shards.give(db, user, hold.amount - amount)
+    else:
+        balance, held = db.execute(
+            update(User)
+            .where(User.id == hold.user_id)
+            .values(credits_balance=User.credits_balance - amount, credits_held=User.credits_held - hold.amount)
+            .returning(User.credits_balance, User.credits_held),
+            execution_options={"synchronize_session": False}
+        ).first()
+
+    if amount:
+        db.add(Transaction(
+            user_id=hold.user_id,
+            type=TransactionType.CREDIT_USAGE,
+            amount=0,
+            credits_change=-amount,
+            description=description,
+            status="completed",
+            price_snapshot_id=price_snapshot_id
+        ))
+    if hold.sharded:
+        return refresh_balance(db, user)
+    _sync_user(user, balance, held)
+    return balance
+
+
+def release_hold(db: Session, hold: CreditHold, user: Optional[User] = None) -> bool:
+    """Free an open hold without charging. Does not commit."""
+    if not _settle(db, hold, "released"):
+        return False
+    if hold.sharded:
+        credit_shards.give(db, user or db.query(User).filter(User.id == hold.user_id).first(), hold.amount)
+        return True
+    balance, held = db.execute(
+        update(User)
+        .where(User.id == hold.user_id)
+        .values(credits_held=User.credits_held - hold.amount)
+        .returning(User.credits_balance, User.credits_held),
+        execution_options={"synchronize_session": False}
+    ).first()
+    _sync_user(user, balance, held)
+    return True
+
+
+def find_open_hold(db: Session, generation_id: int) -> Optional[CreditHold]:
+    return db.query(CreditHold).filter(
+        CreditHold.generation_id == generation_id,
+        CreditHold.status == "open"
+    ).first()
+
+
+def release_generation_hold(db: Session, generation_id: int) -> bool:
+    """Release the open hold of a failed generation, if any. Does not commit."""
+    hold = find_open_hold(db, generation_id)
+    return release_hold(db, hold) if hold else False
+
+
+def release_expired_holds(db: Session, user_id: Optional[int] = None, limit: int = 500) -> int:
+    """
+    Release open holds past their expiry (work that never finished).
+    Does not commit. Returns the number of holds released.
+    """
+    query = db.query(CreditHold).filter(
+        CreditHold.status == "open",
+        CreditHold.expires_at < datetime.utcnow()
+    )
+    if user_id is not None:
+        query = query.filter(CreditHold.user_id == user_id)
+
+    released = sum(1 for hold in query.limit(limit).all() if release_hold(db, hold))
+    if released:
+        logger.warning(f"Released {released} expired credit holds")
+    return released
@@ -0,0 +1,191 @@
+"""
+Sharded credit balances for accounts that spend from many requests at once.
+
+A sharded account keeps its spendable credits in N credit_shards rows instead
+of users.credits_balance, so parallel debits update different rows instead of
+queueing on one. A debit first tries a few random shards with a conditional
+UPDATE (balance >= amount); only when no single shard covers the amount are
+all shards locked, summed and re-spread evenly (consolidation). Shards never
+go below zero, so neither does the account.
+
+users.credits_balance of a sharded account only holds credits still tied to
+holds placed before sharding was enabled (and anything credited to the main
+row later, which consolidation moves into the shards).
+"""
+import random
+from typing import List, Tuple
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from models import User, CreditShard, CreditHold
+
+MAX_SHARDS = 64
+
+# Random shards tried with a conditional UPDATE before consolidating
+FAST_PATH_ATTEMPTS = 3
+
+
+def is_sharded(user: User) -> bool:
+    return bool(user.credit_shard_count)
+
+
+def shard_total(db: Session, user_id: int) -> int:
+    return db.query(func.coalesce(func.sum(CreditShard.balance), 0)).filter(
+        CreditShard.user_id == user_id
+    ).scalar()
+
+
+def sharded_held(db: Session, user_id: int) -> int:
+    """Credits taken out of the shards by open holds"""
+    return db.query(func.coalesce(func.sum(CreditHold.amount), 0)).filter(
+        CreditHold.user_id == user_id,
+        CreditHold.status == "open",
+        CreditHold.sharded == True
+    ).scalar()
+
+
+def balance_summary(db: Session, user: User) -> Tuple[int, int]:
+    """(balance, held) of a sharded account, comparable to an unsharded one"""
+    held = sharded_held(db, user.id)
+    main = db.query(User.credits_balance, User.credits_held).filter(User.id == user.id).first()
+    return main[0] + shard_total(db, user.id) + held, main[1] + held
+
+
+def _split(total: int, count: int) -> List[int]:
+    share, rest = divmod(total, count)
+    return [share + (1 if index < rest else 0) for index in range(count)]
+
+
+def take(db: Session, user: User, amount: int) -> bool:
+    """Remove `amount` from the account's shards; False if they do not cover it"""
+    shard_nos = list(range(user.credit_shard_count))
+    random.shuffle(shard_nos)
+    for shard_no in shard_nos[:FAST_PATH_ATTEMPTS]:
+        taken = db.execute(
+            update(CreditShard)
+            .where(
+                CreditShard.user_id == user.id,
+                CreditShard.shard_no == shard_no,
+                CreditShard.balance >= amount
+            )
+            .values(balance=CreditShard.balance - amount),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+        if taken:
+            return True
+    return _take_consolidated(db, user, amount)
+
+
+def _take_consolidated(db: Session, user: User, amount: int) -> bool:
+    """
+    Slow path: lock every shard (always in shard order, then the user row),
+    pull spare main-row credits in and spread what is left evenly.
+    """
+    shards = db.query(CreditShard).filter(
+        CreditShard.user_id == user.id
+    ).order_by(CreditShard.shard_no).with_for_update().all()
+    if not shards:
+        return False
+
+    main_balance, main_held = db.query(User.credits_balance, User.credits_held).filter(
+        User.id == user.id
+    ).with_for_update().first()
+    spare = max(main_balance - main_held, 0)
+
+    total = sum(shard.balance for shard in shards) + spare
+    if total < amount:
+        return False
+
+    if spare:
+        db.execute(
+            update(User).where(User.id == user.id).values(credits_balance=User.credits_balance - spare),
+            execution_options={"synchronize_session": False}
+        )
+    for shard, balance in zip(shards, _split(total - amount, len(shards))):
+        shard.balance = balance
+    return True
+
+
+def give(db: Session, user: User, amount: int) -> None:
+    """
+    Add credits to a random shard. If the account has no such shard any more
+    (it was unsharded or re-sharded meanwhile), they go to users.credits_balance,
+    where consolidation picks them up.
+    """
+    given = 0
+    if user.credit_shard_count:
+        given = db.execute(
+            update(CreditShard)
+            .where(
+                CreditShard.user_id == user.id,
+                CreditShard.shard_no == random.randrange(user.credit_shard_count)
+            )
+            .values(balance=CreditShard.balance + amount),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+    if not given:
+        db.execute(
+            update(User).where(User.id == user.id).values(credits_balance=User.credits_balance + amount),
+            execution_options={"synchronize_session": False}
+        )
+
+
+def disable(db: Session, user: User) -> int:
+    """
+    Fold all shards back into users.credits_balance. Open sharded holds become
+    regular holds: their credits return to the user row as held, so releasing
+    or capturing them later settles against credits_balance/credits_held.
+    Returns the shard credits moved.
+    """
+    # Lock order: holds, shards, user row (as settling a hold and consolidation do)
+    holds = db.query(CreditHold).filter(
+        CreditHold.user_id == user.id,
+        CreditHold.status == "open",
+        CreditHold.sharded == True
+    ).order_by(CreditHold.id).with_for_update().all()
+    shards = db.query(CreditShard).filter(
+        CreditShard.user_id == user.id
+    ).order_by(CreditShard.shard_no).with_for_update().all()
+    db.query(User).filter(User.id == user.id).with_for_update().first()
+
+    moved = sum(shard.balance for shard in shards)
+    held = sum(hold.amount for hold in holds)
+    for shard in shards:
+        db.delete(shard)
+    for hold in holds:
+        hold.sharded = False
+    db.execute(
+        update(User).where(User.id == user.id).values(
+            credits_balance=User.credits_balance + moved + held,
+            credits_held=User.credits_held + held,
+            credit_shard_count=0
+        ),
+        execution_options={"synchronize_session": False}
+    )
+    db.flush()
+    db.refresh(user)
+    return moved
+
+
+def enable(db: Session, user: User, shard_count: int) -> None:
+    """
+    Spread the account's available credits over `shard_count` shards
+    (re-sharding an already sharded account). Does not commit.
+    """
+    if not 1 <= shard_count <= MAX_SHARDS:
+        raise ValueError(f"Shard count must be between 1 and {MAX_SHARDS}")
+
+    disable(db, user)
+    available = max(user.credits_balance - user.credits_held, 0)
+    db.add_all([
+        CreditShard(user_id=user.id, shard_no=shard_no, balance=balance)
+        for shard_no, balance in enumerate(_split(available, shard_count))
+    ])
+    db.execute(
+        update(User).where(User.id == user.id).values(
+            credits_balance=User.credits_balance - available,
+            credit_shard_count=shard_count
+        ),
+        execution_options={"synchronize_session": False}
+    )
+    db.flush()
+    db.refresh(user)
@@ -0,0 +1,168 @@
+"""
+Async AI engine adapters.
+Each GenerationType maps to an adapter class; an adapter instance is bound to
+the AiEngine row that serves the type. New providers plug in by registering
+an adapter here, without touching the generation router.
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Type
+from sqlalchemy.orm import Session
+from models import AiEngine, GenerationType
+from ai_mock import AIMock
+
+
+class EngineAdapter(ABC):
+    """Base class for AI engine adapters"""
+
+    generation_type: GenerationType = None
+
+    def __init__(self, engine: Optional[AiEngine] = None):
+        # Copy plain values so the adapter outlives the DB session it came from
+        self.engine_id = engine.id if engine else None
+        self.engine_name = engine.name if engine else "mock"
+        self.api_endpoint = engine.api_endpoint if engine else None
+        self.limits = engine_limits(engine) if engine else None
+        self.cost_usd = engine.internal_cost_usd_per_unit if engine else 0.0
+
+    @abstractmethod
+    async def generate(self, prompt: str, parameters: Dict, generation_id: int) -> Dict:
+        """Run the engine and return a result dict with at least a "url" key"""
+
+
+def engine_limits(engine: AiEngine) -> Dict:
+    """Bulkhead and circuit breaker settings of an engine row"""
+    return {
+        "max_concurrency": engine.max_concurrency or 10,
+        "max_queue": engine.max_queue if engine.max_queue is not None else 100,
+        "breaker_error_threshold": engine.breaker_error_threshold or 0.5,
+        "breaker_latency_ms": engine.breaker_latency_ms or 30000,
+        "breaker_cooldown_seconds": engine.breaker_cooldown_seconds or 30,
+    }
+
+
+# GenerationType -> adapter class
+ENGINE_ADAPTERS: Dict[GenerationType, Type[EngineAdapter]] = {}
+
+
+def register_adapter(adapter_cls: Type[EngineAdapter]) -> Type[EngineAdapter]:
+    """Class decorator: register an adapter for its generation_type"""
+    ENGINE_ADAPTERS[adapter_cls.generation_type] = adapter_cls
+    return adapter_cls
+
+
+# ==================== MOCK ENGINES ====================
+
+@register_adapter
+class MockStaticImageAdapter(EngineAdapter):
+    generation_type = GenerationType.STATIC_IMAGE
+
+    async def generate(self, prompt: str, parameters: Dict, generation_id: int) -> Dict:
+        return await AIMock.generate_static_image(prompt, parameters)
+
+
+@register_adapter
+class MockAnimatedImageAdapter(EngineAdapter):
+    generation_type = GenerationType.ANIMATED_IMAGE
+
+    async def generate(self, prompt: str, parameters: Dict, generation_id: int) -> Dict:
+        return await AIMock.generate_animated_image(prompt, parameters)
+
+
+@register_adapter
+class MockVideoMorphAdapter(EngineAdapter):
+    generation_type = GenerationType.VIDEO_MORPH
+
+    async def generate(self, prompt: str, parameters: Dict, generation_id: int) -> Dict:
+        return await AIMock.generate_video_morph(
+            parameters.get("start_image", ""),
+            parameters.get("end_image", ""),
+            parameters
+        )
+
+
+@register_adapter
+class MockContextualPhotoAdapter(EngineAdapter):
+    generation_type = GenerationType.CONTEXTUAL_PHOTO
+
+    async def generate(self, prompt: str, parameters: Dict, generation_id: int) -> Dict:
+        return await AIMock.generate_contextual_photo(
+            parameters.get("url", ""),
+            prompt,
+            parameters
+        )
+
+
+@register_adapter
+class MockScoringAdapter(EngineAdapter):
+    generation_type = GenerationType.AI_SCORING
+
+    async def generate(self, prompt: str, parameters: Dict, generation_id: int) -> Dict:
+        return await AIMock.analyze_conversion_score(
+            parameters.get("image_url", ""),
+            parameters
+        )
+
+
+@register_adapter
+class MockVectorCreativeAdapter(EngineAdapter):
+    generation_type = GenerationType.VECTOR_CREATIVE
+
+    async def generate(self, prompt: str, parameters: Dict, generation_id: int) -> Dict:
+        return await AIMock.generate_vector_creative(generation_id, parameters)
+
+
+@register_adapter
+class MockBrandedSetAdapter(EngineAdapter):
+    generation_type = GenerationType.BRANDED_SET
+
+    async def generate(self, prompt: str, parameters: Dict, generation_id: int) -> Dict:
+        return await AIMock.generate_branded_set(generation_id, parameters)
+
+
+class MockPostProcessingAdapter(EngineAdapter):
+    """Fusion chain step for engines that are not tied to a generation type"""
+
+    def __init__(self, engine: Optional[AiEngine] = None, name: Optional[str] = None):
+        super().__init__(engine)
+        if not engine and name:
+            self.engine_name = name
+
+    async def generate(self, prompt: str, parameters: Dict, generation_id: int) -> Dict:
+        return await AIMock.post_process(self.engine_name, parameters.get("inputs", []), parameters)
+
+
+def get_adapter_for_engine(engine: Optional[AiEngine], name: Optional[str] = None) -> EngineAdapter:
+    """Build the adapter for a specific AiEngine row (used by fusion chain steps)"""
+    adapter_cls = ENGINE_ADAPTERS.get(engine.generation_type) if engine and engine.generation_type else None
+    if adapter_cls and adapter_cls.generation_type != GenerationType.BRANDED_SET:
+        return adapter_cls(engine)
+    return MockPostProcessingAdapter(engine, name)
+
+
+def get_engine_adapter(db: Session, generation_type: GenerationType) -> EngineAdapter:
+    """
+    Build the adapter for a generation type, bound to its active AiEngine.
+    Types served by an active FusionChain get a chain adapter instead, and
+    types with several active engines get a router that picks one per call
+    (see engine_router). Falls back to an unbound adapter when no engine row
+    is configured.
+    """
+    from fusion_executor import get_active_chain, build_chain_adapter
+    from engine_router import RoutedEngineAdapter
+
+    chain = get_active_chain(db, generation_type)
+    if chain:
+        return build_chain_adapter(db, chain)
+
+    adapter_cls = ENGINE_ADAPTERS.get(generation_type)
+    if not adapter_cls:
+        raise ValueError(f"Invalid generation type: {generation_type}")
+
+    engines = db.query(AiEngine).filter(
+        AiEngine.generation_type == generation_type,
+        AiEngine.is_active == True
+    ).order_by(AiEngine.id).all()
+
+    if len(engines) > 1:
+        return RoutedEngineAdapter([adapter_cls(engine) for engine in engines])
+    return adapter_cls(engines[0] if engines else None)
@@ -0,0 +1,295 @@
+"""
+Per-engine isolation for AI engine calls.
+
+Every AiEngine gets a bulkhead (a cap on concurrent calls plus a bounded
+wait queue) and a circuit breaker. A slow or failing provider can then only
+hold its own slots: excess calls to it are rejected instead of tying up the
+workers that serve other engines, and once its error rate or latency crosses
+the configured threshold calls fail fast until a cooldown probe succeeds.
+
+Limits are read from the AiEngine row on every call, so changes made through
+the admin pricing API apply without a restart. State is per process.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+from logging_config import logger
+
+# Calls kept in the breaker's rolling window, and the minimum before it may trip
+BREAKER_WINDOW = 20
+BREAKER_MIN_CALLS = 5
+
+# Smoothing factor of the live latency / error-rate averages used for routing
+EWMA_ALPHA = 0.2
+
+
+class EngineUnavailableError(Exception):
+    """Raised when an engine's breaker is open or its bulkhead queue is full"""
+
+
+class CircuitBreaker:
+    """
+    closed -> open when the share of failed or slow calls in the rolling
+    window reaches error_threshold; open -> half_open after cooldown, when a
+    single probe call is let through; the probe closes or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, error_threshold: float = 0.5, latency_ms: int = 30000, cooldown_seconds: int = 30):
+        self.error_threshold = error_threshold
+        self.latency_ms = latency_ms
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._calls = deque(maxlen=BREAKER_WINDOW)  # (ok, latency_ms)
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _current_state(self) -> str:
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown_seconds:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self.state
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected"""
+        with self._lock:
+            state = self._current_state()
+            return state == self.OPEN or (state == self.HALF_OPEN and self._probe_in_flight)
+
+    def allow(self) -> bool:
+        """Whether a call may start; in half-open state only one probe is allowed"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def cancel_probe(self) -> None:
+        """Give back a half-open probe slot for a call that never ran"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, ok: bool, latency_ms: float) -> None:
+        slow = latency_ms > self.latency_ms
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if ok and not slow:
+                    self.state = self.CLOSED
+                    self._calls.clear()
+                else:
+                    self._trip()
+                return
+
+            self._calls.append((ok and not slow, latency_ms))
+            if self.state == self.CLOSED and len(self._calls) >= BREAKER_MIN_CALLS:
+                if self._failure_rate() >= self.error_threshold:
+                    self._trip()
+
+    def _trip(self) -> None:
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+    def _failure_rate(self) -> float:
+        if not self._calls:
+            return 0.0
+        return sum(1 for ok, _ in self._calls if not ok) / len(self._calls)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            state = self._current_state()
+            latencies = [latency for _, latency in self._calls]
+            return {
+                "state": state,
+                "failure_rate": round(self._failure_rate(), 3),
+                "avg_latency_ms": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+                "window_calls": len(self._calls),
+                "open_for_seconds": round(time.monotonic() - self.opened_at, 1) if state != self.CLOSED else 0.0
+            }
+
+
+class Bulkhead:
+    """
+    Concurrency limit with a bounded wait queue.
+    Generations run on more than one event loop (API loop, executor loop),
+    so waiters are woken through their own loop's call_soon_threadsafe.
+    """
+
+    def __init__(self, max_concurrency: int = 10, max_queue: int = 100):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters = deque()  # (loop, future)
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        with self._lock:
+            if self.in_flight < self.max_concurrency and not self._waiters:
+                self.in_flight += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                raise EngineUnavailableError("Engine queue is full")
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # The slot was handed over just before cancellation: pass it on
+            self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def _wake(self) -> None:
+        """Hand free slots to waiters in FIFO order (called with the lock held)"""
+        while self._waiters and self.in_flight < self.max_concurrency:
+            loop, future = self._waiters.popleft()
+            self.in_flight += 1
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def resize(self, max_concurrency: int, max_queue: int) -> None:
+        with self._lock:
+            self.max_concurrency = max_concurrency
+            self.max_queue = max_queue
+            self._wake()
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class EngineGuard:
+    """Bulkhead and breaker of one engine"""
+
+    def __init__(self, engine_id: int, engine_name: str):
+        self.engine_id = engine_id
+        self.engine_name = engine_name
+        self.bulkhead = Bulkhead()
+        self.breaker = CircuitBreaker()
+        self.latency_ewma_ms = None  # None until the first call completes
+        self.error_ewma = 0.0
+
+    def configure(self, limits: Dict) -> None:
+        """Apply the limits copied from the AiEngine row"""
+        self.bulkhead.resize(limits["max_concurrency"], limits["max_queue"])
+        self.breaker.error_threshold = limits["breaker_error_threshold"]
+        self.breaker.latency_ms = limits["breaker_latency_ms"]
+        self.breaker.cooldown_seconds = limits["breaker_cooldown_seconds"]
+
+    def record(self, ok: bool, latency_ms: float) -> None:
+        if self.latency_ewma_ms is None:
+            self.latency_ewma_ms = latency_ms
+        else:
+            self.latency_ewma_ms += EWMA_ALPHA * (latency_ms - self.latency_ewma_ms)
+        self.error_ewma += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_ewma)
+        self.breaker.record(ok, latency_ms)
+
+    def is_available(self) -> bool:
+        """False while a call would be rejected by the breaker or a full bulkhead"""
+        bulkhead = self.bulkhead
+        saturated = bulkhead.in_flight >= bulkhead.max_concurrency and bulkhead.queued >= bulkhead.max_queue
+        return not saturated and not self.breaker.is_open()
+
+    def stats(self) -> Dict:
+        return {
+            "engine_id": self.engine_id,
+            "engine_name": self.engine_name,
+            "in_flight": self.bulkhead.in_flight,
+            "queued": self.bulkhead.queued,
+            "max_concurrency": self.bulkhead.max_concurrency,
+            "max_queue": self.bulkhead.max_queue,
+            "latency_ewma_ms": round(self.latency_ewma_ms, 1) if self.latency_ewma_ms is not None else None,
+            "error_ewma": round(self.error_ewma, 3),
+            **self.breaker.stats()
+        }
+
+
+_guards: Dict[int, EngineGuard] = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(engine_id: int, engine_name: str) -> EngineGuard:
+    with _guards_lock:
+        guard = _guards.get(engine_id)
+        if guard is None:
+            guard = _guards[engine_id] = EngineGuard(engine_id, engine_name)
+        guard.engine_name = engine_name
+        return guard
+
+
+def find_guard(engine_id: int) -> Optional[EngineGuard]:
+    """The engine's guard, or None if it has not been called in this process"""
+    with _guards_lock:
+        return _guards.get(engine_id)
+
+
+def is_engine_available(engine_id: int) -> bool:
+    """False while calls to the engine would be rejected in this process"""
+    guard = find_guard(engine_id)
+    return guard is None or guard.is_available()
+
+
+def guard_stats() -> List[Dict]:
+    with _guards_lock:
+        guards = list(_guards.values())
+    return [guard.stats() for guard in guards]
+
+
+async def guarded_generate(adapter, prompt: str, parameters: Dict, generation_id: int) -> Dict:
+    """
+    Call adapter.generate() inside its engine's bulkhead and breaker.
+    Adapters not bound to an engine row are called directly.
+    """
+    if adapter.engine_id is None or adapter.limits is None:
+        return await adapter.generate(prompt, parameters, generation_id)
+
+    guard = get_guard(adapter.engine_id, adapter.engine_name)
+    guard.configure(adapter.limits)
+    if not guard.breaker.allow():
+        raise EngineUnavailableError(f"Engine '{adapter.engine_name}' is temporarily unavailable")
+
+    try:
+        await guard.bulkhead.acquire()
+    except BaseException:
+        # The call never started, so it says nothing about the engine's health
+        guard.breaker.cancel_probe()
+        raise
+
+    started = time.monotonic()
+    ok = False
+    try:
+        result = await adapter.generate(prompt, parameters, generation_id)
+        ok = True
+        return result
+    finally:
+        guard.bulkhead.release()
+        latency_ms = (time.monotonic() - started) * 1000
+        previous_state = guard.breaker.state
+        guard.record(ok, latency_ms)
+        if guard.breaker.state != previous_state:
+            logger.warning(
+                f"Circuit breaker for engine '{adapter.engine_name}': {previous_state} -> {guard.breaker.state}"
+            )
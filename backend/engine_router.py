@@ -0,0 +1,93 @@
+"""
+Routing of generation requests across every active engine of a type.
+
+Engines are ranked per call from live per-process statistics (EWMA latency
+and error rate kept by engine_resilience) and internal_cost_usd_per_unit:
+- cheapest: lowest API cost first, latency breaks ties
+- fastest: lowest latency first; engines without samples go first so new
+  capacity gets measured
+- weighted: random order biased towards fast, cheap and healthy engines,
+  so load spreads over all providers in proportion to their quality
+Engines whose breaker is open or whose bulkhead is full are tried last, and
+a call rejected by one engine's guard moves on to the next.
+"""
+import random
+from typing import Dict, List, Optional
+from engine_adapters import EngineAdapter
+from engine_resilience import EngineUnavailableError, find_guard, guarded_generate, is_engine_available
+from config import settings
+
+ROUTING_POLICIES = ("cheapest", "fastest", "weighted")
+
+# Latency assumed for an engine without samples when weighting (ms)
+DEFAULT_LATENCY_MS = 1000.0
+
+
+def _latency(adapter: EngineAdapter) -> Optional[float]:
+    guard = find_guard(adapter.engine_id)
+    return guard.latency_ewma_ms if guard else None
+
+
+def _error_rate(adapter: EngineAdapter) -> float:
+    guard = find_guard(adapter.engine_id)
+    return guard.error_ewma if guard else 0.0
+
+
+def routing_weight(adapter: EngineAdapter, min_cost: float, min_latency: float) -> float:
+    """Relative share of traffic for an engine under the weighted policy"""
+    latency = _latency(adapter)
+    latency = min_latency if latency is None else max(latency, 1.0)
+    cost = max(adapter.cost_usd, 1e-6)
+    health = (1.0 - _error_rate(adapter)) ** 2
+    return max(health, 0.01) / ((cost / min_cost) * (latency / min_latency))
+
+
+def rank_engines(adapters: List[EngineAdapter], policy: str) -> List[EngineAdapter]:
+    """Order candidate engines by policy; unavailable engines go last"""
+    if policy == "cheapest":
+        ranked = sorted(adapters, key=lambda a: (a.cost_usd, _latency(a) or 0.0, a.engine_id))
+    elif policy == "fastest":
+        ranked = sorted(adapters, key=lambda a: (_latency(a) or 0.0, a.cost_usd, a.engine_id))
+    else:
+        min_cost = max(min(a.cost_usd for a in adapters), 1e-6)
+        latencies = [latency for latency in map(_latency, adapters) if latency is not None]
+        min_latency = max(min(latencies), 1.0) if latencies else DEFAULT_LATENCY_MS
+        pool = list(adapters)
+        weights = [routing_weight(a, min_cost, min_latency) for a in pool]
+        ranked = []
+        # Weighted sampling without replacement gives the fallback order too
+        while pool:
+            index = random.choices(range(len(pool)), weights=weights)[0]
+            ranked.append(pool.pop(index))
+            weights.pop(index)
+
+    available = [a for a in ranked if is_engine_available(a.engine_id)]
+    return available + [a for a in ranked if a not in available]
+
+
+class RoutedEngineAdapter(EngineAdapter):
+    """
+    Adapter over several engines serving one generation type.
+    Picks an engine per call, so long-lived holders (batches) spread load too.
+    """
+
+    def __init__(self, adapters: List[EngineAdapter], policy: Optional[str] = None):
+        super().__init__(None)
+        self.adapters = adapters
+        self.policy = policy or settings.ENGINE_ROUTING_POLICY
+        if self.policy not in ROUTING_POLICIES:
+            raise ValueError(f"Unknown engine routing policy: {self.policy}")
+        self.generation_type = adapters[0].generation_type
+        self.engine_name = "routed:" + ",".join(adapter.engine_name for adapter in adapters)
+
+    async def generate(self, prompt: str, parameters: Dict, generation_id: int) -> Dict:
+        last_error = None
+        for adapter in rank_engines(self.adapters, self.policy):
+            try:
+                result = await guarded_generate(adapter, prompt, parameters, generation_id)
+            except EngineUnavailableError as e:
+                last_error = e
+                continue
+            result.setdefault("engine", adapter.engine_name)
+            return result
+        raise last_error
@@ -0,0 +1,110 @@
+"""
+Content-addressed cache of generation results.
+Identical requests (same type, normalized prompt, canonical parameters and
+engine) reuse the stored result instead of paying the provider again.
+"""
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from models import GenerationType
+from config import settings
+
+
+def normalize_prompt(prompt: Optional[str]) -> str:
+    """Unicode-normalize the prompt and collapse whitespace"""
+    if not prompt:
+        return ""
+    prompt = unicodedata.normalize("NFC", prompt)
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def make_cache_key(
+    generation_type: GenerationType,
+    prompt: Optional[str],
+    parameters: Optional[Dict],
+    engine_id: Optional[int]
+) -> str:
+    """Canonical SHA-256 key of a generation request"""
+    payload = json.dumps(
+        {
+            "type": generation_type.value,
+            "prompt": normalize_prompt(prompt),
+            "parameters": parameters or {},
+            "engine_id": engine_id,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationResultCache:
+    """
+    In-process LRU cache with TTL.
+    Holds at most `max_entries` results; the least recently used entry is
+    evicted first and expired entries are dropped on access.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._stats = {}  # generation type -> {"hits": int, "misses": int}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, generation_type: GenerationType) -> Optional[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            stats = self._stats.setdefault(generation_type.value, {"hits": 0, "misses": 0})
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                stats["hits"] += 1
+                return copy.deepcopy(entry[1])
+            if entry:
+                del self._entries[key]
+            stats["misses"] += 1
+            return None
+
+    def set(self, key: str, result: Dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+
+    def stats(self) -> List[Dict]:
+        """Per-type hit/miss counters and hit rate"""
+        with self._lock:
+            summary = []
+            for gen_type, counters in sorted(self._stats.items()):
+                lookups = counters["hits"] + counters["misses"]
+                summary.append({
+                    "generation_type": gen_type,
+                    "hits": counters["hits"],
+                    "misses": counters["misses"],
+                    "hit_rate": counters["hits"] / lookups if lookups else 0.0
+                })
+            return summary
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+generation_cache = GenerationResultCache(
+    max_entries=settings.GENERATION_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.GENERATION_CACHE_TTL_SECONDS
+)
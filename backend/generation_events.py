@@ -0,0 +1,255 @@
+"""
+Push channel for generation status and progress events.
+
+Events are delivered to per-user subscriber queues (consumed by the SSE
+endpoint). On Postgres every event goes through NOTIFY, so transitions made
+by any API pod or generation worker reach subscribers on every pod; events
+published with a session are sent when that transaction commits. Events
+published without one (progress ticks, reported from engine code running on
+an event loop) are handed to a background thread that sends the NOTIFYs, so
+reporting progress never waits on the database; under a burst they may be
+dropped or arrive after the final status event. Without Postgres (local
+SQLite setups) events are dispatched in-process.
+"""
+import asyncio
+import json
+import queue
+import select
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Callable
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import engine
+from models import Generation
+from logging_config import logger
+
+NOTIFY_CHANNEL = "generation_events"
+
+# Progress callback of the generation currently running in this context
+progress_reporter: ContextVar[Optional[Callable[[int, str], None]]] = ContextVar("progress_reporter", default=None)
+
+
+class GenerationEventBroker:
+    """In-process fan-out of events to subscriber queues, keyed by user id"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers = {}  # user_id -> set of (loop, queue)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        """Register a queue for the calling event loop"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(user_id, set())
+            for entry in [entry for entry in subscribers if entry[1] is queue]:
+                subscribers.discard(entry)
+            if not subscribers:
+                self._subscribers.pop(user_id, None)
+
+    def dispatch(self, event: Dict) -> None:
+        """Deliver an event to the user's subscribers; thread-safe"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(event.get("user_id"), ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._put, queue, event)
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, event: Dict) -> None:
+        # Slow consumers lose events rather than growing memory without bound
+        if not queue.full():
+            queue.put_nowait(event)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+broker = GenerationEventBroker()
+
+
+def _uses_notify() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def generation_event(generation: Generation, progress: Optional[int] = None, detail: Optional[str] = None) -> Dict:
+    """Build a status event for a generation row"""
+    if progress is None and generation.status == "completed":
+        progress = 100
+    return {
+        "event": "status",
+        "generation_id": generation.id,
+        "user_id": generation.user_id,
+        "type": generation.type.value if generation.type else None,
+        "status": generation.status,
+        "progress": progress,
+        "result_url": generation.result_url,
+        "detail": detail
+    }
+
+
+_NOTIFY_STATEMENT = text("SELECT pg_notify(:channel, :payload)")
+
+
+class NotifyPublisher:
+    """
+    Background thread sending session-less NOTIFYs, so callers on an event
+    loop never block on a database round-trip. The queue is bounded: when
+    the database falls behind, events are dropped instead of piling up.
+    """
+
+    def __init__(self, queue_size: int = 1000, batch_size: int = 100):
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self, payload: str) -> None:
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            logger.warning("Generation event queue is full, event dropped")
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="generation-events-publisher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            payloads = [self._queue.get()]
+            while len(payloads) < self.batch_size and not self._queue.empty():
+                payloads.append(self._queue.get_nowait())
+            try:
+                # One transaction per batch; notifications keep their order
+                with engine.begin() as connection:
+                    for payload in payloads:
+                        connection.execute(_NOTIFY_STATEMENT, {"channel": NOTIFY_CHANNEL, "payload": payload})
+            except Exception as e:
+                logger.warning(f"Failed to publish {len(payloads)} generation events: {str(e)}")
+
+
+notify_publisher = NotifyPublisher()
+
+
+def publish_event(event: Dict, db: Optional[Session] = None) -> None:
+    """
+    Publish an event.
+    With `db` on Postgres the NOTIFY joins the session's transaction and is
+    delivered on commit; without it the NOTIFY is queued for the background
+    publisher and this returns immediately.
+    """
+    if not _uses_notify():
+        broker.dispatch(event)
+        return
+
+    payload = json.dumps(event, ensure_ascii=False, default=str)
+    if db is None:
+        notify_publisher.publish(payload)
+        return
+    try:
+        db.execute(_NOTIFY_STATEMENT, {"channel": NOTIFY_CHANNEL, "payload": payload})
+    except Exception as e:
+        logger.warning(f"Failed to publish generation event: {str(e)}")
+
+
+def publish_generation_status(db: Session, generation: Generation, detail: Optional[str] = None) -> None:
+    """Publish a generation's current status within the caller's transaction"""
+    publish_event(generation_event(generation, detail=detail), db)
+
+
+def report_progress(percent: int, detail: Optional[str] = None) -> None:
+    """Report progress of the generation running in the current context (no-op outside one)"""
+    reporter = progress_reporter.get()
+    if reporter:
+        reporter(percent, detail)
+
+
+def make_progress_reporter(generation: Generation) -> Callable[[int, str], None]:
+    """Progress callback for a generation, published as "progress" events"""
+    base = {
+        "event": "progress",
+        "generation_id": generation.id,
+        "user_id": generation.user_id,
+        "type": generation.type.value,
+        "status": "processing"
+    }
+
+    def reporter(percent: int, detail: Optional[str] = None) -> None:
+        publish_event({**base, "progress": percent, "detail": detail})
+
+    return reporter
+
+
+def _dispatch_notification(payload: str) -> None:
+    try:
+        broker.dispatch(json.loads(payload))
+    except ValueError:
+        pass
+
+
+class NotifyListener:
+    """
+    Background thread that LISTENs on Postgres channels and hands each
+    notification's payload to its channel handler (generation events go to
+    the in-process broker). Reconnects on failure.
+    """
+
+    def __init__(self):
+        self._stopping = threading.Event()
+        self._thread = None
+        self._handlers: Dict[str, Callable[[str], None]] = {NOTIFY_CHANNEL: _dispatch_notification}
+
+    def listen(self, channel: str, handler: Callable[[str], None]) -> None:
+        """Register a handler for another channel (before start())"""
+        self._handlers[channel] = handler
+
+    def start(self) -> None:
+        if not _uses_notify() or self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="generation-events-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _run(self) -> None:
+        import psycopg2
+
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while not self._stopping.is_set():
+            try:
+                connection = psycopg2.connect(dsn)
+                connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with connection.cursor() as cursor:
+                    for channel in self._handlers:
+                        cursor.execute(f"LISTEN {channel}")
+                logger.info(f"Listening for notifications on: {', '.join(self._handlers)}")
+
+                while not self._stopping.is_set():
+                    if select.select([connection], [], [], 5) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        handler = self._handlers.get(notification.channel)
+                        if handler:
+                            handler(notification.payload)
+                connection.close()
+            except Exception as e:
+                logger.error(f"Generation events listener error: {str(e)}")
+                time.sleep(5)
+
+
+notify_listener = NotifyListener()
@@ -0,0 +1,303 @@
+"""
+Generation execution: engine dispatch and bounded background executor
+"""
+import asyncio
+import json
+import threading
+from datetime import datetime
+from typing import Callable, Optional, Dict, Tuple
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import User, Generation, GenerationType, SubscriptionTier
+from engine_adapters import EngineAdapter, get_engine_adapter
+from engine_resilience import guarded_generate
+from generation_cache import generation_cache, make_cache_key
+from generation_scheduler import FairScheduler
+from generation_events import publish_generation_status, progress_reporter, make_progress_reporter
+import credit_ledger
+from config import settings
+from logging_config import logger
+
+
+class QueueFullError(Exception):
+    """Raised when the background executor has no free pending slots"""
+
+
+def load_parameters(generation: Generation) -> Dict:
+    """Decode the JSON parameters stored on a generation row"""
+    if not generation.parameters:
+        return {}
+    try:
+        return json.loads(generation.parameters)
+    except ValueError:
+        return {}
+
+
+async def generate_with_adapter(
+    adapter: EngineAdapter,
+    generation_type: GenerationType,
+    prompt: Optional[str],
+    parameters: Optional[Dict],
+    generation_id: int
+) -> Dict:
+    """
+    Call an engine adapter, going through the result cache when enabled.
+    Cache hits are marked with "cache_hit": True.
+    """
+    if not settings.GENERATION_CACHE_ENABLED:
+        return await guarded_generate(adapter, prompt or "", parameters or {}, generation_id)
+
+    key = make_cache_key(generation_type, prompt, parameters, adapter.engine_id)
+    cached = generation_cache.get(key, generation_type)
+    if cached is not None:
+        cached["cache_hit"] = True
+        return cached
+
+    result = await guarded_generate(adapter, prompt or "", parameters or {}, generation_id)
+    generation_cache.set(key, result)
+    return result
+
+
+async def run_engine(
+    db: Session,
+    generation_type: GenerationType,
+    prompt: Optional[str],
+    parameters: Optional[Dict],
+    generation_id: int
+) -> Dict:
+    """
+    Run the AI engine adapter for a generation type and return its result.
+    The adapter lookup queries the database, so it runs in a worker thread.
+    """
+    adapter = await asyncio.to_thread(get_engine_adapter, db, generation_type)
+    return await generate_with_adapter(adapter, generation_type, prompt, parameters, generation_id)
+
+
+def dump_result_metadata(result: Dict) -> str:
+    """Serialize everything but the URL of an engine result for Generation.result_metadata"""
+    return json.dumps(
+        {key: value for key, value in result.items() if key != "url"},
+        ensure_ascii=False,
+        default=str
+    )
+
+
+def complete_generation(db: Session, generation: Generation, user: User, result: Dict) -> None:
+    """
+    Store the engine result and charge the user for a successful generation,
+    in one transaction. Raises InsufficientCreditsError (nothing committed)
+    if the balance no longer covers the cost.
+    """
+    generation.result_url = result.get("url", "")
+    generation.result_metadata = dump_result_metadata(result)
+    if generation.type == GenerationType.AI_SCORING:
+        generation.ai_score = result.get("score")
+    generation.status = "completed"
+    generation.completed_at = datetime.utcnow()
+
+    # Deduct credits only after successful generation: capture the hold
+    # placed at submit (plain debit for generations created without one)
+    description = f"{generation.type.value} generation"
+    hold = credit_ledger.find_open_hold(db, generation.id)
+    if hold:
+        credit_ledger.capture_hold(db, user, hold, description, price_snapshot_id=generation.price_snapshot_id)
+    else:
+        credit_ledger.debit(db, user, generation.cost, description, price_snapshot_id=generation.price_snapshot_id)
+    publish_generation_status(db, generation)
+
+    db.commit()
+
+
+def _mark_failed(db: Session, generation: Generation, error: Exception) -> None:
+    """Fail a generation and free its credit hold (commits)"""
+    generation.status = "failed"
+    generation.completed_at = datetime.utcnow()
+    credit_ledger.release_generation_hold(db, generation.id)
+    publish_generation_status(db, generation, detail=str(error))
+    db.commit()
+    logger.error(f"Generation {generation.id} failed: {str(error)}")
+
+
+def _start_processing(
+    db: Session,
+    generation_id: int,
+    claim_completion: Optional[Callable[[Session], bool]]
+) -> Optional[Tuple[Generation, User]]:
+    """Mark a pending generation as processing (commits); None if there is nothing to run"""
+    generation = db.query(Generation).filter(Generation.id == generation_id).first()
+    if not generation or generation.status != "pending":
+        if claim_completion is not None and claim_completion(db):
+            db.commit()
+        return None
+
+    generation.status = "processing"
+    publish_generation_status(db, generation)
+    db.commit()
+
+    user = db.query(User).filter(User.id == generation.user_id).first()
+    return generation, user
+
+
+def _store_result(
+    db: Session,
+    generation: Generation,
+    user: User,
+    result: Dict,
+    claim_completion: Optional[Callable[[Session], bool]]
+) -> None:
+    """Complete and charge a generation, or fail it if charging fails (commits)"""
+    try:
+        if claim_completion is not None and not claim_completion(db):
+            db.rollback()
+            logger.warning(f"Generation {generation.id} finished after its job lease was lost, result dropped")
+            return
+        complete_generation(db, generation, user, result)
+    except Exception as e:
+        # Charging failed (e.g. insufficient credits): retrying does not help
+        db.rollback()
+        if claim_completion is not None and not claim_completion(db):
+            db.rollback()
+            return
+        _mark_failed(db, generation, e)
+
+
+async def process_generation(
+    generation_id: int,
+    claim_completion: Optional[Callable[[Session], bool]] = None
+) -> None:
+    """
+    Execute a pending generation outside of the request cycle.
+    Uses its own DB session; the request session is closed by then.
+    Database work runs in worker threads (one at a time, so the session is
+    never shared concurrently); only the engine call runs on the event loop.
+
+    Queue workers pass `claim_completion`: it is called in the transaction
+    that stores the outcome and returns False if the job's lease was lost, in
+    which case nothing is written (the job's new owner runs it). Engine
+    errors are then raised instead of failing the generation, so the queue
+    retries the job.
+    """
+    db = SessionLocal()
+    try:
+        started = await asyncio.to_thread(_start_processing, db, generation_id, claim_completion)
+        if started is None:
+            return
+        generation, user = started
+        progress_reporter.set(make_progress_reporter(generation))
+
+        try:
+            result = await run_engine(
+                db,
+                generation.type,
+                generation.prompt,
+                load_parameters(generation),
+                generation.id
+            )
+        except Exception as e:
+            if claim_completion is not None:
+                # The queue retries the job (fail_job) or fails it for good
+                await asyncio.to_thread(db.rollback)
+                raise
+            await asyncio.to_thread(_mark_failed, db, generation, e)
+            return
+
+        await asyncio.to_thread(_store_result, db, generation, user, result, claim_completion)
+    finally:
+        await asyncio.to_thread(db.close)
+
+
+class GenerationExecutor:
+    """
+    Bounded background executor for generations.
+    Runs engine calls as tasks on one dedicated asyncio event loop: at most
+    `max_concurrency` run at once, and up to `max_pending` may be queued or
+    running before submissions are rejected. Waiting work is ordered by the
+    tier-aware FairScheduler. submit() is thread-safe.
+    """
+
+    def __init__(self, max_concurrency: int, max_pending: int, scheduler: FairScheduler):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.scheduler = scheduler
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._tasks = set()
+        self._loop = None
+        self._thread = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _ensure_loop(self) -> None:
+        if self._loop is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="generation-loop",
+            daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, generation_id: int, user_id: int, tier: Optional[SubscriptionTier]) -> None:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError("Generation queue is full")
+            self._pending += 1
+            self._ensure_loop()
+
+        self.scheduler.push(tier, user_id, generation_id)
+        self._loop.call_soon_threadsafe(self._dispatch)
+
+    def _dispatch(self) -> None:
+        """Start queued generations while there is free concurrency (runs on the loop)"""
+        while self._running < self.max_concurrency:
+            generation_id = self.scheduler.pop()
+            if generation_id is None:
+                return
+            self._running += 1
+            task = self._loop.create_task(self._run(generation_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, generation_id: int) -> None:
+        try:
+            await process_generation(generation_id)
+        except Exception as e:
+            logger.error(f"Background generation crashed: {str(e)}")
+        finally:
+            self._running -= 1
+            with self._lock:
+                self._pending -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._running,
+            "pending": self._pending,
+            "max_concurrency": self.max_concurrency,
+            "max_pending": self.max_pending,
+            **self.scheduler.stats()
+        }
+
+    async def _drain(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._loop is None:
+            return
+        if wait:
+            asyncio.run_coroutine_threadsafe(self._drain(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+
+generation_executor = GenerationExecutor(
+    max_concurrency=settings.GENERATION_WORKERS,
+    max_pending=settings.GENERATION_MAX_PENDING,
+    scheduler=FairScheduler(aging_seconds=settings.SCHEDULER_AGING_SECONDS)
+)
@@ -0,0 +1,155 @@
+"""
+Subscription-tier-aware scheduling of generation work.
+
+Weighted fair queuing across SubscriptionTier (stride scheduling: each
+dispatch advances a tier's virtual pass by 1/weight), round robin between
+users inside a tier, and aging: an item waiting longer than the aging limit
+is dispatched next regardless of tier, so FREE work is never starved.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+from models import SubscriptionTier
+
+# Relative share of dispatch slots per tier
+TIER_WEIGHTS = {
+    SubscriptionTier.FREE: 1,
+    SubscriptionTier.STARTER: 2,
+    SubscriptionTier.PRO: 4,
+    SubscriptionTier.AGENCY: 8,
+}
+
+# Virtual deadline offset per tier for the Postgres queue (seconds).
+# Jobs are claimed by earliest deadline, so older FREE jobs overtake new paid ones.
+TIER_DEADLINE_OFFSETS = {
+    SubscriptionTier.AGENCY: 0,
+    SubscriptionTier.PRO: 5,
+    SubscriptionTier.STARTER: 15,
+    SubscriptionTier.FREE: 30,
+}
+
+
+def normalize_tier(tier: Optional[SubscriptionTier]) -> SubscriptionTier:
+    return tier if tier in TIER_WEIGHTS else SubscriptionTier.FREE
+
+
+class TierWaitStats:
+    """Rolling queue wait-time samples per tier"""
+
+    def __init__(self, window: int = 1000):
+        self._samples = {tier: deque(maxlen=window) for tier in TIER_WEIGHTS}
+        self._lock = threading.Lock()
+
+    def record(self, tier: SubscriptionTier, wait_seconds: float) -> None:
+        with self._lock:
+            self._samples[normalize_tier(tier)].append(wait_seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {tier.value: summarize_waits(list(samples)) for tier, samples in self._samples.items()}
+
+
+def summarize_waits(samples: List[float]) -> Dict[str, float]:
+    """Count, mean, p50, p95 and max of wait times in milliseconds"""
+    if not samples:
+        return {"count": 0, "avg_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1)
+
+    return {
+        "count": len(ordered),
+        "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+class FairScheduler:
+    """
+    Holds waiting work items and decides which one runs next.
+    push()/pop() are thread-safe; pop() returns None when empty.
+    """
+
+    def __init__(self, aging_seconds: float, weights: Optional[Dict[SubscriptionTier, int]] = None):
+        self.aging_seconds = aging_seconds
+        self.weights = weights or TIER_WEIGHTS
+        # tier -> OrderedDict(user_id -> deque of (enqueued_at, item))
+        self._queues = {tier: OrderedDict() for tier in self.weights}
+        self._pass = {tier: 0.0 for tier in self.weights}
+        self._virtual_time = 0.0
+        self._size = 0
+        self._lock = threading.Lock()
+        self.wait_stats = TierWaitStats()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, tier: Optional[SubscriptionTier], user_id: int, item: Any) -> None:
+        tier = normalize_tier(tier)
+        with self._lock:
+            users = self._queues[tier]
+            if not users:
+                # A tier returning from idle does not get credit for the idle time
+                self._pass[tier] = max(self._pass[tier], self._virtual_time)
+            users.setdefault(user_id, deque()).append((time.monotonic(), item))
+            self._size += 1
+
+    def pop(self) -> Optional[Any]:
+        with self._lock:
+            if not self._size:
+                return None
+
+            now = time.monotonic()
+            overdue = self._oldest_overdue(now)
+            if overdue is not None:
+                # Serve the overdue item itself, not whoever is first in its tier
+                tier, user_id = overdue
+                users = self._queues[tier]
+                items = users[user_id]
+            else:
+                tier = min(
+                    (tier for tier, users in self._queues.items() if users),
+                    key=lambda tier: (self._pass[tier], -self.weights[tier])
+                )
+                users = self._queues[tier]
+                user_id, items = next(iter(users.items()))
+            enqueued_at, item = items.popleft()
+            # Round robin inside the tier: the user goes to the back of the line
+            del users[user_id]
+            if items:
+                users[user_id] = items
+
+            self._virtual_time = self._pass[tier]
+            self._pass[tier] += 1.0 / self.weights[tier]
+            self._size -= 1
+
+        self.wait_stats.record(tier, now - enqueued_at)
+        return item
+
+    def _oldest_overdue(self, now: float) -> Optional[Tuple[SubscriptionTier, int]]:
+        """(tier, user id) of the oldest item waiting past the aging limit, if any"""
+        oldest, oldest_at = None, now - self.aging_seconds
+        for tier, users in self._queues.items():
+            for user_id, items in users.items():
+                if items[0][0] < oldest_at:
+                    oldest, oldest_at = (tier, user_id), items[0][0]
+        return oldest
+
+    def depth(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                tier.value: sum(len(items) for items in users.values())
+                for tier, users in self._queues.items()
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.depth(),
+            "weights": {tier.value: weight for tier, weight in self.weights.items()},
+            "aging_seconds": self.aging_seconds,
+            "wait_times": self.wait_stats.summary()
+        }
@@ -0,0 +1,133 @@
+"""
+Generation worker process.
+Claims jobs from the Postgres queue (job_queue.py) and runs them, so generation
+capacity scales independently of API pods.
+
+Usage: python generation_worker.py
+"""
+import asyncio
+import os
+import signal
+import socket
+import time
+from typing import List, Set, Tuple
+from database import SessionLocal
+from generation_runner import process_generation
+from job_queue import claim_jobs, heartbeat, complete_job, fail_job, requeue_expired
+from credit_ledger import release_expired_holds
+from idempotency import purge_expired_keys
+from prompt_dedup import index_missing
+from config import settings
+from logging_config import logger
+
+
+class GenerationWorker:
+    """Polls the job queue and runs claimed jobs as asyncio tasks (at most `concurrency`)"""
+
+    def __init__(self, concurrency: int):
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = concurrency
+        self._running = {}  # job_id -> asyncio.Task
+        self._stopping = False
+        self._last_heartbeat = 0.0
+        self._last_requeue = 0.0
+
+    def stop(self, *args) -> None:
+        logger.info(f"Worker {self.worker_id} stopping, waiting for {len(self._running)} jobs")
+        self._stopping = True
+
+    async def run(self) -> None:
+        logger.info(f"Generation worker {self.worker_id} started (concurrency={self.concurrency})")
+
+        while not self._stopping:
+            self._reap()
+            await self._maintain()
+
+            claimed = 0
+            free = self.concurrency - len(self._running)
+            if free > 0:
+                jobs = await asyncio.to_thread(self._claim, free)
+                for job_id, generation_id, attempt in jobs:
+                    self._running[job_id] = asyncio.create_task(
+                        self._run_job(job_id, generation_id, attempt)
+                    )
+                claimed = len(jobs)
+
+            if not claimed:
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL_SECONDS)
+
+        # Graceful shutdown: finish (and keep heartbeating) what we already claimed
+        while self._running:
+            self._reap()
+            await self._maintain()
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL_SECONDS)
+
+    def _claim(self, limit: int) -> List[Tuple[int, int, int]]:
+        """(job id, generation id, attempt) of newly claimed jobs"""
+        db = SessionLocal()
+        try:
+            return [(job.id, job.generation_id, job.attempts) for job in claim_jobs(db, self.worker_id, limit=limit)]
+        finally:
+            db.close()
+
+    async def _run_job(self, job_id: int, generation_id: int, attempt: int) -> None:
+        def claim_completion(session) -> bool:
+            return complete_job(session, job_id, self.worker_id, attempt)
+
+        try:
+            await process_generation(generation_id, claim_completion)
+        except Exception as e:
+            logger.error(f"Job {job_id} (generation {generation_id}) attempt {attempt} failed: {str(e)}")
+            await asyncio.to_thread(self._fail, job_id, attempt, str(e))
+
+    def _fail(self, job_id: int, attempt: int, error: str) -> None:
+        db = SessionLocal()
+        try:
+            fail_job(db, job_id, self.worker_id, attempt, error)
+        finally:
+            db.close()
+
+    def _reap(self) -> None:
+        for job_id in [job_id for job_id, future in self._running.items() if future.done()]:
+            del self._running[job_id]
+
+    async def _maintain(self) -> None:
+        # Queue upkeep queries the database: run it off the loop, then stop
+        # the tasks whose leases were lost (re-queued elsewhere; their
+        # results would be dropped anyway)
+        lost = await asyncio.to_thread(self._upkeep, list(self._running))
+        for job_id in lost:
+            logger.warning(f"Worker {self.worker_id} lost lease on job {job_id}")
+            self._running[job_id].cancel()
+
+    def _upkeep(self, job_ids: List[int]) -> Set[int]:
+        """Heartbeat and periodic queue maintenance; returns the ids of jobs whose lease was lost"""
+        now = time.monotonic()
+        lost = set()
+        db = SessionLocal()
+        try:
+            if job_ids and now - self._last_heartbeat >= settings.JOB_HEARTBEAT_SECONDS:
+                lost = heartbeat(db, self.worker_id, job_ids)
+                self._last_heartbeat = now
+
+            if now - self._last_requeue >= settings.JOB_LEASE_SECONDS / 2:
+                requeue_expired(db)
+                release_expired_holds(db)
+                purge_expired_keys(db)
+                index_missing(db)
+                db.commit()
+                self._last_requeue = now
+        finally:
+            db.close()
+        return lost
+
+
+def main():
+    worker = GenerationWorker(concurrency=settings.GENERATION_WORKERS)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    asyncio.run(worker.run())
+
+
+if __name__ == "__main__":
+    main()
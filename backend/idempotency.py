@@ -0,0 +1,199 @@
+"""
+Idempotency-Key support for endpoints that spend money or credits.
+
+A client sends the same Idempotency-Key header when it retries a request.
+The first request claims the key (one row per user and key, committed before
+any work starts) and stores its response; a retry with the same key and the
+same request gets the stored response back without running anything again.
+Reusing a key for a different request is rejected with 422, and a retry that
+arrives while the first request is still running gets 409.
+
+Only successful responses are stored: a request that fails (402, 503, ...)
+charged nothing, so its key is released and a retry runs it again. Keys
+expire after IDEMPOTENCY_KEY_TTL_HOURS.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Optional
+from fastapi import Header, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import IdempotencyKey
+from config import settings
+from logging_config import logger
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+
+# A key still "in_progress" after this long belongs to a request that died
+STALE_IN_PROGRESS_SECONDS = 600
+
+
+def idempotency_key_header(
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+) -> Optional[str]:
+    """FastAPI dependency reading the Idempotency-Key header"""
+    if idempotency_key is not None and not 1 <= len(idempotency_key) <= 255:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{IDEMPOTENCY_HEADER} must be 1-255 characters long"
+        )
+    return idempotency_key
+
+
+def request_fingerprint(request: Request, payload: Any = None) -> str:
+    """Hash of method, path and JSON payload identifying what a key was used for"""
+    if hasattr(payload, "model_dump"):
+        payload = payload.model_dump(mode="json")
+    canonical = json.dumps(
+        [request.method, request.url.path, payload],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IdempotencyScope:
+    """
+    Context manager around an idempotent request:
+
+        with IdempotencyScope(db, user.id, key, fingerprint) as scope:
+            if scope.replay:
+                return scope.replay
+            ...
+            return scope.store(201, body)
+
+    An exception (including HTTPException) releases the key. Without a key
+    the scope does nothing. Async endpoints use `async with` and
+    `await scope.store_async(...)`, which run the key queries in the
+    threadpool instead of on the event loop.
+    """
+
+    def __init__(self, db: Session, user_id: int, key: Optional[str], fingerprint: str):
+        self.db = db
+        self.user_id = user_id
+        self.key = key
+        self.fingerprint = fingerprint
+        self.record = None
+        self.replay = None
+        self.completed = False
+
+    def __enter__(self) -> "IdempotencyScope":
+        if self.key is not None:
+            self._claim()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if self.record is not None and exc_type is not None and not self.completed:
+            self._release()
+        return False
+
+    async def __aenter__(self) -> "IdempotencyScope":
+        return await run_in_threadpool(self.__enter__)
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        return await run_in_threadpool(self.__exit__, exc_type, exc, tb)
+
+    def _claim(self) -> None:
+        db = self.db
+        now = datetime.utcnow()
+        db.query(IdempotencyKey).filter(
+            IdempotencyKey.user_id == self.user_id,
+            IdempotencyKey.expires_at < now
+        ).delete(synchronize_session=False)
+
+        record = IdempotencyKey(
+            user_id=self.user_id,
+            key=self.key,
+            request_hash=self.fingerprint,
+            status="in_progress",
+            expires_at=now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+        )
+        db.add(record)
+        try:
+            db.commit()
+            self.record = record
+            return
+        except IntegrityError:
+            db.rollback()
+
+        existing = db.query(IdempotencyKey).filter(
+            IdempotencyKey.user_id == self.user_id,
+            IdempotencyKey.key == self.key
+        ).first()
+        if existing is None:
+            # Released between our insert and this read: let the client retry
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is being retried, try again"
+            )
+
+        if existing.request_hash != self.fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"{IDEMPOTENCY_HEADER} was already used for a different request"
+            )
+
+        if existing.status == "completed":
+            self.replay = JSONResponse(
+                status_code=existing.response_status,
+                content=json.loads(existing.response_body),
+                headers={REPLAY_HEADER: "true"}
+            )
+            return
+
+        if existing.created_at < now - timedelta(seconds=STALE_IN_PROGRESS_SECONDS):
+            # The original request never finished: take the key over (once)
+            taken = db.query(IdempotencyKey).filter(
+                IdempotencyKey.id == existing.id,
+                IdempotencyKey.status == "in_progress",
+                IdempotencyKey.created_at == existing.created_at
+            ).update({IdempotencyKey.created_at: now}, synchronize_session=False)
+            db.commit()
+            if taken:
+                self.record = existing
+                return
+
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still in progress"
+        )
+
+    def store(self, status_code: int, body: Any) -> Any:
+        """Save the response for replays and return the body"""
+        if self.record is not None:
+            self._save(status_code, body)
+        return body
+
+    async def store_async(self, status_code: int, body: Any) -> Any:
+        """store() for async endpoints"""
+        return await run_in_threadpool(self.store, status_code, body)
+
+    def _save(self, status_code: int, body: Any) -> None:
+        self.record.status = "completed"
+        self.record.response_status = status_code
+        self.record.response_body = json.dumps(body, ensure_ascii=False, default=str)
+        self.completed = True
+        try:
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Failed to store idempotent response: {str(e)}")
+
+    def _release(self) -> None:
+        self.db.rollback()
+        self.db.query(IdempotencyKey).filter(
+            IdempotencyKey.id == self.record.id
+        ).delete(synchronize_session=False)
+        self.db.commit()
+
+
+def purge_expired_keys(db: Session) -> int:
+    """Delete expired idempotency keys. Does not commit."""
+    return db.query(IdempotencyKey).filter(
+        IdempotencyKey.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
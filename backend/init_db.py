@@ -7,6 +7,9 @@ from models import (
     AiEngine, PricingConfiguration, FusionChain, GenerationType
 )
 from auth import get_password_hash
+from chain_costs import index_chain
+from trending import initial_score
+from prompt_dedup import index_creative
 from ai_mock import GENERATION_COSTS, PREMIUM_FEATURES
 import json
 
@@ -137,7 +140,10 @@ def init_db():
         
         for creative_data in sample_creatives:
             creative = TopCreative(**creative_data)
+            creative.trending_score = initial_score(creative_data["views_count"], creative_data["unlocks_count"])
             db.add(creative)
+            db.flush()
+            index_creative(db, creative)
         
         # Create creative bundles (комплекты со скидкой 15%)
         bundles = [
@@ -273,6 +279,30 @@ def init_db():
                 "markup_percentage": 400.0,  # 400% наценка -> 20₽ финальная цена
                 "is_active": True,
                 "generation_type": GenerationType.AI_SCORING
+            },
+            # Агенты постобработки Fusion-цепочек: вызываются только шагами цепочек,
+            # поэтому без собственного типа генерации
+            {
+                "name": "Brand Color Processor",
+                "description": "Постобработка: перекраска креатива в цвета бренда",
+                "role": "Применение цветов бренда",
+                "api_endpoint": "https://api.internal.example.com/v1/brand-colors",
+                "api_key_encrypted": "mock_brand_colors_key_mno",
+                "internal_cost_usd_per_unit": 0.02,  # $0.02 за креатив
+                "markup_percentage": 400.0,
+                "is_active": True,
+                "generation_type": None
+            },
+            {
+                "name": "Style Consistency Check",
+                "description": "Постобработка: проверка единства стиля набора креативов",
+                "role": "Проверка консистентности",
+                "api_endpoint": "https://api.internal.example.com/v1/style-consistency",
+                "api_key_encrypted": "mock_consistency_key_pqr",
+                "internal_cost_usd_per_unit": 0.04,  # $0.04 за проверку набора
+                "markup_percentage": 400.0,
+                "is_active": True,
+                "generation_type": None
             }
         ]
         
@@ -286,13 +316,24 @@ def init_db():
                 "name": "Брендовый Сет",
                 "description": "Fusion-цепочка: Recraft.ai + Постобработка Brand Colors. Генерация 3-х креативов в едином брендовом стиле.",
                 "generation_type": GenerationType.BRANDED_SET,
+                # DAG: 3 независимые ветки (Recraft -> Brand Colors) выполняются параллельно,
+                # затем общая проверка консистентности
                 "chain_config": json.dumps([
-                    {"engine_name": "Recraft.ai", "order": 1, "role": "Генерация векторной основы"},
-                    {"engine_name": "Brand Color Processor", "order": 2, "role": "Применение цветов бренда"},
-                    {"engine_name": "Style Consistency Check", "order": 3, "role": "Проверка консистентности"}
+                    {"id": "creative_1", "engine_name": "Recraft.ai", "order": 1, "role": "Генерация векторной основы"},
+                    {"id": "creative_2", "engine_name": "Recraft.ai", "order": 1, "role": "Генерация векторной основы"},
+                    {"id": "creative_3", "engine_name": "Recraft.ai", "order": 1, "role": "Генерация векторной основы"},
+                    {"id": "colors_1", "engine_name": "Brand Color Processor", "order": 2, "role": "Применение цветов бренда",
+                     "depends_on": ["creative_1"], "output": True},
+                    {"id": "colors_2", "engine_name": "Brand Color Processor", "order": 2, "role": "Применение цветов бренда",
+                     "depends_on": ["creative_2"], "output": True},
+                    {"id": "colors_3", "engine_name": "Brand Color Processor", "order": 2, "role": "Применение цветов бренда",
+                     "depends_on": ["creative_3"], "output": True},
+                    {"id": "consistency", "engine_name": "Style Consistency Check", "order": 3, "role": "Проверка консистентности"}
                 ]),
-                "total_cost_usd": 0.40,  # $0.30 (Recraft) + $0.10 (постобработка)
-                "markup_percentage": 400.0,  # 400% наценка -> 200₽ финальная цена
+                # Себестоимость считается по агентам шагов:
+                # 3 x $0.30 (Recraft) + 3 x $0.02 (Brand Colors) + $0.04 (проверка) = $1.00
+                "total_cost_usd": 0.0,
+                "markup_percentage": 400.0,  # 400% наценка -> 500₽ финальная цена
                 "is_active": True
             }
         ]
@@ -300,6 +341,9 @@ def init_db():
         for chain_data in fusion_chains:
             chain = FusionChain(**chain_data)
             db.add(chain)
+            db.flush()
+            # Индекс агентов цепочки и себестоимость по ним
+            index_chain(db, chain)
         
         # ==================== Обновление PricingConfig для новых типов ====================
         new_pricing = [
@@ -0,0 +1,220 @@
+"""
+Durable generation job queue stored in Postgres.
+Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+worker processes can pull from the same table without an external broker.
+
+A lease is identified by the worker id and the job's attempt number: a job
+whose lease expired may be claimed again (even by the same worker), so a
+worker only completes or fails a job while it still holds the lease of the
+attempt it started.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Iterable, Optional, Set
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from models import Generation, GenerationJob, SubscriptionTier
+from generation_scheduler import TIER_DEADLINE_OFFSETS, normalize_tier, summarize_waits
+from config import settings
+from generation_events import publish_generation_status
+from credit_ledger import release_generation_hold
+from logging_config import logger
+
+
+def enqueue_generation(
+    db: Session,
+    generation: Generation,
+    tier: Optional[SubscriptionTier] = None
+) -> GenerationJob:
+    """
+    Add a queue entry for a generation.
+    Jobs are claimed by earliest priority deadline (enqueue time plus a
+    per-tier offset), so paid tiers go first and old FREE jobs age past them.
+    Does not commit: the caller commits it together with the generation row.
+    """
+    now = datetime.utcnow()
+    tier = normalize_tier(tier)
+    job = GenerationJob(
+        generation=generation,
+        status="queued",
+        tier=tier,
+        priority_deadline=now + timedelta(seconds=TIER_DEADLINE_OFFSETS[tier]),
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+        available_at=now
+    )
+    db.add(job)
+    return job
+
+
+def claim_jobs(db: Session, worker_id: str, limit: int = 1) -> List[GenerationJob]:
+    """
+    Claim up to `limit` queued jobs for this worker.
+    Rows locked by other workers are skipped instead of waited on.
+    """
+    now = datetime.utcnow()
+    jobs = db.query(GenerationJob).filter(
+        GenerationJob.status == "queued",
+        GenerationJob.available_at <= now
+    ).order_by(
+        GenerationJob.priority_deadline, GenerationJob.id
+    ).limit(limit).with_for_update(skip_locked=True).all()
+
+    for job in jobs:
+        job.status = "leased"
+        job.lease_owner = worker_id
+        job.lease_expires_at = now + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        job.heartbeat_at = now
+        job.started_at = job.started_at or now
+        job.attempts = (job.attempts or 0) + 1
+
+    db.commit()
+    return jobs
+
+
+def heartbeat(db: Session, worker_id: str, job_ids: Iterable[int]) -> Set[int]:
+    """
+    Extend the leases this worker holds.
+    Returns ids of jobs whose lease was lost (expired and re-queued).
+    """
+    job_ids = set(job_ids)
+    if not job_ids:
+        return set()
+
+    now = datetime.utcnow()
+    owned = db.query(GenerationJob).filter(
+        GenerationJob.id.in_(job_ids),
+        GenerationJob.status == "leased",
+        GenerationJob.lease_owner == worker_id
+    ).all()
+
+    for job in owned:
+        job.heartbeat_at = now
+        job.lease_expires_at = now + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+
+    db.commit()
+    return job_ids - {job.id for job in owned}
+
+
+def complete_job(db: Session, job_id: int, worker_id: str, attempt: int) -> bool:
+    """
+    Mark a job done if this worker still holds the lease of `attempt`.
+    Does not commit: committing it with the generation's result makes the
+    result count only while the lease is held. False if the lease was lost.
+    """
+    return db.execute(
+        update(GenerationJob)
+        .where(
+            GenerationJob.id == job_id,
+            GenerationJob.status == "leased",
+            GenerationJob.lease_owner == worker_id,
+            GenerationJob.attempts == attempt
+        )
+        .values(status="completed", lease_expires_at=None),
+        execution_options={"synchronize_session": False}
+    ).rowcount == 1
+
+
+def fail_job(db: Session, job_id: int, worker_id: str, attempt: int, error: str) -> None:
+    """
+    Record a job failure (ignored if the lease of `attempt` was lost).
+    The job is retried with linear backoff until max_attempts is reached.
+    """
+    job = db.query(GenerationJob).filter(
+        GenerationJob.id == job_id,
+        GenerationJob.status == "leased",
+        GenerationJob.lease_owner == worker_id,
+        GenerationJob.attempts == attempt
+    ).with_for_update().first()
+    if not job:
+        db.rollback()
+        return
+
+    job.last_error = error
+    job.lease_owner = None
+    job.lease_expires_at = None
+
+    if job.attempts >= job.max_attempts:
+        job.status = "failed"
+        _fail_generation(db, job.generation_id)
+    else:
+        job.status = "queued"
+        job.available_at = datetime.utcnow() + timedelta(seconds=10 * job.attempts)
+        _reset_generation(db, job.generation_id)
+
+    db.commit()
+
+
+def requeue_expired(db: Session) -> int:
+    """
+    Put jobs with expired leases back on the queue (their worker died or hung).
+    Jobs that have used up their attempts are failed instead.
+    Returns the number of jobs processed.
+    """
+    now = datetime.utcnow()
+    expired = db.query(GenerationJob).filter(
+        GenerationJob.status == "leased",
+        GenerationJob.lease_expires_at < now
+    ).with_for_update(skip_locked=True).all()
+
+    for job in expired:
+        job.lease_owner = None
+        job.lease_expires_at = None
+        job.last_error = "Lease expired"
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+            _fail_generation(db, job.generation_id)
+        else:
+            job.status = "queued"
+            job.available_at = now
+            _reset_generation(db, job.generation_id)
+
+    db.commit()
+
+    if expired:
+        logger.warning(f"Re-queued {len(expired)} generation jobs with expired leases")
+    return len(expired)
+
+
+def _reset_generation(db: Session, generation_id: int) -> None:
+    """Return an interrupted generation to pending so it can be picked up again"""
+    generation = db.query(Generation).filter(
+        Generation.id == generation_id,
+        Generation.status == "processing"
+    ).first()
+    if generation:
+        generation.status = "pending"
+        publish_generation_status(db, generation, detail="Re-queued")
+
+
+def _fail_generation(db: Session, generation_id: int) -> None:
+    generation = db.query(Generation).filter(
+        Generation.id == generation_id,
+        Generation.status.in_(["pending", "processing"])
+    ).first()
+    if generation:
+        generation.status = "failed"
+        generation.completed_at = datetime.utcnow()
+        release_generation_hold(db, generation.id)
+        publish_generation_status(db, generation, detail="Retry attempts exhausted")
+
+
+def wait_time_stats(db: Session, since_minutes: int = 60, sample_limit: int = 5000) -> Dict[str, Dict[str, float]]:
+    """Queue wait (enqueue -> first claim) per tier over recently started jobs"""
+    since = datetime.utcnow() - timedelta(minutes=since_minutes)
+    rows = db.query(
+        GenerationJob.tier, GenerationJob.created_at, GenerationJob.started_at
+    ).filter(
+        GenerationJob.started_at >= since
+    ).order_by(GenerationJob.started_at.desc()).limit(sample_limit).all()
+
+    samples = {tier: [] for tier in TIER_DEADLINE_OFFSETS}
+    for tier, created_at, started_at in rows:
+        samples[normalize_tier(tier)].append((started_at - created_at).total_seconds())
+
+    queued = dict(db.query(GenerationJob.tier, func.count(GenerationJob.id)).filter(
+        GenerationJob.status == "queued"
+    ).group_by(GenerationJob.tier).all())
+
+    return {
+        tier.value: {**summarize_waits(waits), "queued": queued.get(tier, 0)}
+        for tier, waits in samples.items()
+    }
@@ -0,0 +1,159 @@
+"""
+Pre-serialized top-creatives snapshots for the public library.
+
+The ranked list of approved creatives changes only when a creative is
+approved or its score changes, but every landing-page visit ran the same
+ORDER BY ai_score query and ORM serialization. Each category (and the
+unfiltered list) in each ranking (AI score, trending) is now compiled once
+into a RankedSnapshot: the top LIBRARY_SNAPSHOT_SIZE creatives serialized
+to JSON one by one. A page is the join of a slice of those items, and its
+strong ETag is derived from the snapshot's content hash plus skip/limit, so
+revalidations are answered with 304 Not Modified straight from memory. Pages past the snapshot fall back to
+the database.
+
+Writes changing the ranking call library_changed() after commit: it drops
+this process's snapshots and, on Postgres, sends a NOTIFY on LIBRARY_CHANNEL
+so every other API pod drops its copies too. Snapshots older than
+LIBRARY_SNAPSHOT_TTL_SECONDS are rebuilt as well, which also refreshes the
+views and unlocks counters they carry and the trending order.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import engine
+from models import TopCreative
+from schemas import LibrarySort, TopCreativeResponse
+from generation_events import notify_listener
+from config import settings
+from logging_config import logger
+
+LIBRARY_CHANNEL = "library_updates"
+
+# Pages kept rendered per snapshot (distinct skip/limit pairs)
+MAX_CACHED_PAGES = 32
+
+
+class RankedSnapshot:
+    """Immutable ranked list of one category, serialized item by item"""
+
+    __slots__ = ("ids", "items", "version", "built_at", "_pages", "_lock")
+
+    def __init__(self, ids: List[int], items: List[bytes]):
+        self.ids = tuple(ids)
+        self.items = tuple(items)
+        self.version = hashlib.sha256(b"\n".join(self.items)).hexdigest()[:20]
+        self.built_at = time.monotonic()
+        self._pages: Dict[Tuple[int, int], Tuple[str, bytes, Tuple[int, ...]]] = {}
+        self._lock = threading.Lock()
+
+    def covers(self, skip: int, limit: int) -> bool:
+        """Whether the page lies within the snapshot (or the list ends before it does)"""
+        if skip < 0 or limit < 0:
+            return False
+        return skip + limit <= settings.LIBRARY_SNAPSHOT_SIZE or len(self.items) < settings.LIBRARY_SNAPSHOT_SIZE
+
+    def page(self, skip: int, limit: int) -> Tuple[str, bytes, Tuple[int, ...]]:
+        """ETag, JSON body and creative ids of a page"""
+        key = (skip, limit)
+        page = self._pages.get(key)
+        if page is None:
+            body = b"[" + b",".join(self.items[skip:skip + limit]) + b"]"
+            page = (f'"{self.version}-{skip}-{limit}"', body, self.ids[skip:skip + limit])
+            with self._lock:
+                if len(self._pages) < MAX_CACHED_PAGES:
+                    self._pages[key] = page
+        return page
+
+
+def ranking_order(sort: LibrarySort) -> Tuple:
+    """ORDER BY clauses of a library ranking"""
+    if sort == LibrarySort.TRENDING:
+        return TopCreative.trending_score.desc(), TopCreative.id
+    return TopCreative.ai_score.desc(), TopCreative.id
+
+
+def build_snapshot(db: Session, category: Optional[str], sort: LibrarySort = LibrarySort.SCORE) -> RankedSnapshot:
+    """Rank and serialize the approved creatives of a category (None: all)"""
+    query = db.query(TopCreative).filter(TopCreative.is_approved == True)
+    if category:
+        query = query.filter(TopCreative.category == category)
+    creatives = query.order_by(*ranking_order(sort)).limit(
+        settings.LIBRARY_SNAPSHOT_SIZE
+    ).all()
+
+    return RankedSnapshot(
+        [creative.id for creative in creatives],
+        [
+            json.dumps(
+                TopCreativeResponse.model_validate(creative).model_dump(mode="json"),
+                ensure_ascii=False,
+                separators=(",", ":")
+            ).encode("utf-8")
+            for creative in creatives
+        ]
+    )
+
+
+_snapshots: Dict[Tuple[Optional[str], LibrarySort], RankedSnapshot] = {}
+_version = 0  # Bumped on invalidation so a build racing with it is not installed
+_lock = threading.Lock()
+
+
+def get_snapshot(
+    db: Session,
+    category: Optional[str] = None,
+    sort: LibrarySort = LibrarySort.SCORE
+) -> RankedSnapshot:
+    """The category's snapshot in a ranking, rebuilt if it was invalidated or is too old"""
+    key = (category or None, sort)
+    snapshot = _snapshots.get(key)
+    if snapshot is not None and time.monotonic() - snapshot.built_at < settings.LIBRARY_SNAPSHOT_TTL_SECONDS:
+        return snapshot
+
+    with _lock:
+        version = _version
+    snapshot = build_snapshot(db, key[0], sort)
+    # Unknown categories are not kept, so arbitrary ?category= values cannot grow the cache
+    if snapshot.items or key[0] is None:
+        with _lock:
+            if version == _version:
+                _snapshots[key] = snapshot
+    return snapshot
+
+
+def library_version() -> int:
+    """Changes whenever the snapshots are invalidated (for caches derived from the library)"""
+    return _version
+
+
+def invalidate_snapshots() -> None:
+    """Drop this process's snapshots; the next read of each category rebuilds it"""
+    global _version
+    with _lock:
+        _snapshots.clear()
+        _version += 1
+
+
+def library_changed() -> None:
+    """
+    Call after committing a change to the ranking (approval, score): drops
+    the snapshots here and in every process listening on LIBRARY_CHANNEL.
+    """
+    invalidate_snapshots()
+
+    if engine.dialect.name == "postgresql":
+        try:
+            with engine.begin() as connection:
+                connection.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": LIBRARY_CHANNEL, "payload": ""}
+                )
+        except Exception as e:
+            logger.warning(f"Failed to publish library change: {str(e)}")
+
+
+notify_listener.listen(LIBRARY_CHANNEL, lambda payload: invalidate_snapshots())
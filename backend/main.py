@@ -6,8 +6,12 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from database import engine, Base, get_db
 from sqlalchemy.orm import Session
-from routers import auth, payments, generation, library, admin, oauth, bundles, pricing_admin
+from routers import auth, payments, generation, library, admin, oauth, bundles, pricing, pricing_admin
 from logging_config import logger
+from generation_runner import generation_executor
+from generation_events import notify_listener
+from view_counter import view_counter
+from maintenance import maintenance_runner
 
 # Database tables are managed by Alembic migrations
 # To apply migrations: alembic upgrade head
@@ -45,11 +49,39 @@ app.include_router(oauth.router)
 app.include_router(payments.router)
 app.include_router(generation.router)
 app.include_router(bundles.router)
+app.include_router(pricing.router)
 app.include_router(library.router)
 app.include_router(admin.router)
 app.include_router(pricing_admin.router)
 
 
+@app.on_event("startup")
+def start_generation_events_listener():
+    """Relay generation events from other pods and workers (Postgres LISTEN)"""
+    notify_listener.start()
+
+
+@app.on_event("startup")
+def start_view_counter():
+    """Flush buffered library views periodically"""
+    view_counter.start()
+
+
+@app.on_event("startup")
+def start_maintenance():
+    """Purge expired keys and release expired holds periodically, whichever queue backend is configured"""
+    maintenance_runner.start()
+
+
+@app.on_event("shutdown")
+def shutdown_generation_executor():
+    """Let in-flight background generations finish before exit"""
+    notify_listener.stop()
+    generation_executor.shutdown(wait=True)
+    view_counter.stop()
+    maintenance_runner.stop()
+
+
 @app.get("/")
 def root():
     return {
@@ -0,0 +1,67 @@
+"""
+Periodic database upkeep run by every API process.
+
+Expired idempotency keys have to be purged, credit holds left behind by a
+crashed process released and library creatives that were not indexed on
+submission (prompt_dedup.index_missing) indexed whichever generation queue
+backend is configured: the Postgres queue worker (generation_worker.py) does
+all of it in its own maintenance pass, but the default in-process executor
+has no worker process. A background thread in each API process therefore runs the
+TASKS every MAINTENANCE_INTERVAL_SECONDS, one transaction per task, so a
+failing task does not hold back the others. Every task is safe to run from
+several pods at once.
+"""
+import threading
+from typing import Callable, List, Tuple
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from idempotency import purge_expired_keys
+from credit_ledger import release_expired_holds
+from prompt_dedup import index_missing
+from config import settings
+from logging_config import logger
+
+# (name, task): each task changes rows without committing and returns a count
+TASKS: List[Tuple[str, Callable[[Session], int]]] = [
+    ("purge expired idempotency keys", purge_expired_keys),
+    ("release expired credit holds", release_expired_holds),
+    ("index unindexed library creatives", index_missing),
+]
+
+
+class MaintenanceRunner:
+    """Background thread running the maintenance TASKS periodically"""
+
+    def __init__(self, tasks: List[Tuple[str, Callable[[Session], int]]]):
+        self.tasks = tasks
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def run_once(self) -> None:
+        """Run every task once, each in its own transaction"""
+        for name, task in self.tasks:
+            db = SessionLocal()
+            try:
+                task(db)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Maintenance task '{name}' failed: {str(e)}")
+            finally:
+                db.close()
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _run(self) -> None:
+        while not self._stopping.wait(settings.MAINTENANCE_INTERVAL_SECONDS):
+            self.run_once()
+
+
+maintenance_runner = MaintenanceRunner(TASKS)
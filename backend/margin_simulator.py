@@ -0,0 +1,200 @@
+"""
+What-if margin simulator for the pricing admin.
+
+Evaluates a grid of exchange rates x markup percentages x API cost
+multipliers for every selected engine and fusion chain at once: the pricing
+formula of pricing_utils (ceil(cost_usd * rate * (1 + markup / 100))) is
+applied to NumPy arrays of shape (items, rates, markups, multipliers), so a
+100 x 100 x N sweep is a handful of array operations instead of a Python
+loop per point.
+
+Returns per-item margin surfaces, break-even points of today's prices (the
+exchange rate and the API cost multiplier at which they stop covering cost)
+and a portfolio surface: profit of the engines and chains that currently set
+prices, weighted by recent completed generation volume of their type.
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import AiEngine, FusionChain, Generation
+from schemas import MarginSimulationRequest, SimulationAxis
+from pricing_utils import get_exchange_rate, calculate_final_price
+
+# Upper bound on items x grid points evaluated by one request
+MAX_SIMULATION_CELLS = 5_000_000
+
+
+class SimulationError(ValueError):
+    """Raised for a grid that cannot be evaluated"""
+
+
+def axis_values(axis: Optional[SimulationAxis], default: List[float]) -> np.ndarray:
+    """Points of a grid axis (default when the axis is not given)"""
+    if axis is None:
+        return np.asarray(default, dtype=np.float64)
+    if axis.values is not None:
+        return np.asarray(axis.values, dtype=np.float64)
+    if axis.start is None:
+        raise SimulationError("A grid axis needs either values or start")
+    stop = axis.start if axis.stop is None else axis.stop
+    return np.linspace(axis.start, stop, axis.steps)
+
+
+def _items(db: Session, request: MarginSimulationRequest) -> List[Dict]:
+    """Engines and fusion chains to simulate, flagged if they set today's price"""
+    # Agents without a generation type (chain post-processing) price nothing themselves
+    engines = db.query(AiEngine).filter(AiEngine.is_active == True, AiEngine.generation_type != None)
+    if request.engine_ids is not None:
+        engines = engines.filter(AiEngine.id.in_(request.engine_ids))
+    chains = db.query(FusionChain).filter(FusionChain.is_active == True)
+    if request.fusion_chain_ids is not None:
+        chains = chains.filter(FusionChain.id.in_(request.fusion_chain_ids))
+
+    items = []
+    priced_types = set()
+    # Same precedence as get_generation_price: a chain, else the first engine
+    for chain in chains.order_by(FusionChain.id):
+        items.append({
+            "kind": "fusion_chain",
+            "id": chain.id,
+            "name": chain.name,
+            "generation_type": chain.generation_type,
+            "base_cost_usd": chain.total_cost_usd,
+            "markup_percentage": chain.markup_percentage,
+            "sets_price": chain.generation_type not in priced_types
+        })
+        priced_types.add(chain.generation_type)
+    for engine in engines.order_by(AiEngine.id):
+        items.append({
+            "kind": "engine",
+            "id": engine.id,
+            "name": engine.name,
+            "generation_type": engine.generation_type,
+            "base_cost_usd": engine.internal_cost_usd_per_unit,
+            "markup_percentage": engine.markup_percentage,
+            "sets_price": engine.generation_type not in priced_types
+        })
+        priced_types.add(engine.generation_type)
+    return items
+
+
+def _volumes(db: Session, days: int) -> Dict:
+    """Completed generations per type over the last `days` days"""
+    rows = db.query(Generation.type, func.count(Generation.id)).filter(
+        Generation.status == "completed",
+        Generation.created_at >= datetime.utcnow() - timedelta(days=days)
+    ).group_by(Generation.type).all()
+    return dict(rows)
+
+
+def _surface(values: np.ndarray) -> list:
+    return np.round(values, 2).tolist()
+
+
+def simulate_margins(db: Session, request: MarginSimulationRequest) -> Dict:
+    """Evaluate the request's grid; raises SimulationError for unusable grids"""
+    started = time.perf_counter()
+    current_rate = get_exchange_rate(db)
+    items = _items(db, request)
+    if not items:
+        raise SimulationError("No active engines or fusion chains selected")
+
+    rates = axis_values(request.exchange_rates, [current_rate])
+    multipliers = axis_values(request.cost_multipliers, [1.0])
+    sweep_markups = request.markup_percentages is not None
+    if sweep_markups:
+        markups = axis_values(request.markup_percentages, [])
+    else:
+        markups = np.array([item["markup_percentage"] for item in items], dtype=np.float64)
+
+    cells = len(items) * rates.size * (markups.size if sweep_markups else 1) * multipliers.size
+    if cells > MAX_SIMULATION_CELLS:
+        raise SimulationError(f"Grid too large: {cells} points, maximum {MAX_SIMULATION_CELLS}")
+    if (rates <= 0).any() or (multipliers < 0).any() or (markups < 0).any():
+        raise SimulationError("Exchange rates must be positive, markups and cost multipliers non-negative")
+
+    # Axes: (item, exchange rate, markup, cost multiplier)
+    base_cost = np.array([item["base_cost_usd"] for item in items], dtype=np.float64)
+    cost_rub = (base_cost[:, None, None, None] * rates[None, :, None, None]) * multipliers[None, None, None, :]
+    if sweep_markups:
+        markup_factor = (1 + markups / 100)[None, None, :, None]
+    else:
+        markup_factor = (1 + markups / 100)[:, None, None, None]
+    price = np.ceil(cost_rub * markup_factor)
+    profit = price - cost_rub
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = np.where(price > 0, profit / np.where(price > 0, price, 1) * 100, 0.0)
+
+    # Break-even of today's prices: where the API cost reaches the price
+    current_price = np.array([
+        calculate_final_price(item["base_cost_usd"], item["markup_percentage"], current_rate) for item in items
+    ], dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        break_even_rate = current_price[:, None] / (base_cost[:, None] * multipliers[None, :])
+        break_even_multiplier = current_price / (base_cost * current_rate)
+
+    volumes = _volumes(db, request.volume_days)
+    weights = np.array([
+        volumes.get(item["generation_type"], 0) if item["sets_price"] else 0 for item in items
+    ], dtype=np.float64)
+    if not weights.any():
+        # No recent volume: every price-setting item counts once
+        weights = np.array([1.0 if item["sets_price"] else 0.0 for item in items])
+    weighted_profit = np.tensordot(weights, profit, axes=1)
+    weighted_revenue = np.tensordot(weights, price, axes=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        portfolio_margin = np.where(
+            weighted_revenue > 0, weighted_profit / np.where(weighted_revenue > 0, weighted_revenue, 1) * 100, 0.0
+        )
+
+    def finite(value: float) -> Optional[float]:
+        return round(float(value), 4) if np.isfinite(value) else None
+
+    results = []
+    for index, item in enumerate(items):
+        result = {
+            "kind": item["kind"],
+            "id": item["id"],
+            "name": item["name"],
+            "generation_type": item["generation_type"].value,
+            "sets_price": item["sets_price"],
+            "base_cost_usd": item["base_cost_usd"],
+            "markup_percentage": item["markup_percentage"],
+            "current_price_rub": int(current_price[index]),
+            "break_even_exchange_rate": [finite(value) for value in break_even_rate[index]],
+            "break_even_cost_multiplier": finite(break_even_multiplier[index]),
+            "min_margin_percentage": round(float(margin[index].min()), 2),
+            "max_margin_percentage": round(float(margin[index].max()), 2)
+        }
+        if request.include_surfaces:
+            result["margin_percentage"] = _surface(margin[index])
+        results.append(result)
+
+    portfolio = {
+        "weights": {
+            f"{item['kind']}:{item['id']}": float(weight) for item, weight in zip(items, weights) if weight
+        },
+        "min_margin_percentage": round(float(portfolio_margin.min()), 2),
+        "max_margin_percentage": round(float(portfolio_margin.max()), 2)
+    }
+    if request.include_surfaces:
+        portfolio["margin_percentage"] = _surface(portfolio_margin)
+        portfolio["profit_rub"] = _surface(weighted_profit)
+
+    return {
+        "axes": {
+            "exchange_rates": rates.tolist(),
+            # null: each item keeps its own markup (axis of length 1)
+            "markup_percentages": markups.tolist() if sweep_markups else None,
+            "cost_multipliers": multipliers.tolist()
+        },
+        "surface_shape": ["exchange_rate", "markup_percentage", "cost_multiplier"],
+        "current_exchange_rate": current_rate,
+        "items": results,
+        "portfolio": portfolio,
+        "points": cells,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
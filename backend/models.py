@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, ForeignKey, Enum, Text
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, DateTime, Float, Boolean, ForeignKey, Enum, Text, LargeBinary,
+    UniqueConstraint, Index
+)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -28,6 +31,8 @@ class TransactionType(str, enum.Enum):
     CREDIT_USAGE = "credit_usage"
     BONUS = "bonus"
     LIBRARY_UNLOCK = "library_unlock"
+    REFUND = "refund"
+    BUNDLE_PURCHASE = "bundle_purchase"
 
 
 class User(Base):
@@ -39,6 +44,8 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     full_name = Column(String)
     credits_balance = Column(Integer, default=0)
+    credits_held = Column(Integer, nullable=False, default=0)  # Sum of open CreditHold amounts
+    credit_shard_count = Column(Integer, nullable=False, default=0)  # 0 = balance kept in this row only
     subscription_tier = Column(Enum(SubscriptionTier), default=SubscriptionTier.FREE)
     is_active = Column(Boolean, default=True)
     is_admin = Column(Boolean, default=False)
@@ -76,11 +83,64 @@ class Transaction(Base):
     description = Column(String)
     payment_id = Column(String, unique=True, nullable=True)  # ЮKassa payment ID
     status = Column(String, default="pending")  # pending, completed, failed
+    price_snapshot_id = Column(Integer, ForeignKey("price_snapshots.id"), nullable=True)  # Prices the charge was based on
     created_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User", back_populates="transactions")
 
 
+class CreditHold(Base):
+    """
+    Credits reserved for work in progress (hold -> capture / release).
+    Open holds are subtracted from the available balance; a hold that is
+    neither captured nor released by expires_at is released automatically.
+    """
+    __tablename__ = "credit_holds"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    generation_id = Column(Integer, ForeignKey("generations.id"), nullable=True, index=True)
+    amount = Column(Integer, nullable=False)
+    captured_amount = Column(Integer, nullable=True)
+    status = Column(String, default="open", index=True)  # open, captured, released
+    sharded = Column(Boolean, nullable=False, default=False)  # Amount was taken out of credit shards
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    settled_at = Column(DateTime, nullable=True)
+
+
+class IdempotencyKey(Base):
+    """
+    Stored response of a request sent with an Idempotency-Key header,
+    replayed to retries of the same request (see idempotency.py).
+    """
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # sha256 of method, path and payload
+    status = Column(String, default="in_progress")  # in_progress, completed
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class CreditShard(Base):
+    """
+    One sub-counter of a sharded account balance (see credit_shards.py).
+    """
+    __tablename__ = "credit_shards"
+    __table_args__ = (UniqueConstraint("user_id", "shard_no", name="uq_credit_shards_user_shard"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    shard_no = Column(Integer, nullable=False)
+    balance = Column(Integer, nullable=False, default=0)
+
+
 class Generation(Base):
     __tablename__ = "generations"
     
@@ -91,14 +151,43 @@ class Generation(Base):
     prompt = Column(Text)
     parameters = Column(Text)  # JSON string
     result_url = Column(String, nullable=True)
+    result_metadata = Column(Text, nullable=True)  # JSON: engine output details, fusion step timings
     status = Column(String, default="processing")  # processing, completed, failed
     ai_score = Column(Integer, nullable=True)  # For AI scoring
+    price_snapshot_id = Column(Integer, ForeignKey("price_snapshots.id"), nullable=True)  # Price version of `cost`
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
     
     user = relationship("User", back_populates="generations")
 
 
+class GenerationJob(Base):
+    """
+    Durable queue entry for background generation work (Postgres-backed).
+    Workers claim rows with SELECT ... FOR UPDATE SKIP LOCKED and hold a
+    lease that is extended by heartbeats; expired leases are re-queued.
+    """
+    __tablename__ = "generation_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    generation_id = Column(Integer, ForeignKey("generations.id"), unique=True, nullable=False)
+    status = Column(String, default="queued", index=True)  # queued, leased, completed, failed
+    tier = Column(Enum(SubscriptionTier), default=SubscriptionTier.FREE)
+    priority_deadline = Column(DateTime, default=datetime.utcnow, index=True)  # Claim order: earliest first
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    available_at = Column(DateTime, default=datetime.utcnow, index=True)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)  # First claim, for queue wait stats
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    generation = relationship("Generation")
+
+
 class TopCreative(Base):
     __tablename__ = "top_creatives"
     
@@ -114,12 +203,51 @@ class TopCreative(Base):
     views_count = Column(Integer, default=0)
     unlocks_count = Column(Integer, default=0)
     ai_score = Column(Integer, default=85)
+    # Log-space time-decayed activity (approval, views, unlocks), see trending.py
+    trending_score = Column(Float, default=0.0, nullable=False, index=True)
     is_approved = Column(Boolean, default=False)
+    # Closest existing creative with a near-identical prompt, see prompt_dedup.py
+    duplicate_of_id = Column(Integer, ForeignKey("top_creatives.id"), nullable=True, index=True)
+    duplicate_similarity = Column(Float, nullable=True)  # Estimated Jaccard similarity of prompts
     created_at = Column(DateTime, default=datetime.utcnow)
+    # search_vector (tsvector, Postgres only) is generated by the database and
+    # not mapped here, see migration 0014 and creative_search.py
     
     generation = relationship("Generation")
 
 
+class CreativeSignature(Base):
+    """MinHash signature of a library creative's prompt"""
+    __tablename__ = "creative_signatures"
+    
+    creative_id = Column(Integer, ForeignKey("top_creatives.id"), primary_key=True)
+    minhash = Column(LargeBinary, nullable=False)  # NUM_PERM little-endian uint32 values
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class CreativeLshBucket(Base):
+    """LSH band bucket of a creative's signature; creatives sharing a bucket are duplicate candidates"""
+    __tablename__ = "creative_lsh_buckets"
+    __table_args__ = (Index("ix_creative_lsh_buckets_band_bucket", "band", "bucket"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    creative_id = Column(Integer, ForeignKey("top_creatives.id"), nullable=False, index=True)
+    band = Column(Integer, nullable=False)
+    bucket = Column(BigInteger, nullable=False)  # Hash of the band's rows
+
+
+class LibraryUnlock(Base):
+    """A user's paid access to a library creative's details; one row per user and creative"""
+    __tablename__ = "library_unlocks"
+    __table_args__ = (UniqueConstraint("user_id", "creative_id", name="uq_library_unlocks_user_creative"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    creative_id = Column(Integer, ForeignKey("top_creatives.id"), nullable=False)
+    cost = Column(Integer, nullable=False, default=0)  # Credits paid
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class PricingConfig(Base):
     __tablename__ = "pricing_config"
     
@@ -176,6 +304,13 @@ class AiEngine(Base):
     markup_percentage = Column(Float, nullable=False, default=300.0)  # Наценка в процентах (300% = x4)
     is_active = Column(Boolean, default=True)
     generation_type = Column(Enum(GenerationType), nullable=True)  # Связь с типом генерации
+    # Изоляция движка: лимит одновременных вызовов и очередь ожидания (bulkhead)
+    max_concurrency = Column(Integer, nullable=False, default=10)
+    max_queue = Column(Integer, nullable=False, default=100)
+    # Circuit breaker: доля ошибок/медленных вызовов, порог латентности, пауза перед пробным вызовом
+    breaker_error_threshold = Column(Float, nullable=False, default=0.5)
+    breaker_latency_ms = Column(Integer, nullable=False, default=30000)
+    breaker_cooldown_seconds = Column(Integer, nullable=False, default=30)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -205,9 +340,40 @@ class FusionChain(Base):
     description = Column(Text)
     generation_type = Column(Enum(GenerationType), nullable=False)  # BRANDED_SET
     chain_config = Column(Text, nullable=False)  # JSON: [{"engine_id": 1, "order": 1}, {"engine_id": 2, "order": 2}]
-    total_cost_usd = Column(Float, nullable=False)  # Суммарная себестоимость всех агентов в цепочке
+    # Суммарная себестоимость: сумма себестоимости агентов шагов + cost_adjustment_usd,
+    # пересчитывается при изменении агентов (см. chain_costs.py)
+    total_cost_usd = Column(Float, nullable=False)
+    cost_adjustment_usd = Column(Float, nullable=False, default=0.0)  # Затраты сверх агентов (постобработка и т.п.)
     markup_percentage = Column(Float, nullable=False, default=250.0)  # Наценка для всей цепочки
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+
+class FusionChainEngine(Base):
+    """
+    Индекс зависимостей агент -> цепочки: сколько шагов цепочки вызывают агента.
+    По нему изменение агента пересчитывает только затронутые цепочки.
+    """
+    __tablename__ = "fusion_chain_engines"
+    __table_args__ = (UniqueConstraint("chain_id", "engine_id", name="uq_fusion_chain_engines_chain_engine"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    chain_id = Column(Integer, ForeignKey("fusion_chains.id"), nullable=False, index=True)
+    engine_id = Column(Integer, ForeignKey("ai_engines.id"), nullable=False, index=True)
+    steps = Column(Integer, nullable=False, default=1)
+
+
+class PriceSnapshot(Base):
+    """
+    Неизменяемая версия прайса: курс USD/RUB и полный расчет цены каждого
+    типа генерации на момент изменения настроек (см. price_table.py).
+    """
+    __tablename__ = "price_snapshots"
+    
+    id = Column(Integer, primary_key=True, index=True)  # Номер версии
+    exchange_rate = Column(Float, nullable=False)
+    prices = Column(Text, nullable=False)  # JSON: {generation_type: {base_cost_usd, ..., requires_subscription}}
+    reason = Column(String, nullable=True)  # Что изменилось
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -5,7 +5,8 @@ import uuid
 from typing import Optional
 from datetime import datetime
 from sqlalchemy.orm import Session
-from models import User, Transaction, Subscription, SubscriptionTier, TransactionType
+from models import User, Subscription, SubscriptionTier, TransactionType
+import credit_ledger
 
 
 # Pricing configuration
@@ -115,21 +116,17 @@ class PaymentMock:
             )
             db.add(subscription)
         
-        # Add subscription credits
+        # Add subscription credits (with transaction record)
         included_credits = SUBSCRIPTION_CREDITS.get(tier_enum, 0)
-        user.credits_balance += included_credits
-        
-        # Create transaction record
-        transaction = Transaction(
-            user_id=user.id,
-            type=TransactionType.SUBSCRIPTION,
-            amount=amount,
-            credits_change=included_credits,
-            description=f"Subscription: {tier_enum.value}",
-            payment_id=payment_id,
-            status="completed"
+        credit_ledger.credit(
+            db,
+            user,
+            included_credits,
+            f"Subscription: {tier_enum.value}",
+            transaction_type=TransactionType.SUBSCRIPTION,
+            payment_amount=amount,
+            payment_id=payment_id
         )
-        db.add(transaction)
         
         db.commit()
         return True
@@ -145,42 +142,26 @@ class PaymentMock:
     ) -> bool:
         """Add credits to user account"""
         total_credits = credits_amount + (credits_amount * bonus_percent // 100)
-        user.credits_balance += total_credits
-        
-        # Create transaction record
-        transaction = Transaction(
-            user_id=user.id,
-            type=TransactionType.CREDIT_PURCHASE,
-            amount=amount,
-            credits_change=total_credits,
-            description=f"Credit purchase: {credits_amount} + {bonus_percent}% bonus",
-            payment_id=payment_id,
-            status="completed"
+        credit_ledger.credit(
+            db,
+            user,
+            total_credits,
+            f"Credit purchase: {credits_amount} + {bonus_percent}% bonus",
+            transaction_type=TransactionType.CREDIT_PURCHASE,
+            payment_amount=amount,
+            payment_id=payment_id
         )
-        db.add(transaction)
         
         db.commit()
         return True
     
     @staticmethod
     def deduct_credits(db: Session, user: User, amount: int, description: str) -> bool:
-        """Deduct credits from user account"""
-        if user.credits_balance < amount:
+        """Deduct credits from user account (commits; see credit_ledger.debit)"""
+        try:
+            credit_ledger.debit(db, user, amount, description)
+        except credit_ledger.InsufficientCreditsError:
             return False
         
-        user.credits_balance -= amount
-        
-        # Create transaction record
-        transaction = Transaction(
-            user_id=user.id,
-            type=TransactionType.CREDIT_USAGE,
-            amount=0,
-            credits_change=-amount,
-            description=description,
-            status="completed"
-        )
-        db.add(transaction)
-        
         db.commit()
         return True
-
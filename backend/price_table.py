@@ -0,0 +1,235 @@
+"""
+Versioned price snapshots and their in-process cache.
+
+Pricing inputs (exchange rate, active fusion chains, active engines and
+PricingConfig flags) change only through the admin API. Every change is
+compiled into an immutable PriceSnapshot row holding the full breakdown of
+every generation type, and the latest snapshot is served from memory as a
+PriceTable: quotes are dictionary lookups, a request reads one table and so
+prices everything from one version, and generations and their transactions
+record the snapshot id, so margin reports read historical prices instead of
+recomputing them. The table also carries the active bundle catalog, so a
+whole cart is quoted from memory (see routers/pricing.py).
+
+Admin writes call pricing_changed() after commit: it records a new snapshot,
+installs it locally and, on Postgres, sends a NOTIFY on PRICING_CHANNEL so
+every other API pod drops its copy and loads the new snapshot on next read.
+Tables older than PRICE_TABLE_TTL_SECONDS are reloaded as well, so a
+notification lost while a listener reconnects (or a bundle edited outside
+the API) only delays a change.
+"""
+import json
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import engine, SessionLocal
+from models import AiEngine, CreativeBundle, FusionChain, GenerationType, PricingConfig, PriceSnapshot
+from pricing_utils import calculate_bundle_price, get_exchange_rate, price_breakdown
+from generation_events import notify_listener
+from config import settings
+from logging_config import logger
+
+PRICING_CHANNEL = "pricing_updates"
+
+# Advisory lock serializing snapshot creation across pods, so the newest
+# snapshot is always compiled after every committed pricing change
+SNAPSHOT_LOCK_KEY = 7316001
+
+
+class PriceTable:
+    """Immutable price version of all generation types"""
+
+    __slots__ = ("snapshot_id", "exchange_rate", "prices", "requires_subscription", "bundles", "built_at")
+
+    def __init__(
+        self,
+        snapshot_id: Optional[int],
+        exchange_rate: float,
+        prices: Dict,
+        requires_subscription: Dict,
+        bundles: Optional[Dict] = None
+    ):
+        self.snapshot_id = snapshot_id
+        self.exchange_rate = exchange_rate
+        self.prices: Mapping[GenerationType, Mapping[str, float]] = MappingProxyType({
+            gen_type: MappingProxyType(price_info) for gen_type, price_info in prices.items()
+        })
+        self.requires_subscription: Mapping[GenerationType, bool] = MappingProxyType(requires_subscription)
+        # Active bundle catalog by id (fixed prices, not part of the snapshot)
+        self.bundles: Mapping[int, Mapping] = MappingProxyType({
+            bundle_id: MappingProxyType(bundle) for bundle_id, bundle in (bundles or {}).items()
+        })
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def from_snapshot(cls, snapshot: PriceSnapshot, bundles: Optional[Dict] = None) -> "PriceTable":
+        prices, flags = {}, {}
+        for type_value, price_info in json.loads(snapshot.prices).items():
+            try:
+                gen_type = GenerationType(type_value)
+            except ValueError:
+                continue
+            flags[gen_type] = price_info.pop("requires_subscription", False)
+            prices[gen_type] = price_info
+        # Types added after the snapshot was taken are free until the next one
+        for gen_type in GenerationType:
+            if gen_type not in prices:
+                prices[gen_type] = price_breakdown(0.0, 0.0, snapshot.exchange_rate)
+                flags[gen_type] = False
+        return cls(snapshot.id, snapshot.exchange_rate, prices, flags, bundles)
+
+    def price(self, generation_type: GenerationType) -> Dict[str, float]:
+        """Price breakdown of a type (a copy, as returned by get_generation_price)"""
+        return dict(self.prices[generation_type])
+
+    def cost(self, generation_type: GenerationType) -> int:
+        """Final price of a type in credits"""
+        return self.prices[generation_type]["final_price_rub"]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            gen_type.value: {**price_info, "requires_subscription": self.requires_subscription[gen_type]}
+            for gen_type, price_info in self.prices.items()
+        })
+
+
+def build_price_table(db: Session) -> PriceTable:
+    """Compile prices of every generation type from the current pricing inputs"""
+    exchange_rate = get_exchange_rate(db)
+
+    chains = {}
+    for chain in db.query(FusionChain).filter(FusionChain.is_active == True).order_by(FusionChain.id):
+        chains.setdefault(chain.generation_type, chain)
+
+    # The primary (first) active engine of a type sets its price
+    engines = {}
+    for ai_engine in db.query(AiEngine).filter(AiEngine.is_active == True).order_by(AiEngine.id):
+        engines.setdefault(ai_engine.generation_type, ai_engine)
+
+    flags = {config.generation_type: bool(config.requires_subscription) for config in db.query(PricingConfig)}
+
+    prices = {}
+    for gen_type in GenerationType:
+        if gen_type in chains:
+            prices[gen_type] = price_breakdown(
+                chains[gen_type].total_cost_usd, chains[gen_type].markup_percentage, exchange_rate
+            )
+        elif gen_type in engines:
+            prices[gen_type] = price_breakdown(
+                engines[gen_type].internal_cost_usd_per_unit, engines[gen_type].markup_percentage, exchange_rate
+            )
+        else:
+            prices[gen_type] = price_breakdown(0.0, 0.0, exchange_rate)
+
+    return PriceTable(
+        None,
+        exchange_rate,
+        prices,
+        {gen_type: flags.get(gen_type.value, False) for gen_type in GenerationType}
+    )
+
+
+def load_bundle_prices(db: Session) -> Dict[int, Dict]:
+    """Active bundles with their final prices"""
+    return {
+        bundle.id: {
+            "id": bundle.id,
+            "name": bundle.name,
+            "generations_config": bundle.generations_config,
+            "base_price": bundle.base_price,
+            "discount_percent": bundle.discount_percent,
+            "final_price": calculate_bundle_price(bundle.base_price, bundle.discount_percent),
+            "requires_subscription": bool(bundle.requires_subscription)
+        }
+        for bundle in db.query(CreativeBundle).filter(CreativeBundle.is_active == True)
+    }
+
+
+def record_snapshot(reason: str, created_by: Optional[int] = None) -> PriceTable:
+    """Compile the current prices into a new snapshot (own session, commits)"""
+    with SessionLocal() as db:
+        if engine.dialect.name == "postgresql":
+            db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SNAPSHOT_LOCK_KEY})
+        table = build_price_table(db)
+        snapshot = PriceSnapshot(
+            exchange_rate=table.exchange_rate,
+            prices=table.to_json(),
+            reason=reason,
+            created_by=created_by
+        )
+        db.add(snapshot)
+        db.commit()
+        logger.info(f"Price snapshot {snapshot.id} recorded: {reason}")
+        return PriceTable.from_snapshot(snapshot, load_bundle_prices(db))
+
+
+def load_snapshot(db: Session, snapshot_id: int) -> Optional[PriceTable]:
+    """A historical price version"""
+    snapshot = db.query(PriceSnapshot).filter(PriceSnapshot.id == snapshot_id).first()
+    return PriceTable.from_snapshot(snapshot) if snapshot else None
+
+
+def _load_latest(db: Session) -> PriceTable:
+    snapshot = db.query(PriceSnapshot).order_by(PriceSnapshot.id.desc()).first()
+    if snapshot is None:
+        return record_snapshot("initial")
+    return PriceTable.from_snapshot(snapshot, load_bundle_prices(db))
+
+
+_table: Optional[PriceTable] = None
+_version = 0  # Bumped on invalidation so a load racing with it is not installed
+_lock = threading.Lock()
+
+
+def get_price_table(db: Session) -> PriceTable:
+    """The current price version, reloaded if it was invalidated or is too old"""
+    global _table
+    table = _table
+    if table is not None and time.monotonic() - table.built_at < settings.PRICE_TABLE_TTL_SECONDS:
+        return table
+
+    with _lock:
+        version = _version
+    table = _load_latest(db)
+    with _lock:
+        if version == _version:
+            _table = table
+    return table
+
+
+def invalidate_price_table() -> None:
+    """Drop this process's table; the next read loads the latest snapshot"""
+    global _table, _version
+    with _lock:
+        _table = None
+        _version += 1
+
+
+def pricing_changed(reason: str, created_by: Optional[int] = None) -> PriceTable:
+    """
+    Call after committing a change to pricing inputs: records a new snapshot,
+    serves it here and makes every process listening on PRICING_CHANNEL
+    drop its table.
+    """
+    global _table, _version
+    table = record_snapshot(reason, created_by)
+    with _lock:
+        _table = table
+        _version += 1
+
+    if engine.dialect.name == "postgresql":
+        try:
+            with engine.begin() as connection:
+                connection.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": PRICING_CHANNEL, "payload": str(table.snapshot_id)}
+                )
+        except Exception as e:
+            logger.warning(f"Failed to publish pricing change: {str(e)}")
+    return table
+
+
+notify_listener.listen(PRICING_CHANNEL, lambda payload: invalidate_price_table())
@@ -42,13 +42,50 @@ def calculate_final_price(
     return math.ceil(final_price)  # Округляем вверх
 
 
+def calculate_bundle_price(base_price: int, discount_percent: int) -> int:
+    """
+    Цена бандла в кредитах со скидкой (округлено вниз).
+    Используется и в расчете корзины, и при покупке.
+    """
+    return int(base_price * (1 - (discount_percent or 0) / 100))
+
+
+def price_breakdown(
+    base_cost_usd: float,
+    markup_percentage: float,
+    exchange_rate: float
+) -> Dict[str, float]:
+    """
+    Полный расчет цены по себестоимости, наценке и курсу
+    (поля описаны в get_generation_price).
+    """
+    cost_rub = base_cost_usd * exchange_rate
+    final_price_rub = calculate_final_price(base_cost_usd, markup_percentage, exchange_rate)
+    profit_rub = final_price_rub - cost_rub
+    profit_percentage = (profit_rub / final_price_rub * 100) if final_price_rub > 0 else 0.0
+    
+    return {
+        "base_cost_usd": base_cost_usd,
+        "exchange_rate": exchange_rate,
+        "cost_rub": cost_rub,
+        "markup_percentage": markup_percentage,
+        "final_price_rub": final_price_rub,
+        "profit_rub": profit_rub,
+        "profit_percentage": profit_percentage
+    }
+
+
 def get_generation_price(
     db: Session,
-    generation_type: GenerationType
+    generation_type: GenerationType,
+    exchange_rate: Optional[float] = None
 ) -> Dict[str, float]:
     """
     Получить полный расчет цены для типа генерации.
     
+    Args:
+        exchange_rate: Курс USD/RUB, если уже получен (иначе читается из БД)
+    
     Returns:
         Dict с полями:
         - base_cost_usd: Себестоимость в USD
@@ -59,7 +96,8 @@ def get_generation_price(
         - profit_rub: Прибыль платформы
         - profit_percentage: Процент прибыли от финальной цены
     """
-    exchange_rate = get_exchange_rate(db)
+    if exchange_rate is None:
+        exchange_rate = get_exchange_rate(db)
     
     # Проверяем, является ли это Fusion-цепочкой
     fusion_chain = db.query(FusionChain).filter(
@@ -72,58 +110,21 @@ def get_generation_price(
         base_cost_usd = fusion_chain.total_cost_usd
         markup_percentage = fusion_chain.markup_percentage
     else:
-        # Для обычной генерации находим соответствующий движок
+        # Для обычной генерации цену задает основной (первый) движок типа;
+        # маршрутизация между несколькими движками на цену не влияет
         engine = db.query(AiEngine).filter(
             AiEngine.generation_type == generation_type,
             AiEngine.is_active == True
-        ).first()
+        ).order_by(AiEngine.id).first()
         
         if not engine:
             # Возвращаем значения по умолчанию, если движок не найден
-            return {
-                "base_cost_usd": 0.0,
-                "exchange_rate": exchange_rate,
-                "cost_rub": 0.0,
-                "markup_percentage": 0.0,
-                "final_price_rub": 0,
-                "profit_rub": 0.0,
-                "profit_percentage": 0.0
-            }
+            return price_breakdown(0.0, 0.0, exchange_rate)
         
         base_cost_usd = engine.internal_cost_usd_per_unit
         markup_percentage = engine.markup_percentage
     
-    cost_rub = base_cost_usd * exchange_rate
-    final_price_rub = calculate_final_price(base_cost_usd, markup_percentage, exchange_rate)
-    profit_rub = final_price_rub - cost_rub
-    profit_percentage = (profit_rub / final_price_rub * 100) if final_price_rub > 0 else 0.0
-    
-    return {
-        "base_cost_usd": base_cost_usd,
-        "exchange_rate": exchange_rate,
-        "cost_rub": cost_rub,
-        "markup_percentage": markup_percentage,
-        "final_price_rub": final_price_rub,
-        "profit_rub": profit_rub,
-        "profit_percentage": profit_percentage
-    }
-
-
-def update_all_generation_prices(db: Session) -> Dict[str, int]:
-    """
-    Пересчитать цены для всех типов генерации.
-    Используется при изменении курса USD/RUB или наценок.
-    
-    Returns:
-        Dict[GenerationType, final_price_rub]
-    """
-    prices = {}
-    
-    for gen_type in GenerationType:
-        price_info = get_generation_price(db, gen_type)
-        prices[gen_type.value] = price_info["final_price_rub"]
-    
-    return prices
+    return price_breakdown(base_cost_usd, markup_percentage, exchange_rate)
 
 
 def calculate_margin_summary(db: Session) -> list:
@@ -0,0 +1,230 @@
+"""
+Near-duplicate prompt detection for library moderation (MinHash + LSH).
+
+Each creative's prompt is reduced to character shingles and summarized by a
+NUM_PERM-value MinHash signature: the share of equal values in two
+signatures estimates the Jaccard similarity of the shingle sets. The
+signature is cut into BANDS bands of ROWS values; each band is hashed into a
+bucket stored in creative_lsh_buckets, indexed by (band, bucket). Creatives
+sharing any bucket are candidates, and only those are compared, so looking
+up a new prompt costs BANDS index probes regardless of library size. With
+16 bands of 8 rows, pairs at DUPLICATE_THRESHOLD (0.8) similarity become
+candidates with ~99.6% probability and pairs below 0.5 rarely do.
+
+index_creative() indexes a creative and flags it as a near-copy
+(duplicate_of_id and duplicate_similarity) in the transaction that creates
+it: POST /api/library/submit and init_db call it. index_missing() is only a
+backfill for rows created any other way (migrated data, manual inserts);
+the API maintenance thread and the queue worker run it periodically. The
+moderation endpoints only read. pending_clusters() groups the moderation
+queue into clusters of near-identical prompts, listing matching library
+creatives that are already approved, so each cluster can be approved or
+rejected in one call.
+"""
+import hashlib
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import and_, tuple_
+from sqlalchemy.orm import Session, aliased
+from models import CreativeLshBucket, CreativeSignature, TopCreative
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+DUPLICATE_THRESHOLD = 0.8
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+# Fixed seed: signatures stored by every process must use the same permutations
+_random = np.random.RandomState(7316)
+_PERM_A = _random.randint(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _random.randint(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingles(prompt: Optional[str]) -> set:
+    """Character SHINGLE_SIZE-grams of the normalized prompt (lowercase words joined by spaces)"""
+    text = " ".join(re.findall(r"\w+", (prompt or "").lower().replace("ё", "е")))
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(prompt: Optional[str]) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32 values) of a prompt"""
+    values = np.array(
+        [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(prompt)],
+        dtype=np.uint64
+    )
+    if values.size == 0:
+        return np.full(NUM_PERM, _MAX_HASH, dtype=np.uint32)
+    # Universal hashing (a * x + b) mod p of every shingle under every permutation
+    with np.errstate(over="ignore"):
+        permuted = ((values[:, None] * _PERM_A + _PERM_B) % _MERSENNE_PRIME) & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def to_bytes(signature: np.ndarray) -> bytes:
+    return signature.astype("<u4").tobytes()
+
+
+def from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype="<u4")
+
+
+def band_buckets(signature: np.ndarray) -> List[Tuple[int, int]]:
+    """(band, bucket) pairs of a signature; buckets are signed 64-bit hashes"""
+    data = to_bytes(signature)
+    width = ROWS * 4
+    return [
+        (band, int.from_bytes(
+            hashlib.blake2b(data[band * width:(band + 1) * width], digest_size=8).digest(), "big", signed=True
+        ))
+        for band in range(BANDS)
+    ]
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the prompts behind two signatures"""
+    return float(np.mean(a == b))
+
+
+def _signatures(db: Session, creative_ids) -> Dict[int, np.ndarray]:
+    if not creative_ids:
+        return {}
+    return {
+        creative_id: from_bytes(data)
+        for creative_id, data in db.query(CreativeSignature.creative_id, CreativeSignature.minhash).filter(
+            CreativeSignature.creative_id.in_(creative_ids)
+        )
+    }
+
+
+def find_duplicates(db: Session, signature: np.ndarray, exclude_id: Optional[int] = None) -> List[Tuple[int, float]]:
+    """Indexed creatives at least DUPLICATE_THRESHOLD similar, most similar first"""
+    candidates = {
+        creative_id for (creative_id,) in db.query(CreativeLshBucket.creative_id).filter(
+            tuple_(CreativeLshBucket.band, CreativeLshBucket.bucket).in_(band_buckets(signature))
+        ).distinct()
+    }
+    candidates.discard(exclude_id)
+
+    matches = [
+        (creative_id, similarity(signature, other))
+        for creative_id, other in _signatures(db, candidates).items()
+    ]
+    return sorted(
+        [(creative_id, score) for creative_id, score in matches if score >= DUPLICATE_THRESHOLD],
+        key=lambda match: (-match[1], match[0])
+    )
+
+
+def index_creative(db: Session, creative: TopCreative) -> Optional[Tuple[int, float]]:
+    """
+    Index a creative's prompt and flag it as a duplicate of the most similar
+    indexed creative, if any. The creative must be flushed. Does not commit;
+    returns (duplicate_of_id, similarity) or None.
+    """
+    signature = minhash(creative.prompt)
+    duplicates = find_duplicates(db, signature, exclude_id=creative.id)
+
+    db.query(CreativeLshBucket).filter(CreativeLshBucket.creative_id == creative.id).delete(synchronize_session=False)
+    db.query(CreativeSignature).filter(CreativeSignature.creative_id == creative.id).delete(synchronize_session=False)
+    db.add(CreativeSignature(creative_id=creative.id, minhash=to_bytes(signature)))
+    db.add_all([
+        CreativeLshBucket(creative_id=creative.id, band=band, bucket=bucket)
+        for band, bucket in band_buckets(signature)
+    ])
+
+    if duplicates:
+        creative.duplicate_of_id, creative.duplicate_similarity = duplicates[0][0], round(duplicates[0][1], 4)
+    else:
+        creative.duplicate_of_id, creative.duplicate_similarity = None, None
+    db.flush()
+    return duplicates[0] if duplicates else None
+
+
+def index_missing(db: Session, limit: int = 500) -> int:
+    """Index up to `limit` creatives without a signature, oldest first. Does not commit."""
+    creatives = db.query(TopCreative).outerjoin(
+        CreativeSignature, CreativeSignature.creative_id == TopCreative.id
+    ).filter(CreativeSignature.creative_id == None).order_by(TopCreative.id).limit(limit).all()
+    for creative in creatives:
+        index_creative(db, creative)
+    return len(creatives)
+
+
+def pending_clusters(db: Session) -> List[Dict]:
+    """
+    The moderation queue grouped into clusters of near-identical prompts (or
+    copies of the same library creative), largest first. Each cluster lists
+    its pending creatives and the approved library creatives they duplicate.
+    """
+    pending = db.query(TopCreative).filter(
+        TopCreative.is_approved == False
+    ).order_by(TopCreative.created_at.desc()).all()
+    if not pending:
+        return []
+    pending_ids = {creative.id for creative in pending}
+
+    # Candidate pairs: pending creatives sharing an LSH bucket with any creative
+    own, other = aliased(CreativeLshBucket), aliased(CreativeLshBucket)
+    pairs = db.query(own.creative_id, other.creative_id).join(
+        other, and_(own.band == other.band, own.bucket == other.bucket, own.creative_id != other.creative_id)
+    ).filter(own.creative_id.in_(pending_ids)).distinct().all()
+
+    signatures = _signatures(db, pending_ids | {creative_id for _, creative_id in pairs})
+    parent = {creative_id: creative_id for creative_id in pending_ids}
+
+    def root(creative_id: int) -> int:
+        while parent[creative_id] != creative_id:
+            parent[creative_id] = parent[parent[creative_id]]
+            creative_id = parent[creative_id]
+        return creative_id
+
+    library_matches: Dict[int, Dict[int, float]] = {}
+    for creative_id, other_id in pairs:
+        if creative_id not in signatures or other_id not in signatures:
+            continue
+        score = similarity(signatures[creative_id], signatures[other_id])
+        if score < DUPLICATE_THRESHOLD:
+            continue
+        if other_id in pending_ids:
+            parent[root(other_id)] = root(creative_id)
+        else:
+            library_matches.setdefault(creative_id, {})[other_id] = score
+
+    # Copies of the same library creative are one cluster too
+    copies: Dict[int, int] = {}
+    for creative_id, matches in library_matches.items():
+        for other_id in matches:
+            if other_id in copies:
+                parent[root(creative_id)] = root(copies[other_id])
+            else:
+                copies[other_id] = creative_id
+
+    clusters: Dict[int, Dict] = {}
+    for creative in pending:
+        cluster = clusters.setdefault(root(creative.id), {"creatives": [], "library_matches": {}})
+        cluster["creatives"].append(creative)
+        for other_id, score in library_matches.get(creative.id, {}).items():
+            cluster["library_matches"][other_id] = max(score, cluster["library_matches"].get(other_id, 0.0))
+
+    result = []
+    for cluster in clusters.values():
+        creatives = cluster["creatives"]
+        result.append({
+            "cluster_id": min(creative.id for creative in creatives),
+            "size": len(creatives),
+            "creative_ids": [creative.id for creative in creatives],
+            "creatives": creatives,
+            "library_matches": [
+                {"creative_id": creative_id, "similarity": round(score, 4)}
+                for creative_id, score in sorted(cluster["library_matches"].items(), key=lambda item: -item[1])
+            ]
+        })
+    # Biggest batches of moderation work first
+    result.sort(key=lambda cluster: (-cluster["size"], -len(cluster["library_matches"]), cluster["cluster_id"]))
+    return result
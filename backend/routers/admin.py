@@ -6,9 +6,19 @@ from datetime import datetime, timedelta
 from database import get_db
 from models import (
     User, Subscription, Transaction, Generation, TopCreative,
-    PricingConfig, CreditPackage, SubscriptionTier
+    PricingConfig, CreditPackage, SubscriptionTier, CreativeSignature, CreativeLshBucket
 )
+from schemas import CreativeModerationRequest, ModerationAction
 from auth import get_admin_user
+from generation_cache import generation_cache
+from library_snapshots import library_changed
+from trending import APPROVAL_WEIGHT, activity_score, log_add
+from prompt_dedup import pending_clusters
+from generation_runner import generation_executor
+from job_queue import wait_time_stats
+from config import settings
+import credit_ledger
+import credit_shards
 
 router = APIRouter(prefix="/api/admin", tags=["Admin"])
 
@@ -111,6 +121,11 @@ def update_user_credits(
             detail="User not found"
         )
     
+    # A sharded balance is folded back into the user row first, then re-spread
+    shard_count = user.credit_shard_count
+    if shard_count:
+        credit_shards.disable(db, user)
+    
     old_balance = user.credits_balance
     user.credits_balance = credits
     
@@ -125,10 +140,54 @@ def update_user_credits(
     )
     db.add(transaction)
     
+    if shard_count:
+        db.flush()
+        credit_shards.enable(db, user, shard_count)
+    
     db.commit()
     db.refresh(user)
     
-    return {"user_id": user.id, "new_balance": user.credits_balance}
+    return {"user_id": user.id, "new_balance": credit_ledger.refresh_balance(db, user)}
+
+
+@router.patch("/users/{user_id}/credit-shards")
+def update_user_credit_shards(
+    user_id: int,
+    shards: int,
+    admin_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Switch an account to sharded credit counters (shards > 1 spreads parallel
+    debits over that many rows) or back to a single balance row (shards = 0).
+    """
+    user = db.query(User).filter(User.id == user_id).first()
+    
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
+    if shards:
+        try:
+            credit_shards.enable(db, user, shards)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+    else:
+        credit_shards.disable(db, user)
+    
+    db.commit()
+    db.refresh(user)
+    
+    return {
+        "user_id": user.id,
+        "credit_shards": user.credit_shard_count,
+        "balance": credit_ledger.refresh_balance(db, user)
+    }
 
 
 @router.get("/pricing-config")
@@ -206,7 +265,7 @@ def get_pending_creatives(
     admin_user: User = Depends(get_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Get creatives pending moderation"""
+    """Get creatives pending moderation (duplicate_of_id flags near-copies of another creative's prompt)"""
     pending = db.query(TopCreative).filter(
         TopCreative.is_approved == False
     ).order_by(TopCreative.created_at.desc()).all()
@@ -214,6 +273,60 @@ def get_pending_creatives(
     return pending
 
 
+@router.get("/top-creatives/pending/clusters")
+def get_pending_creative_clusters(
+    admin_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Creatives pending moderation grouped by near-identical prompts, largest
+    clusters first, with the approved creatives each cluster duplicates.
+    Moderate a whole cluster with POST /top-creatives/moderate.
+    """
+    return pending_clusters(db)
+
+
+@router.post("/top-creatives/moderate")
+def moderate_creatives(
+    moderation: CreativeModerationRequest,
+    admin_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Approve or reject pending creatives in bulk (e.g. a duplicate cluster).
+    Rejected creatives are deleted; already approved ones are left untouched.
+    """
+    creatives = db.query(TopCreative).filter(
+        TopCreative.id.in_(set(moderation.creative_ids)),
+        TopCreative.is_approved == False
+    ).all()
+    creative_ids = [creative.id for creative in creatives]
+    
+    if moderation.action == ModerationAction.APPROVE:
+        for creative in creatives:
+            creative.trending_score = log_add(TopCreative.trending_score, activity_score(APPROVAL_WEIGHT))
+            creative.is_approved = True
+        db.commit()
+        if creative_ids:
+            library_changed()
+        return {"approved": len(creative_ids), "creative_ids": creative_ids}
+    
+    if creative_ids:
+        db.query(TopCreative).filter(TopCreative.duplicate_of_id.in_(creative_ids)).update(
+            {TopCreative.duplicate_of_id: None, TopCreative.duplicate_similarity: None},
+            synchronize_session=False
+        )
+        db.query(CreativeLshBucket).filter(CreativeLshBucket.creative_id.in_(creative_ids)).delete(
+            synchronize_session=False
+        )
+        db.query(CreativeSignature).filter(CreativeSignature.creative_id.in_(creative_ids)).delete(
+            synchronize_session=False
+        )
+        db.query(TopCreative).filter(TopCreative.id.in_(creative_ids)).delete(synchronize_session=False)
+    db.commit()
+    return {"rejected": len(creative_ids), "creative_ids": creative_ids}
+
+
 @router.patch("/top-creatives/{creative_id}/approve")
 def approve_creative(
     creative_id: int,
@@ -229,13 +342,59 @@ def approve_creative(
             detail="Creative not found"
         )
     
+    if not creative.is_approved:
+        # Entering the library counts as fresh activity for trending
+        creative.trending_score = log_add(TopCreative.trending_score, activity_score(APPROVAL_WEIGHT))
     creative.is_approved = True
     db.commit()
     db.refresh(creative)
     
+    # Rebuild the public top-creatives lists on every pod
+    library_changed()
+    
     return creative
 
 
+@router.get("/generation-cache/stats")
+def get_generation_cache_stats(
+    admin_user: User = Depends(get_admin_user)
+):
+    """Get generation result cache hit rates per generation type (this instance)"""
+    return {
+        "enabled": settings.GENERATION_CACHE_ENABLED,
+        "entries": len(generation_cache),
+        "max_entries": generation_cache.max_entries,
+        "ttl_seconds": generation_cache.ttl_seconds,
+        "by_type": generation_cache.stats()
+    }
+
+
+@router.delete("/generation-cache", status_code=status.HTTP_204_NO_CONTENT)
+def clear_generation_cache(
+    admin_user: User = Depends(get_admin_user)
+):
+    """Drop all cached generation results and reset hit counters"""
+    generation_cache.clear()
+    return None
+
+
+@router.get("/generation-queue/stats")
+def get_generation_queue_stats(
+    admin_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Queue wait times per subscription tier.
+    "executor" covers this instance's in-process scheduler, "postgres" the
+    shared job queue over the last hour.
+    """
+    return {
+        "backend": settings.GENERATION_QUEUE_BACKEND,
+        "executor": generation_executor.stats(),
+        "postgres": wait_time_stats(db)
+    }
+
+
 @router.get("/alerts")
 def get_alerts(
     admin_user: User = Depends(get_admin_user),
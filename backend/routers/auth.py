@@ -14,6 +14,7 @@ from auth import (
     get_current_active_user
 )
 from config import settings
+import credit_ledger
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 limiter = Limiter(key_func=get_remote_address)
@@ -90,7 +91,12 @@ def login(request: Request, response: Response, form_data: OAuth2PasswordRequest
 
 
 @router.get("/me", response_model=UserResponse)
-def get_current_user_info(current_user: User = Depends(get_current_active_user)):
+def get_current_user_info(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
     """Get current user information"""
+    if current_user.credit_shard_count:
+        credit_ledger.refresh_balance(db, current_user)
     return current_user
 
@@ -1,13 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import json
 from database import get_db
-from models import User, CreativeBundle, Generation, GenerationType
+from models import User, CreativeBundle, Generation, GenerationType, TransactionType
 from schemas import CreativeBundleResponse, BundlePurchaseRequest
 from auth import get_current_active_user, has_premium_access
 from ai_mock import AIMock, get_generation_cost
-from payment_mock import PaymentMock
+from pricing_utils import calculate_bundle_price
+from price_table import get_price_table
+import credit_ledger
+from credit_ledger import InsufficientCreditsError
+from idempotency import IdempotencyScope, idempotency_key_header, request_fingerprint
 from datetime import datetime
 from logging_config import logger
 
@@ -32,7 +36,7 @@ def get_available_bundles(
             "generations_config": bundle.generations_config,
             "base_price": bundle.base_price,
             "discount_percent": bundle.discount_percent,
-            "final_price": int(bundle.base_price * (1 - bundle.discount_percent / 100)),
+            "final_price": calculate_bundle_price(bundle.base_price, bundle.discount_percent),
             "requires_subscription": bundle.requires_subscription,
             "is_active": bundle.is_active
         }
@@ -43,11 +47,24 @@ def get_available_bundles(
 
 @router.post("/purchase/{bundle_id}")
 def purchase_bundle(
+    request: Request,
     bundle_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Depends(idempotency_key_header)
 ):
-    """Purchase a creative bundle and automatically create generations"""
+    """
+    Purchase a creative bundle and automatically create generations.
+    Retries with the same Idempotency-Key get the first response back.
+    """
+    with IdempotencyScope(db, current_user.id, idempotency_key, request_fingerprint(request)) as scope:
+        if scope.replay:
+            return scope.replay
+        return scope.store(status.HTTP_200_OK, purchase_bundle_for_user(db, current_user, bundle_id))
+
+
+def purchase_bundle_for_user(db: Session, current_user: User, bundle_id: int) -> dict:
+    """Charge the bundle price and create its placeholder generations"""
     
     # Get bundle
     bundle = db.query(CreativeBundle).filter(
@@ -69,16 +86,19 @@ def purchase_bundle(
         )
     
     # Calculate final price
-    final_price = int(bundle.base_price * (1 - bundle.discount_percent / 100))
+    final_price = calculate_bundle_price(bundle.base_price, bundle.discount_percent)
     
     # Check credits
-    if current_user.credits_balance < final_price:
+    available = credit_ledger.available_credits(db, current_user)
+    if available < final_price:
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail=f"Insufficient credits. Required: {final_price}, Available: {current_user.credits_balance}"
+            detail=f"Insufficient credits. Required: {final_price}, Available: {available}"
         )
     
     try:
+        price_snapshot_id = get_price_table(db).snapshot_id
+        
         # Parse generations config
         generations_config = json.loads(bundle.generations_config)
         
@@ -95,24 +115,21 @@ def purchase_bundle(
                     cost=0,  # Already paid via bundle
                     prompt=f"Bundle: {bundle.name}",
                     status="pending",  # User will fill details later
+                    price_snapshot_id=price_snapshot_id
                 )
                 db.add(generation)
                 created_generations.append(generation)
         
-        # Deduct credits
-        success = PaymentMock.deduct_credits(
+        # Deduct credits; committed together with the generations
+        credit_ledger.debit(
             db,
             current_user,
             final_price,
-            f"Bundle purchase: {bundle.name}"
+            f"Bundle purchase: {bundle.name}",
+            transaction_type=TransactionType.BUNDLE_PURCHASE,
+            price_snapshot_id=price_snapshot_id
         )
         
-        if not success:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to deduct credits"
-            )
-        
         db.commit()
         
         logger.info(f"User {current_user.id} purchased bundle {bundle.id} for {final_price} credits")
@@ -130,6 +147,12 @@ def purchase_bundle(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Invalid bundle configuration"
         )
+    except InsufficientCreditsError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=str(e)
+        )
     except Exception as e:
         db.rollback()
         logger.error(f"Error purchasing bundle: {str(e)}")
@@ -1,153 +1,461 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from database import get_db
-from models import User, Generation, GenerationType, PricingConfig
-from schemas import GenerationRequest, GenerationResponse
+from models import User, Generation, GenerationType
+from schemas import GenerationRequest, GenerationResponse, BatchGenerationRequest, BatchGenerationResponse
 from auth import get_current_active_user, has_premium_access
-from ai_mock import AIMock, get_generation_cost, is_premium_feature
-from payment_mock import PaymentMock
-from pricing_utils import get_generation_price
+from price_table import get_price_table
+from engine_adapters import get_engine_adapter
+from engine_resilience import EngineUnavailableError
+import credit_ledger
+from credit_ledger import InsufficientCreditsError
+from generation_runner import (
+    run_engine, generate_with_adapter, complete_generation, dump_result_metadata,
+    generation_executor, QueueFullError
+)
+from job_queue import enqueue_generation
+from idempotency import IdempotencyScope, idempotency_key_header, request_fingerprint
+from generation_events import (
+    broker, generation_event, publish_generation_status, progress_reporter, make_progress_reporter
+)
+from config import settings
 from datetime import datetime
+import asyncio
+import json
 
 router = APIRouter(prefix="/api/generation", tags=["Generation"])
 limiter = Limiter(key_func=get_remote_address)
 
 
-@router.post("/create", response_model=GenerationResponse, status_code=status.HTTP_201_CREATED)
-@limiter.limit("60/hour")
-def create_generation(
-    request: Request,
-    gen_request: GenerationRequest,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Create a new content generation request"""
+def prepare_generation(db: Session, current_user: User, gen_request: GenerationRequest) -> Generation:
+    """Check access and credits, then build the generation record"""
     
-    # Check if feature requires premium subscription
-    pricing_config = db.query(PricingConfig).filter(
-        PricingConfig.generation_type == gen_request.type.value
-    ).first()
+    price_table = get_price_table(db)
     
-    if pricing_config and pricing_config.requires_subscription and not has_premium_access(current_user):
+    # Check if feature requires premium subscription
+    if price_table.requires_subscription[gen_request.type] and not has_premium_access(current_user):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="This feature requires an active subscription"
         )
     
     # Get generation cost using dynamic pricing
-    price_info = get_generation_price(db, gen_request.type)
-    cost = price_info["final_price_rub"]
+    cost = price_table.cost(gen_request.type)
     
-    # Check if user has enough credits
-    if current_user.credits_balance < cost:
+    # Check if user has enough credits (not reserved by running generations)
+    available = credit_ledger.available_credits(db, current_user)
+    if available < cost:
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail=f"Insufficient credits. Required: {cost}, Available: {current_user.credits_balance}"
+            detail=f"Insufficient credits. Required: {cost}, Available: {available}"
         )
     
-    # Create generation record
-    generation = Generation(
+    return Generation(
         user_id=current_user.id,
         type=gen_request.type,
         cost=cost,
         prompt=gen_request.prompt,
-        parameters=str(gen_request.parameters) if gen_request.parameters else None,
-        status="processing"
+        parameters=json.dumps(gen_request.parameters) if gen_request.parameters else None,
+        status="processing",
+        price_snapshot_id=price_table.snapshot_id
     )
+
+
+def reserve_credits(db: Session, current_user: User, generation: Generation, amount: int) -> None:
+    """Place a credit hold for a flushed generation; 402 if the balance no longer covers it"""
+    try:
+        credit_ledger.place_hold(db, current_user, amount, generation)
+    except InsufficientCreditsError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=str(e)
+        )
+
+
+def generation_body(generation: Generation) -> dict:
+    """JSON body of a generation, as stored for idempotent replays"""
+    return GenerationResponse.model_validate(generation).model_dump(mode="json")
+
+
+def start_generation(db: Session, current_user: User, gen_request: GenerationRequest) -> Generation:
+    """Create a processing generation and hold its cost (commits)"""
+    generation = prepare_generation(db, current_user, gen_request)
     
     db.add(generation)
+    db.flush()
+    reserve_credits(db, current_user, generation, generation.cost)
+    publish_generation_status(db, generation)
     db.commit()
     db.refresh(generation)
+    return generation
+
+
+def finish_generation(db: Session, generation: Generation, current_user: User, result: dict) -> None:
+    """Store the result and capture the hold (commits)"""
+    complete_generation(db, generation, current_user, result)
+    db.refresh(generation)
+
+
+def fail_generation(db: Session, generation: Generation, error: Exception) -> None:
+    """Mark a generation failed and release its hold (commits)"""
+    db.rollback()
+    generation.status = "failed"
+    credit_ledger.release_generation_hold(db, generation.id)
+    publish_generation_status(db, generation, detail=str(error))
+    db.commit()
+
+
+async def run_generation(db: Session, current_user: User, gen_request: GenerationRequest) -> Generation:
+    """
+    Create a generation and run its engine within the request.
+    Database work runs in the threadpool; only the engine call is awaited
+    on the event loop.
+    """
+    generation = await run_in_threadpool(start_generation, db, current_user, gen_request)
     
     # Process generation based on type
+    progress_reporter.set(make_progress_reporter(generation))
     try:
-        if gen_request.type == GenerationType.STATIC_IMAGE:
-            result = AIMock.generate_static_image(gen_request.prompt or "", gen_request.parameters)
-        
-        elif gen_request.type == GenerationType.ANIMATED_IMAGE:
-            result = AIMock.generate_animated_image(gen_request.prompt or "", gen_request.parameters)
-        
-        elif gen_request.type == GenerationType.VIDEO_MORPH:
-            params = gen_request.parameters or {}
-            result = AIMock.generate_video_morph(
-                params.get("start_image", ""),
-                params.get("end_image", ""),
-                params
-            )
-        
-        elif gen_request.type == GenerationType.CONTEXTUAL_PHOTO:
-            params = gen_request.parameters or {}
-            result = AIMock.generate_contextual_photo(
-                params.get("url", ""),
-                gen_request.prompt or "",
-                params
-            )
-        
-        elif gen_request.type == GenerationType.AI_SCORING:
-            params = gen_request.parameters or {}
-            result = AIMock.analyze_conversion_score(
-                params.get("image_url", ""),
-                params
-            )
-            generation.ai_score = result.get("score")
-        
-        elif gen_request.type == GenerationType.VECTOR_CREATIVE:
-            # Новый тип: Векторный креатив (Recraft.ai)
-            result = {
-                "url": f"https://mock-storage.example.com/vector/{generation.id}.svg",
-                "format": "SVG",
-                "scalable": True,
-                "message": "Векторный креатив сгенерирован через Recraft.ai"
-            }
-        
-        elif gen_request.type == GenerationType.BRANDED_SET:
-            # Новый тип: Брендовый Сет (Fusion)
-            result = {
-                "url": f"https://mock-storage.example.com/branded-set/{generation.id}/",
-                "creatives": [
-                    f"https://mock-storage.example.com/branded-set/{generation.id}/creative_1.svg",
-                    f"https://mock-storage.example.com/branded-set/{generation.id}/creative_2.svg",
-                    f"https://mock-storage.example.com/branded-set/{generation.id}/creative_3.svg"
-                ],
-                "message": "Брендовый Сет из 3 креативов в едином стиле (Recraft.ai + Brand Colors)"
-            }
-        
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid generation type"
-            )
-        
-        # Update generation record with result
-        generation.result_url = result.get("url", "")
-        generation.status = "completed"
-        generation.completed_at = datetime.utcnow()
-        
-        # Deduct credits only after successful generation
-        PaymentMock.deduct_credits(
+        result = await run_engine(
             db,
-            current_user,
-            cost,
-            f"{gen_request.type.value} generation"
+            gen_request.type,
+            gen_request.prompt,
+            gen_request.parameters,
+            generation.id
         )
+        await run_in_threadpool(finish_generation, db, generation, current_user, result)
         
+    except InsufficientCreditsError as e:
+        await run_in_threadpool(fail_generation, db, generation, e)
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=str(e)
+        )
+    except Exception as e:
+        await run_in_threadpool(fail_generation, db, generation, e)
+        raise HTTPException(
+            status_code=(
+                status.HTTP_503_SERVICE_UNAVAILABLE if isinstance(e, EngineUnavailableError)
+                else status.HTTP_500_INTERNAL_SERVER_ERROR
+            ),
+            detail=f"Generation failed: {str(e)}"
+        )
+    
+    return generation
+
+
+@router.post("/create", response_model=GenerationResponse, status_code=status.HTTP_201_CREATED)
+@limiter.limit("60/hour")
+async def create_generation(
+    request: Request,
+    gen_request: GenerationRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Depends(idempotency_key_header)
+):
+    """
+    Create a new content generation request and wait for the result.
+    The cost is held while the engine runs and captured on success.
+    Retries with the same Idempotency-Key get the first response back.
+    """
+    fingerprint = request_fingerprint(request, gen_request)
+    async with IdempotencyScope(db, current_user.id, idempotency_key, fingerprint) as scope:
+        if scope.replay:
+            return scope.replay
+        generation = await run_generation(db, current_user, gen_request)
+        return await scope.store_async(status.HTTP_201_CREATED, generation_body(generation))
+
+
+def enqueue_submitted_generation(db: Session, current_user: User, gen_request: GenerationRequest) -> Generation:
+    """Create a pending generation and hand it to the configured background queue"""
+    generation = prepare_generation(db, current_user, gen_request)
+    generation.status = "pending"
+    
+    db.add(generation)
+    db.flush()
+    reserve_credits(db, current_user, generation, generation.cost)
+    publish_generation_status(db, generation)
+    
+    if settings.GENERATION_QUEUE_BACKEND == "postgres":
+        # Durable queue: the job row is committed atomically with the generation
+        enqueue_generation(db, generation, current_user.subscription_tier)
         db.commit()
         db.refresh(generation)
-        
-    except Exception as e:
+        return generation
+    
+    db.commit()
+    db.refresh(generation)
+    
+    try:
+        generation_executor.submit(generation.id, current_user.id, current_user.subscription_tier)
+    except QueueFullError:
         generation.status = "failed"
+        credit_ledger.release_generation_hold(db, generation.id)
+        publish_generation_status(db, generation, detail="Generation queue is full")
         db.commit()
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Generation failed: {str(e)}"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Generation queue is full, please retry later"
         )
     
     return generation
 
 
+@router.post("/submit", response_model=GenerationResponse, status_code=status.HTTP_202_ACCEPTED)
+@limiter.limit("60/hour")
+def submit_generation(
+    request: Request,
+    gen_request: GenerationRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Depends(idempotency_key_header)
+):
+    """
+    Accept a generation request and run it in the background.
+    Returns immediately; follow progress via GET /api/generation/events
+    (or poll GET /api/generation/{id}).
+    With GENERATION_QUEUE_BACKEND=postgres the job is picked up by
+    generation_worker.py processes instead of the in-process executor.
+    The cost is held at submit and deducted only after the generation
+    completes; the hold is released if it fails.
+    Retries with the same Idempotency-Key get the first response back.
+    """
+    fingerprint = request_fingerprint(request, gen_request)
+    with IdempotencyScope(db, current_user.id, idempotency_key, fingerprint) as scope:
+        if scope.replay:
+            return scope.replay
+        generation = enqueue_submitted_generation(db, current_user, gen_request)
+        return scope.store(status.HTTP_202_ACCEPTED, generation_body(generation))
+
+
+def start_generation_batch(db: Session, current_user: User, batch: BatchGenerationRequest):
+    """
+    Validate a batch, create its processing generations and hold credits for
+    all of them with one reservation (commits).
+    Returns (generations, costs, hold, price snapshot id).
+    """
+    if not batch.items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Batch is empty"
+        )
+    
+    if len(batch.items) > settings.GENERATION_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch too large. Maximum items: {settings.GENERATION_BATCH_MAX_ITEMS}"
+        )
+    
+    price_table = get_price_table(db)
+    
+    # Check if any feature requires premium subscription
+    premium_required = next(
+        (item.type for item in batch.items if price_table.requires_subscription[item.type]), None
+    )
+    
+    if premium_required and not has_premium_access(current_user):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Feature '{premium_required.value}' requires an active subscription"
+        )
+    
+    costs = [price_table.cost(item.type) for item in batch.items]
+    total_cost = sum(costs)
+    
+    available = credit_ledger.available_credits(db, current_user)
+    if available < total_cost:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Insufficient credits. Required: {total_cost}, Available: {available}"
+        )
+    
+    generations = [
+        Generation(
+            user_id=current_user.id,
+            type=item.type,
+            cost=cost,
+            prompt=item.prompt,
+            parameters=json.dumps(item.parameters) if item.parameters else None,
+            status="processing",
+            price_snapshot_id=price_table.snapshot_id
+        )
+        for item, cost in zip(batch.items, costs)
+    ]
+    db.add_all(generations)
+    db.flush()
+    generation_ids = [generation.id for generation in generations]
+    for generation in generations:
+        publish_generation_status(db, generation)
+    
+    # Hold credits for the whole batch once; only completed items are captured later
+    try:
+        hold = credit_ledger.place_hold(db, current_user, total_cost)
+    except InsufficientCreditsError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=str(e)
+        )
+    db.commit()
+    # Reload the expired rows in one query instead of one per item later on
+    db.query(Generation).filter(Generation.id.in_(generation_ids)).all()
+    return generations, costs, hold, price_table.snapshot_id
+
+
+def finish_generation_batch(
+    db: Session,
+    current_user: User,
+    batch: BatchGenerationRequest,
+    generations: List[Generation],
+    costs: List[int],
+    hold,
+    price_snapshot_id: Optional[int],
+    results: list
+) -> dict:
+    """Store per-item results and capture the completed items' share of the hold (commits)"""
+    refunded = 0
+    failed_count = 0
+    item_results = []
+    completed_at = datetime.utcnow()
+    
+    for index, (item, generation, cost, result) in enumerate(zip(batch.items, generations, costs, results)):
+        if isinstance(result, Exception):
+            generation.status = "failed"
+            publish_generation_status(db, generation, detail=str(result))
+            refunded += cost
+            failed_count += 1
+            item_results.append({
+                "index": index,
+                "generation_id": generation.id,
+                "type": item.type,
+                "cost": cost,
+                "status": "failed",
+                "error": str(result)
+            })
+            continue
+    
+        generation.result_url = result.get("url", "")
+        generation.result_metadata = dump_result_metadata(result)
+        if item.type == GenerationType.AI_SCORING:
+            generation.ai_score = result.get("score")
+        generation.status = "completed"
+        generation.completed_at = completed_at
+        publish_generation_status(db, generation)
+        item_results.append({
+            "index": index,
+            "generation_id": generation.id,
+            "type": item.type,
+            "cost": cost,
+            "status": "completed",
+            "result_url": generation.result_url
+        })
+    
+    total_cost = sum(costs)
+    credit_ledger.capture_hold(
+        db,
+        current_user,
+        hold,
+        f"Batch generation: {len(generations) - failed_count} of {len(generations)} items",
+        amount=total_cost - refunded,
+        price_snapshot_id=price_snapshot_id
+    )
+    db.commit()
+    
+    return {
+        "total_cost": total_cost - refunded,
+        "refunded": refunded,
+        "remaining_credits": current_user.credits_balance,
+        "items": item_results
+    }
+
+
+def abort_generation_batch(
+    db: Session,
+    current_user: User,
+    hold,
+    generation_ids: List[int],
+    error: Exception
+) -> None:
+    """Release the batch hold and fail the items that had not completed (commits)"""
+    db.rollback()
+    credit_ledger.release_hold(db, hold, current_user)
+    for generation in db.query(Generation).filter(
+        Generation.id.in_(generation_ids),
+        Generation.status == "processing"
+    ):
+        generation.status = "failed"
+        generation.completed_at = datetime.utcnow()
+        publish_generation_status(db, generation, detail=str(error))
+    db.commit()
+
+
+@router.post("/batch", response_model=BatchGenerationResponse)
+@limiter.limit("20/hour")
+async def create_generation_batch(
+    request: Request,
+    batch: BatchGenerationRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Create many generations at once.
+    Prices are computed per distinct type, credits for the whole batch are
+    held with one reservation, engine calls run concurrently (capped per
+    batch) and only completed items are captured; the share of failed items
+    is released and reported as "refunded". Results are per item.
+    Database work runs in the threadpool, off the event loop.
+    """
+    generations, costs, hold, price_snapshot_id = await run_in_threadpool(
+        start_generation_batch, db, current_user, batch
+    )
+    generation_ids = [generation.id for generation in generations]
+    
+    try:
+        gen_types = {item.type for item in batch.items}
+        adapters = await run_in_threadpool(
+            lambda: {gen_type: get_engine_adapter(db, gen_type) for gen_type in gen_types}
+        )
+        concurrency = min(
+            batch.max_concurrency or settings.GENERATION_BATCH_CONCURRENCY,
+            settings.GENERATION_BATCH_CONCURRENCY
+        )
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        
+        async def run_item(item: GenerationRequest, generation_id: int):
+            async with semaphore:
+                return await generate_with_adapter(
+                    adapters[item.type],
+                    item.type,
+                    item.prompt,
+                    item.parameters,
+                    generation_id
+                )
+        
+        results = await asyncio.gather(
+            *[run_item(item, generation_id) for item, generation_id in zip(batch.items, generation_ids)],
+            return_exceptions=True
+        )
+        
+        return await run_in_threadpool(
+            finish_generation_batch,
+            db, current_user, batch, generations, costs, hold, price_snapshot_id, results
+        )
+    except Exception as e:
+        # Nothing is charged for a batch that broke half-way: free the hold
+        # and fail the items that had not completed
+        await run_in_threadpool(abort_generation_batch, db, current_user, hold, generation_ids, e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Batch generation failed: {str(e)}"
+        )
+
+
 @router.get("/my-generations", response_model=List[GenerationResponse])
 def get_my_generations(
     skip: int = 0,
@@ -163,6 +471,63 @@ def get_my_generations(
     return generations
 
 
+@router.get("/events")
+async def stream_generation_events(
+    request: Request,
+    generation_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Server-Sent Events stream of the caller's generation updates.
+    Sends the current state of active generations first, then status
+    transitions (pending -> processing -> completed/failed) and progress
+    events as they happen. Pass generation_id to follow a single generation.
+    """
+    user_id = current_user.id
+    queue = broker.subscribe(user_id)
+    
+    # Snapshot after subscribing, so no transition falls between the two
+    query = db.query(Generation).filter(Generation.user_id == user_id)
+    if generation_id is not None:
+        query = query.filter(Generation.id == generation_id)
+    else:
+        query = query.filter(Generation.status.in_(["pending", "processing"]))
+    snapshot = [generation_event(generation) for generation in query.limit(100).all()]
+    
+    # Release the DB connection: the stream may stay open for a long time
+    db.close()
+    
+    def format_event(event: dict) -> str:
+        event = {key: value for key, value in event.items() if key != "user_id"}
+        return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+    
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            for event in snapshot:
+                yield format_event(event)
+            
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                if generation_id is not None and event.get("generation_id") != generation_id:
+                    continue
+                yield format_event(event)
+        finally:
+            broker.unsubscribe(user_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/{generation_id}", response_model=GenerationResponse)
 def get_generation(
     generation_id: int,
@@ -188,19 +553,15 @@ def get_generation(
 def get_pricing(db: Session = Depends(get_db)):
     """Get dynamic pricing for all generation types"""
     pricing = []
+    price_table = get_price_table(db)
     
     for gen_type in GenerationType:
-        price_info = get_generation_price(db, gen_type)
-        
-        # Получаем дополнительную информацию из PricingConfig
-        config = db.query(PricingConfig).filter(
-            PricingConfig.generation_type == gen_type.value
-        ).first()
+        price_info = price_table.prices[gen_type]
         
         pricing.append({
             "type": gen_type.value,
             "cost_credits": price_info["final_price_rub"],
-            "requires_subscription": config.requires_subscription if config else False,
+            "requires_subscription": price_table.requires_subscription[gen_type],
             "description": get_generation_description(gen_type.value),
             "base_cost_usd": price_info["base_cost_usd"],
             "markup_percentage": price_info["markup_percentage"]
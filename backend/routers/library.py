@@ -1,36 +1,63 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import datetime
 from database import get_db
-from models import User, TopCreative, Transaction, TransactionType
-from schemas import TopCreativeResponse, TopCreativeDetailResponse
+from models import User, Generation, TopCreative, TransactionType, LibraryUnlock
+from schemas import (
+    TopCreativeResponse, TopCreativeDetailResponse, CreativeOwnershipRequest,
+    CreativeSearchHit, CreativeSearchResponse, LibrarySort,
+    CreativeSubmission, CreativeSubmissionResponse
+)
 from auth import get_current_active_user
-from payment_mock import PaymentMock
+import credit_ledger
+from credit_ledger import InsufficientCreditsError
+from view_counter import view_counter
+from library_snapshots import get_snapshot, ranking_order
+from trending import UNLOCK_WEIGHT, activity_score, log_add
+from price_table import get_price_table
+from creative_search import search_creatives, SearchError
+from prompt_dedup import index_creative
 
 router = APIRouter(prefix="/api/library", tags=["Library"])
 
 
 @router.get("/top-creatives", response_model=List[TopCreativeResponse])
 def get_top_creatives(
+    request: Request,
     skip: int = 0,
     limit: int = 50,
     category: Optional[str] = None,
+    sort: LibrarySort = LibrarySort.SCORE,
     db: Session = Depends(get_db)
 ):
-    """Get top 50 creatives (free access to preview)"""
-    query = db.query(TopCreative).filter(TopCreative.is_approved == True)
+    """
+    Get top 50 creatives (free access to preview), by AI score or trending.
+    Served from the category's in-memory snapshot with a strong ETag;
+    If-None-Match revalidations get 304 Not Modified.
+    """
+    snapshot = get_snapshot(db, category, sort)
     
-    if category:
-        query = query.filter(TopCreative.category == category)
+    if not snapshot.covers(skip, limit):
+        query = db.query(TopCreative).filter(TopCreative.is_approved == True)
+        if category:
+            query = query.filter(TopCreative.category == category)
+        creatives = query.order_by(*ranking_order(sort)).offset(skip).limit(limit).all()
+        view_counter.record(creative.id for creative in creatives)
+        return creatives
     
-    creatives = query.order_by(TopCreative.ai_score.desc()).offset(skip).limit(limit).all()
+    etag, body, creative_ids = snapshot.page(skip, limit)
     
-    # Increment views count
-    for creative in creatives:
-        creative.views_count += 1
-    db.commit()
+    # Count views; flushed to views_count in batches, the read never writes
+    view_counter.record(creative_ids)
     
-    return creatives
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.get("/categories")
@@ -40,6 +67,121 @@ def get_categories(db: Session = Depends(get_db)):
     return [cat[0] for cat in categories if cat[0]]
 
 
+@router.get("/search", response_model=CreativeSearchResponse)
+def search_library(
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    min_score: Optional[int] = None,
+    max_score: Optional[int] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Search titles, descriptions and prompts of the library (Russian and English).
+    Pass next_cursor back as cursor for the next page; facets (counts per
+    category and score range) come with the first page.
+    """
+    try:
+        page = search_creatives(db, q, category, min_score, max_score, limit, cursor)
+    except SearchError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    page["items"] = [
+        CreativeSearchHit(**TopCreativeResponse.model_validate(creative).model_dump(), highlight=highlight)
+        for creative, highlight in page["items"]
+    ]
+    return page
+
+
+@router.post("/unlocks/check")
+def check_unlocked_creatives(
+    ownership: CreativeOwnershipRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Which of the given creatives the current user has already unlocked"""
+    if not ownership.creative_ids:
+        return {"unlocked": []}
+    
+    unlocked = db.query(LibraryUnlock.creative_id).filter(
+        LibraryUnlock.user_id == current_user.id,
+        LibraryUnlock.creative_id.in_(set(ownership.creative_ids))
+    ).all()
+    return {"unlocked": sorted(creative_id for (creative_id,) in unlocked)}
+
+
+def claim_unlock(db: Session, user_id: int, creative_id: int, cost: int) -> bool:
+    """
+    Insert the user's unlock row unless it exists (INSERT ... ON CONFLICT DO
+    NOTHING). True if this call inserted it. Does not commit.
+    """
+    dialect_insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    statement = dialect_insert(LibraryUnlock).values(
+        user_id=user_id,
+        creative_id=creative_id,
+        cost=cost,
+        created_at=datetime.utcnow()
+    ).on_conflict_do_nothing(index_elements=["user_id", "creative_id"]).returning(LibraryUnlock.id)
+    return db.execute(statement).scalar() is not None
+
+
+@router.post("/submit", response_model=CreativeSubmissionResponse, status_code=status.HTTP_201_CREATED)
+def submit_creative(
+    submission: CreativeSubmission,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Submit one of your completed generations to the library.
+    The creative waits for moderation; a near-copy of another creative's
+    prompt is flagged (duplicate_of_id) in the same transaction.
+    """
+    generation = db.query(Generation).filter(
+        Generation.id == submission.generation_id,
+        Generation.user_id == current_user.id
+    ).first()
+    
+    if not generation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Generation not found"
+        )
+    
+    if generation.status != "completed" or not generation.result_url:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only completed generations can be submitted"
+        )
+    
+    if db.query(TopCreative.id).filter(TopCreative.generation_id == generation.id).first():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Generation already submitted"
+        )
+    
+    creative = TopCreative(
+        generation_id=generation.id,
+        title=submission.title,
+        description=submission.description,
+        category=submission.category,
+        preview_url=generation.result_url,
+        full_url=generation.result_url,
+        prompt=generation.prompt or "",
+        is_approved=False
+    )
+    db.add(creative)
+    db.flush()
+    index_creative(db, creative)
+    db.commit()
+    db.refresh(creative)
+    
+    return creative
+
+
 @router.post("/{creative_id}/unlock", response_model=TopCreativeDetailResponse)
 def unlock_creative_details(
     creative_id: int,
@@ -60,41 +202,33 @@ def unlock_creative_details(
             detail="Creative not found"
         )
     
-    # Check if user already unlocked this creative
-    existing_unlock = db.query(Transaction).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.type == TransactionType.LIBRARY_UNLOCK,
-        Transaction.description.like(f"%creative_id:{creative_id}%")
-    ).first()
-    
-    if existing_unlock:
+    # Claim the unlock first: a parallel unlock of the same creative waits on
+    # the unique index and then inserts nothing, so it is never charged twice
+    unlock_cost = creative.unlock_cost
+    if not claim_unlock(db, current_user.id, creative_id, unlock_cost):
         # Already unlocked, return details
         return creative
     
-    # Check if user has enough credits
-    unlock_cost = creative.unlock_cost
-    if current_user.credits_balance < unlock_cost:
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail=f"Insufficient credits. Required: {unlock_cost}, Available: {current_user.credits_balance}"
+    # Deduct credits and count the unlock in one transaction
+    try:
+        credit_ledger.debit(
+            db,
+            current_user,
+            unlock_cost,
+            f"Library unlock: creative_id:{creative_id}",
+            transaction_type=TransactionType.LIBRARY_UNLOCK,
+            price_snapshot_id=get_price_table(db).snapshot_id
         )
-    
-    # Deduct credits
-    success = PaymentMock.deduct_credits(
-        db,
-        current_user,
-        unlock_cost,
-        f"Library unlock: creative_id:{creative_id}"
-    )
-    
-    if not success:
+    except InsufficientCreditsError as e:
+        db.rollback()
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to deduct credits"
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=str(e)
         )
     
-    # Increment unlock count
-    creative.unlocks_count += 1
+    # Increment unlock count; an unlock weighs most in the trending ranking
+    creative.unlocks_count = TopCreative.unlocks_count + 1
+    creative.trending_score = log_add(TopCreative.trending_score, activity_score(UNLOCK_WEIGHT))
     db.commit()
     db.refresh(creative)
     
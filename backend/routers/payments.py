@@ -1,21 +1,37 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
+from typing import Optional
 from database import get_db
 from models import User, CreditPackage, SubscriptionTier
 from schemas import PaymentCreate, PaymentResponse, WebhookPayload
 from auth import get_current_active_user
 from payment_mock import PaymentMock, SUBSCRIPTION_PRICES
+from idempotency import IdempotencyScope, idempotency_key_header, request_fingerprint
 
 router = APIRouter(prefix="/api/payments", tags=["Payments"])
 
 
 @router.post("/create", response_model=PaymentResponse)
 def create_payment(
+    request: Request,
     payment_data: PaymentCreate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Depends(idempotency_key_header)
 ):
-    """Create a payment for subscription or credit purchase"""
+    """
+    Create a payment for subscription or credit purchase.
+    Retries with the same Idempotency-Key return the same payment.
+    """
+    fingerprint = request_fingerprint(request, payment_data)
+    with IdempotencyScope(db, current_user.id, idempotency_key, fingerprint) as scope:
+        if scope.replay:
+            return scope.replay
+        return scope.store(status.HTTP_200_OK, create_payment_for_user(db, current_user, payment_data))
+
+
+def create_payment_for_user(db: Session, current_user: User, payment_data: PaymentCreate) -> dict:
+    """Build the payment description and metadata and create the payment"""
     
     if payment_data.type == "subscription":
         if not payment_data.tier:
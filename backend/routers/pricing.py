@@ -0,0 +1,88 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from typing import List
+from database import get_db
+from models import User
+from schemas import QuoteItem, QuoteRequest
+from auth import get_current_active_user, has_premium_access
+from price_table import PriceTable, get_price_table
+import credit_ledger
+
+router = APIRouter(prefix="/api/pricing", tags=["Pricing"])
+
+
+def quote_items(price_table: PriceTable, current_user: User, items: List[QuoteItem]) -> dict:
+    """
+    Price a cart from one price table. Uses the same prices as checkout:
+    generations are charged price_table.cost(), bundles calculate_bundle_price().
+    """
+    premium = has_premium_access(current_user)
+    lines = []
+    total = 0
+
+    for index, item in enumerate(items):
+        if item.generation_type is not None:
+            line = {
+                "index": index,
+                "kind": "generation",
+                "generation_type": item.generation_type.value,
+                "name": item.generation_type.value,
+                "unit_price": price_table.cost(item.generation_type),
+                "requires_subscription": price_table.requires_subscription[item.generation_type]
+            }
+        else:
+            bundle = price_table.bundles.get(item.bundle_id)
+            if bundle is None:
+                lines.append({
+                    "index": index,
+                    "kind": "bundle",
+                    "bundle_id": item.bundle_id,
+                    "quantity": item.quantity,
+                    "available": False,
+                    "unavailable_reason": "Bundle not found"
+                })
+                continue
+            line = {
+                "index": index,
+                "kind": "bundle",
+                "bundle_id": bundle["id"],
+                "name": bundle["name"],
+                "unit_price": bundle["final_price"],
+                "base_price": bundle["base_price"],
+                "discount_percent": bundle["discount_percent"],
+                "requires_subscription": bundle["requires_subscription"]
+            }
+
+        line["quantity"] = item.quantity
+        line["line_total"] = line["unit_price"] * item.quantity
+        line["available"] = premium or not line["requires_subscription"]
+        if not line["available"]:
+            line["unavailable_reason"] = "Requires an active subscription"
+        else:
+            total += line["line_total"]
+        lines.append(line)
+
+    return {
+        "price_snapshot_id": price_table.snapshot_id,
+        "exchange_rate": price_table.exchange_rate,
+        "items": lines,
+        "total": total
+    }
+
+
+@router.post("/quote")
+def quote_cart(
+    quote_request: QuoteRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Quote a mixed cart of generation types and bundles in one call.
+    Unavailable lines (unknown bundle, subscription required) are excluded
+    from the total.
+    """
+    quote = quote_items(get_price_table(db), current_user, quote_request.items)
+    available = credit_ledger.available_credits(db, current_user)
+    quote["available_credits"] = available
+    quote["sufficient_credits"] = available >= quote["total"]
+    return quote
@@ -4,18 +4,31 @@ API endpoints для управления AI-агентами и ценообр
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List
+from datetime import datetime, timedelta
 from database import get_db
-from models import User, AiEngine, PricingConfiguration, FusionChain, GenerationType
+from models import (
+    User, AiEngine, PricingConfiguration, FusionChain, GenerationType, Generation, PriceSnapshot,
+    Transaction, TransactionType
+)
 from schemas import (
     AiEngineCreate, AiEngineUpdate, AiEngineResponse,
     PricingConfigurationResponse, PricingConfigurationUpdate,
     FusionChainResponse, FusionChainCreate,
-    MarginCalculatorResponse
+    MarginCalculatorResponse,
+    PriceSnapshotResponse, PriceSnapshotDetailResponse, MarginReportRow,
+    MarginSimulationRequest
 )
 from auth import get_current_active_user
-from pricing_utils import calculate_margin_summary, get_generation_price, update_all_generation_prices
+from pricing_utils import calculate_margin_summary, get_generation_price
+from price_table import load_snapshot, pricing_changed
+from margin_simulator import SimulationError, simulate_margins
+from fusion_executor import parse_chain_config
+from chain_costs import index_chain, link_engine, recompute_chains_for_engine
+from engine_resilience import guard_stats
 from logging_config import logger
 
 router = APIRouter(prefix="/api/admin/pricing", tags=["Admin Pricing"])
@@ -45,6 +58,37 @@ async def list_ai_engines(
     return engines
 
 
+@router.get("/engines/health")
+async def get_engines_health(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """
+    Состояние изоляции AI-движков в этом процессе: занятые слоты, очередь
+    ожидания и состояние circuit breaker (closed / open / half_open).
+    """
+    stats = {item["engine_id"]: item for item in guard_stats()}
+    engines = db.query(AiEngine).order_by(AiEngine.id).all()
+    return [
+        stats.get(engine.id) or {
+            "engine_id": engine.id,
+            "engine_name": engine.name,
+            "in_flight": 0,
+            "queued": 0,
+            "max_concurrency": engine.max_concurrency,
+            "max_queue": engine.max_queue,
+            "latency_ewma_ms": None,
+            "error_ewma": 0.0,
+            "state": "closed",
+            "failure_rate": 0.0,
+            "avg_latency_ms": 0.0,
+            "window_calls": 0,
+            "open_for_seconds": 0.0
+        }
+        for engine in engines
+    ]
+
+
 @router.post("/engines", response_model=AiEngineResponse, status_code=status.HTTP_201_CREATED)
 async def create_ai_engine(
     engine_data: AiEngineCreate,
@@ -64,8 +108,12 @@ async def create_ai_engine(
     
     engine = AiEngine(**engine_data.dict())
     db.add(engine)
+    db.flush()
+    # Цепочки, ссылавшиеся на агента по имени до его создания
+    link_engine(db, engine)
     db.commit()
     db.refresh(engine)
+    pricing_changed(f"AI Engine created: {engine.name}", current_user.id)
     
     logger.info(f"Admin {current_user.username} created AI Engine: {engine.name}")
     return engine
@@ -88,12 +136,25 @@ async def update_ai_engine(
             detail="AI Engine not found"
         )
     
+    old_name = engine.name
     update_data = engine_data.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(engine, field, value)
     
+    if engine.name != old_name:
+        # Шаги цепочек ссылаются на агентов по имени: переиндексируем цепочки
+        # со старым и новым именем
+        db.flush()
+        link_engine(db, engine)
+    elif "internal_cost_usd_per_unit" in update_data or "is_active" in update_data:
+        # Пересчитываем себестоимость только цепочек, использующих этот агент
+        # (неактивный агент в себестоимость не входит)
+        db.flush()
+        recompute_chains_for_engine(db, engine.id)
+    
     db.commit()
     db.refresh(engine)
+    pricing_changed(f"AI Engine updated: {engine.name}", current_user.id)
     
     logger.info(f"Admin {current_user.username} updated AI Engine: {engine.name}")
     return engine
@@ -117,7 +178,10 @@ async def delete_ai_engine(
     
     # Деактивируем вместо удаления для сохранения истории
     engine.is_active = False
+    db.flush()
+    recompute_chains_for_engine(db, engine.id)
     db.commit()
+    pricing_changed(f"AI Engine deactivated: {engine.name}", current_user.id)
     
     logger.info(f"Admin {current_user.username} deactivated AI Engine: {engine.name}")
     return None
@@ -160,9 +224,10 @@ async def update_pricing_config(
     
     logger.info(f"Admin {current_user.username} updated pricing config '{key}' to {config_data.value}")
     
-    # Пересчитываем все цены
-    updated_prices = update_all_generation_prices(db)
-    logger.info(f"Updated generation prices: {updated_prices}")
+    # Пересчитываем все цены: новая версия прайса во всех процессах
+    price_table = pricing_changed(f"{key} = {config_data.value}", current_user.id)
+    updated_prices = {gen_type.value: price_table.cost(gen_type) for gen_type in GenerationType}
+    logger.info(f"Price snapshot {price_table.snapshot_id}: {updated_prices}")
     
     return config
 
@@ -197,10 +262,21 @@ async def create_fusion_chain(
             detail=f"Fusion Chain with name '{chain_data.name}' already exists"
         )
     
-    chain = FusionChain(**chain_data.dict())
+    try:
+        parse_chain_config(chain_data.chain_config)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid chain_config: {str(e)}"
+        )
+    
+    chain = FusionChain(**chain_data.dict(exclude={"total_cost_usd"}), total_cost_usd=0.0)
     db.add(chain)
+    db.flush()
+    index_chain(db, chain, chain_data.total_cost_usd)
     db.commit()
     db.refresh(chain)
+    pricing_changed(f"Fusion Chain created: {chain.name}", current_user.id)
     
     logger.info(f"Admin {current_user.username} created Fusion Chain: {chain.name}")
     return chain
@@ -243,3 +319,120 @@ async def get_margin_for_type(
         **price_info
     }
 
+
+@router.post("/simulate")
+async def simulate_margins_endpoint(
+    simulation: MarginSimulationRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """
+    What-if симулятор маржинальности: сетка курс USD/RUB x наценка x
+    множитель себестоимости API для всех выбранных агентов и цепочек.
+    Возвращает поверхности маржи (индексы [курс][наценка][множитель]),
+    точки безубыточности текущих цен и сводную поверхность по объему генераций.
+    """
+    try:
+        # Surfaces are large nested lists of plain floats: skip jsonable_encoder
+        return JSONResponse(content=simulate_margins(db, simulation))
+    except SimulationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+# ==================== PRICE SNAPSHOTS ====================
+
+@router.get("/snapshots", response_model=List[PriceSnapshotResponse])
+async def list_price_snapshots(
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """
+    История версий прайса (новые первыми): курс USD/RUB и причина изменения.
+    """
+    return db.query(PriceSnapshot).order_by(PriceSnapshot.id.desc()).limit(limit).all()
+
+
+@router.get("/snapshots/{snapshot_id}", response_model=PriceSnapshotDetailResponse)
+async def get_price_snapshot(
+    snapshot_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """
+    Версия прайса с полным расчетом цены каждого типа генерации.
+    """
+    snapshot = db.query(PriceSnapshot).filter(PriceSnapshot.id == snapshot_id).first()
+    if not snapshot:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Price snapshot not found"
+        )
+    return snapshot
+
+
+@router.get("/margin-report", response_model=List[MarginReportRow])
+async def get_margin_report(
+    days: int = 30,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """
+    Фактическая маржа завершенных генераций за период по версиям прайса:
+    себестоимость берется из версии, по которой генерация была оценена,
+    а не пересчитывается по текущим ценам. Выручка покупок комплектов и
+    разблокировок библиотеки идет отдельными строками (source); генерации
+    комплектов (cost=0) дают только себестоимость.
+    """
+    since = datetime.utcnow() - timedelta(days=days)
+    rows = db.query(
+        Generation.price_snapshot_id,
+        Generation.type,
+        func.count(Generation.id),
+        func.coalesce(func.sum(Generation.cost), 0)
+    ).filter(
+        Generation.status == "completed",
+        Generation.price_snapshot_id.isnot(None),
+        Generation.created_at >= since
+    ).group_by(Generation.price_snapshot_id, Generation.type).all()
+
+    snapshots = {}
+    report = []
+    for snapshot_id, gen_type, count, revenue in rows:
+        if snapshot_id not in snapshots:
+            snapshots[snapshot_id] = load_snapshot(db, snapshot_id)
+        cost_rub = snapshots[snapshot_id].prices[gen_type]["cost_rub"] * count
+        report.append({
+            "price_snapshot_id": snapshot_id,
+            "source": "generation",
+            "generation_type": gen_type.value,
+            "generations": count,
+            "revenue_rub": revenue,
+            "cost_rub": round(cost_rub, 2),
+            "profit_rub": round(revenue - cost_rub, 2)
+        })
+
+    charges = db.query(
+        Transaction.price_snapshot_id,
+        Transaction.type,
+        func.count(Transaction.id),
+        func.coalesce(-func.sum(Transaction.credits_change), 0)
+    ).filter(
+        Transaction.type.in_([TransactionType.LIBRARY_UNLOCK, TransactionType.BUNDLE_PURCHASE]),
+        Transaction.status == "completed",
+        Transaction.price_snapshot_id.isnot(None),
+        Transaction.created_at >= since
+    ).group_by(Transaction.price_snapshot_id, Transaction.type).all()
+    for snapshot_id, transaction_type, count, revenue in charges:
+        report.append({
+            "price_snapshot_id": snapshot_id,
+            "source": transaction_type.value,
+            "generations": count,
+            "revenue_rub": revenue,
+            "cost_rub": 0.0,
+            "profit_rub": float(revenue)
+        })
+    return sorted(report, key=lambda row: (row["price_snapshot_id"], row["source"], row.get("generation_type") or ""))
@@ -1,7 +1,9 @@
 from pydantic import BaseModel, EmailStr, validator
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 from models import SubscriptionTier, GenerationType, TransactionType
+import enum
+import json
 import re
 
 
@@ -39,6 +41,7 @@ class UserCreate(UserBase):
 class UserResponse(UserBase):
     id: int
     credits_balance: int
+    credits_held: int = 0  # Reserved by generations in progress
     subscription_tier: SubscriptionTier
     is_active: bool
     created_at: datetime
@@ -98,12 +101,35 @@ class GenerationRequest(BaseModel):
     parameters: Optional[dict] = None
 
 
+class BatchGenerationRequest(BaseModel):
+    items: List[GenerationRequest]
+    max_concurrency: Optional[int] = None
+
+
+class BatchGenerationItemResult(BaseModel):
+    index: int
+    generation_id: int
+    type: GenerationType
+    cost: int
+    status: str
+    result_url: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchGenerationResponse(BaseModel):
+    total_cost: int
+    refunded: int
+    remaining_credits: int
+    items: List[BatchGenerationItemResult]
+
+
 class GenerationResponse(BaseModel):
     id: int
     type: GenerationType
     cost: int
     prompt: Optional[str]
     result_url: Optional[str]
+    result_metadata: Optional[dict] = None
     status: str
     ai_score: Optional[int]
     created_at: datetime
@@ -111,9 +137,23 @@ class GenerationResponse(BaseModel):
     
     class Config:
         from_attributes = True
+    
+    @validator('result_metadata', pre=True)
+    def parse_result_metadata(cls, v):
+        if isinstance(v, str):
+            try:
+                return json.loads(v)
+            except ValueError:
+                return None
+        return v
 
 
 # Top Creative Schemas
+class LibrarySort(str, enum.Enum):
+    SCORE = "score"
+    TRENDING = "trending"
+
+
 class TopCreativeResponse(BaseModel):
     id: int
     title: str
@@ -123,7 +163,7 @@ class TopCreativeResponse(BaseModel):
     unlock_cost: int
     views_count: int
     unlocks_count: int
-    ai_score: int
+    ai_score: Optional[int] = None
     created_at: datetime
     
     class Config:
@@ -135,6 +175,73 @@ class TopCreativeDetailResponse(TopCreativeResponse):
     prompt: str
 
 
+class CreativeSearchHit(TopCreativeResponse):
+    # Title and description snippet as HTML: text escaped, matches wrapped in <mark></mark>
+    highlight: Dict[str, Optional[str]] = {}
+
+
+class CreativeSearchResponse(BaseModel):
+    items: List[CreativeSearchHit]
+    next_cursor: Optional[str] = None
+    facets: Optional[Dict[str, Dict[str, int]]] = None
+
+
+class CreativeSubmission(BaseModel):
+    generation_id: int
+    title: str
+    description: Optional[str] = None
+    category: Optional[str] = None
+    
+    @validator("title")
+    def validate_title(cls, v):
+        v = v.strip()
+        if not v or len(v) > 200:
+            raise ValueError("Title must be 1-200 characters long")
+        return v
+
+
+class CreativeSubmissionResponse(BaseModel):
+    id: int
+    generation_id: int
+    title: str
+    is_approved: bool
+    # Closest library creative with a near-identical prompt, flagged on submission
+    duplicate_of_id: Optional[int] = None
+    duplicate_similarity: Optional[float] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class CreativeOwnershipRequest(BaseModel):
+    creative_ids: List[int]
+    
+    @validator("creative_ids")
+    def validate_creative_ids(cls, v):
+        if len(v) > 500:
+            raise ValueError("At most 500 creative ids per request")
+        return v
+
+
+class ModerationAction(str, enum.Enum):
+    APPROVE = "approve"
+    REJECT = "reject"
+
+
+class CreativeModerationRequest(BaseModel):
+    creative_ids: List[int]
+    action: ModerationAction
+    
+    @validator("creative_ids")
+    def validate_creative_ids(cls, v):
+        if not v:
+            raise ValueError("No creative ids given")
+        if len(v) > 500:
+            raise ValueError("At most 500 creative ids per request")
+        return v
+
+
 # Pricing Schemas
 class PricingConfigResponse(BaseModel):
     generation_type: str
@@ -190,8 +297,60 @@ class BundlePurchaseRequest(BaseModel):
     bundle_id: int
 
 
+# Cart Quote Schemas
+class QuoteItem(BaseModel):
+    """Строка корзины: тип генерации или бандл"""
+    generation_type: Optional[GenerationType] = None
+    bundle_id: Optional[int] = None
+    quantity: int = 1
+    
+    @validator("quantity")
+    def validate_quantity(cls, v):
+        if not 1 <= v <= 1000:
+            raise ValueError("quantity must be between 1 and 1000")
+        return v
+    
+    @validator("bundle_id", always=True)
+    def validate_target(cls, v, values):
+        if (v is None) == (values.get("generation_type") is None):
+            raise ValueError("Specify exactly one of generation_type or bundle_id")
+        return v
+
+
+class QuoteRequest(BaseModel):
+    items: List[QuoteItem]
+    
+    @validator("items")
+    def validate_items(cls, v):
+        if not 1 <= len(v) <= 100:
+            raise ValueError("Cart must contain 1 to 100 items")
+        return v
+
+
 # AI Engine Schemas (для посреднической модели)
-class AiEngineBase(BaseModel):
+class AiEngineLimitsValidator(BaseModel):
+    """Validation of the bulkhead / circuit breaker settings"""
+
+    @validator('max_concurrency', 'breaker_latency_ms', 'breaker_cooldown_seconds', check_fields=False)
+    def validate_positive(cls, v):
+        if v is not None and v < 1:
+            raise ValueError('Must be at least 1')
+        return v
+
+    @validator('max_queue', check_fields=False)
+    def validate_max_queue(cls, v):
+        if v is not None and v < 0:
+            raise ValueError('Must not be negative')
+        return v
+
+    @validator('breaker_error_threshold', check_fields=False)
+    def validate_error_threshold(cls, v):
+        if v is not None and not 0 < v <= 1:
+            raise ValueError('Must be between 0 and 1')
+        return v
+
+
+class AiEngineBase(AiEngineLimitsValidator):
     name: str
     description: Optional[str] = None
     role: Optional[str] = None
@@ -200,19 +359,29 @@ class AiEngineBase(BaseModel):
     markup_percentage: float
     is_active: bool = True
     generation_type: Optional[GenerationType] = None
+    max_concurrency: int = 10
+    max_queue: int = 100
+    breaker_error_threshold: float = 0.5
+    breaker_latency_ms: int = 30000
+    breaker_cooldown_seconds: int = 30
 
 
 class AiEngineCreate(AiEngineBase):
     api_key_encrypted: Optional[str] = None
 
 
-class AiEngineUpdate(BaseModel):
+class AiEngineUpdate(AiEngineLimitsValidator):
     name: Optional[str] = None
     description: Optional[str] = None
     role: Optional[str] = None
     internal_cost_usd_per_unit: Optional[float] = None
     markup_percentage: Optional[float] = None
     is_active: Optional[bool] = None
+    max_concurrency: Optional[int] = None
+    max_queue: Optional[int] = None
+    breaker_error_threshold: Optional[float] = None
+    breaker_latency_ms: Optional[int] = None
+    breaker_cooldown_seconds: Optional[int] = None
 
 
 class AiEngineResponse(AiEngineBase):
@@ -248,6 +417,7 @@ class FusionChainResponse(BaseModel):
     generation_type: GenerationType
     chain_config: str
     total_cost_usd: float
+    cost_adjustment_usd: float = 0.0
     markup_percentage: float
     is_active: bool
     created_at: datetime
@@ -257,12 +427,45 @@ class FusionChainResponse(BaseModel):
         from_attributes = True
 
 
+# Price Snapshot Schemas
+class PriceSnapshotResponse(BaseModel):
+    id: int
+    exchange_rate: float
+    reason: Optional[str]
+    created_by: Optional[int]
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class PriceSnapshotDetailResponse(PriceSnapshotResponse):
+    prices: Dict[str, Dict[str, Any]]
+    
+    @validator("prices", pre=True)
+    def parse_prices(cls, v):
+        return json.loads(v) if isinstance(v, str) else v
+
+
+class MarginReportRow(BaseModel):
+    price_snapshot_id: int
+    source: str = "generation"  # generation, bundle_purchase или library_unlock
+    generation_type: Optional[str] = None
+    generations: int  # Число генераций (покупок, разблокировок для других source)
+    revenue_rub: int  # Списано кредитов (1 кредит = 1 ₽)
+    cost_rub: float  # Себестоимость по курсу и ценам этой версии
+    profit_rub: float
+
+
 class FusionChainCreate(BaseModel):
     name: str
     description: Optional[str] = None
     generation_type: GenerationType
     chain_config: str  # JSON string
-    total_cost_usd: float
+    # Себестоимость считается по агентам шагов; total_cost_usd (если задана)
+    # сохраняется как есть, а разница с агентами идет в cost_adjustment_usd
+    total_cost_usd: Optional[float] = None
+    cost_adjustment_usd: float = 0.0
     markup_percentage: float = 250.0
 
 
@@ -277,3 +480,34 @@ class MarginCalculatorResponse(BaseModel):
     profit_rub: float  # Ваша прибыль
     profit_percentage: float  # Процент прибыли от финальной цены
 
+
+
+# Margin Simulator (what-if сценарии для админки)
+class SimulationAxis(BaseModel):
+    """Ось сетки: явный список значений или диапазон start..stop из steps точек"""
+    values: Optional[List[float]] = None
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    steps: int = 1
+    
+    @validator("steps")
+    def validate_steps(cls, v):
+        if not 1 <= v <= 1000:
+            raise ValueError("steps must be between 1 and 1000")
+        return v
+    
+    @validator("values")
+    def validate_values(cls, v):
+        if v is not None and not 1 <= len(v) <= 1000:
+            raise ValueError("values must contain 1 to 1000 items")
+        return v
+
+
+class MarginSimulationRequest(BaseModel):
+    exchange_rates: Optional[SimulationAxis] = None  # По умолчанию - текущий курс
+    markup_percentages: Optional[SimulationAxis] = None  # По умолчанию - текущая наценка каждого агента
+    cost_multipliers: Optional[SimulationAxis] = None  # Множитель себестоимости API (1.0 = текущая)
+    engine_ids: Optional[List[int]] = None  # По умолчанию - все активные агенты
+    fusion_chain_ids: Optional[List[int]] = None  # По умолчанию - все активные цепочки
+    volume_days: int = 30  # Период объема генераций для сводной поверхности
+    include_surfaces: bool = True  # False - только точки безубыточности и сводка
@@ -0,0 +1,51 @@
+"""
+Shared fixtures: a throwaway SQLite database whose tables are created from
+the models (Alembic migrations target Postgres), rebuilt for every test.
+
+Run from backend/: pytest tests/
+"""
+import os
+import sys
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="fortar-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from database import Base, SessionLocal, engine
+from models import User
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def make_user(db):
+    """Factory for committed users with a given balance"""
+    created = []
+
+    def make(credits: int = 1000, **fields) -> User:
+        index = len(created) + 1
+        user = User(
+            email=f"user{index}@example.com",
+            username=f"user{index}",
+            hashed_password="x",
+            credits_balance=credits,
+            **fields
+        )
+        db.add(user)
+        db.commit()
+        created.append(user)
+        return user
+
+    return make
@@ -0,0 +1,91 @@
+import json
+import pytest
+from models import AiEngine, FusionChain, GenerationType
+from chain_costs import index_chain, link_engine, recompute_chains_for_engine
+
+
+@pytest.fixture
+def add_engine(db):
+    def add(name, cost):
+        engine = AiEngine(name=name, internal_cost_usd_per_unit=cost)
+        db.add(engine)
+        db.flush()
+        return engine
+
+    return add
+
+
+@pytest.fixture
+def add_chain(db):
+    def add(name, steps, total_cost_usd=None):
+        chain = FusionChain(
+            name=name,
+            generation_type=GenerationType.BRANDED_SET,
+            chain_config=json.dumps(steps),
+            total_cost_usd=0.0
+        )
+        db.add(chain)
+        db.flush()
+        index_chain(db, chain, total_cost_usd)
+        db.commit()
+        return chain
+
+    return add
+
+
+def test_chain_cost_is_the_sum_of_its_steps(db, add_engine, add_chain):
+    creative = add_engine("Recraft.ai", 0.04)
+    add_engine("Brand Color Processor", 0.01)
+    chain = add_chain("Брендовый Сет", [
+        {"engine_id": creative.id, "order": 1},
+        {"engine_name": "Brand Color Processor", "order": 2},
+        {"engine_name": "Brand Color Processor", "order": 3}
+    ])
+
+    assert chain.total_cost_usd == pytest.approx(0.06)
+
+
+def test_given_total_keeps_the_rest_as_adjustment(db, add_engine, add_chain):
+    add_engine("Recraft.ai", 0.04)
+    chain = add_chain("Брендовый Сет", [{"engine_name": "Recraft.ai"}], total_cost_usd=0.05)
+
+    assert chain.total_cost_usd == pytest.approx(0.05)
+    assert chain.cost_adjustment_usd == pytest.approx(0.01)
+
+
+def test_engine_cost_change_recomputes_only_its_chains(db, add_engine, add_chain):
+    creative = add_engine("Recraft.ai", 0.04)
+    other = add_engine("DALL-E 3", 0.02)
+    uses_creative = add_chain("Set", [{"engine_name": "Recraft.ai"}, {"engine_name": "Recraft.ai", "order": 1}])
+    uses_other = add_chain("Other", [{"engine_name": "DALL-E 3"}])
+
+    creative.internal_cost_usd_per_unit = 0.05
+    db.flush()
+    changed = recompute_chains_for_engine(db, creative.id)
+    db.commit()
+
+    assert changed == [uses_creative]
+    assert uses_creative.total_cost_usd == pytest.approx(0.10)
+    assert uses_other.total_cost_usd == pytest.approx(0.02)
+    assert recompute_chains_for_engine(db, other.id) == []
+
+
+def test_deactivated_engine_costs_nothing(db, add_engine, add_chain):
+    creative = add_engine("Recraft.ai", 0.04)
+    chain = add_chain("Set", [{"engine_name": "Recraft.ai"}], total_cost_usd=0.05)
+
+    creative.is_active = False
+    db.flush()
+
+    assert recompute_chains_for_engine(db, creative.id) == [chain]
+    assert chain.total_cost_usd == pytest.approx(0.01)
+
+
+def test_engine_created_later_is_linked_by_exact_name(db, add_engine, add_chain):
+    chain = add_chain("Set", [{"engine_name": "gpt-4"}, {"engine_name": "Векторизатор", "order": 1}])
+    assert chain.total_cost_usd == 0.0
+
+    assert link_engine(db, add_engine("gpt", 1.0)) == []
+    assert link_engine(db, add_engine("Векторизатор", 0.03)) == [chain]
+    assert link_engine(db, add_engine("gpt-4", 0.02)) == [chain]
+    assert chain.total_cost_usd == pytest.approx(0.05)
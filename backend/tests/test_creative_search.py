@@ -0,0 +1,111 @@
+import pytest
+from sqlalchemy import update
+from models import TopCreative
+from library_snapshots import invalidate_snapshots
+from creative_search import SearchError, decode_cursor, encode_cursor, search_creatives
+
+
+@pytest.fixture
+def add_creative(db):
+    """Factory for library creatives; invalidates the search index like an approval does"""
+
+    def add(title, ai_score=85, description=None, category=None, prompt="prompt", is_approved=True):
+        creative = TopCreative(
+            title=title,
+            description=description,
+            category=category,
+            preview_url="https://example.com/preview.png",
+            full_url="https://example.com/full.png",
+            prompt=prompt,
+            ai_score=ai_score,
+            is_approved=is_approved
+        )
+        db.add(creative)
+        db.commit()
+        invalidate_snapshots()
+        return creative
+
+    return add
+
+
+def titles(page):
+    return [creative.title for creative, _ in page["items"]]
+
+
+def test_all_query_words_must_match_by_prefix(db, add_creative):
+    add_creative("Летняя распродажа кроссовок", ai_score=90)
+    add_creative("Летняя коллекция", ai_score=80)
+    add_creative("Зимняя распродажа", ai_score=70)
+    add_creative("Летняя распродажа черновик", is_approved=False)
+
+    assert titles(search_creatives(db, q="летн распрод")) == ["Летняя распродажа кроссовок"]
+    assert titles(search_creatives(db, q="летн")) == ["Летняя распродажа кроссовок", "Летняя коллекция"]
+    assert titles(search_creatives(db, q="осенняя")) == []
+
+
+def test_prompt_is_searched_but_not_highlighted(db, add_creative):
+    add_creative("Banner", description="Sneaker sale", prompt="neon sneakers on a city street")
+
+    page = search_creatives(db, q="neon")
+
+    creative, highlight = page["items"][0]
+    assert creative.title == "Banner"
+    assert highlight == {"title": "Banner", "description": "Sneaker sale"}
+
+
+def test_highlight_escapes_text_and_marks_matches(db, add_creative):
+    add_creative("<b>Sale</b> & more", description="Sale \"today\"")
+
+    _, highlight = search_creatives(db, q="sale")["items"][0]
+
+    assert highlight["title"] == "&lt;b&gt;<mark>Sale</mark>&lt;/b&gt; &amp; more"
+    assert highlight["description"] == "<mark>Sale</mark> &quot;today&quot;"
+
+
+def test_filters_and_facets(db, add_creative):
+    add_creative("Shoes ad", ai_score=92, category="ecommerce")
+    add_creative("Shoes promo", ai_score=75, category="ecommerce")
+    add_creative("Shoes loan", ai_score=88, category="finance")
+
+    page = search_creatives(db, q="shoes", category="ecommerce", min_score=80)
+
+    assert titles(page) == ["Shoes ad"]
+    # Each facet ignores its own filter
+    assert page["facets"]["categories"] == {"ecommerce": 1, "finance": 1}
+    assert page["facets"]["score_ranges"] == {"90-99": 1, "70-79": 1}
+
+
+def test_cursor_pages_through_every_hit_once(db, add_creative):
+    for index in range(5):
+        add_creative(f"Ad {index}", ai_score=80)
+    unscored = add_creative("Ad unscored")
+    db.execute(update(TopCreative).where(TopCreative.id == unscored.id).values(ai_score=None))
+    db.commit()
+    invalidate_snapshots()
+
+    seen, cursor = [], None
+    while True:
+        page = search_creatives(db, q="ad", limit=2, cursor=cursor)
+        seen += titles(page)
+        assert (page["facets"] is None) == (cursor is not None)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == ["Ad 4", "Ad 3", "Ad 2", "Ad 1", "Ad 0", "Ad unscored"]
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(None, 12)) == (0, 12)
+    assert decode_cursor(encode_cursor(85, 3)) == (85, 3)
+
+
+@pytest.mark.parametrize("arguments", [
+    {"limit": 0},
+    {"limit": 101},
+    {"min_score": 90, "max_score": 80},
+    {"cursor": "not-a-cursor"}
+])
+def test_unusable_requests_raise_search_error(db, arguments):
+    with pytest.raises(SearchError):
+        search_creatives(db, **arguments)
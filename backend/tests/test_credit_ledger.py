@@ -0,0 +1,129 @@
+import pytest
+from models import Transaction, TransactionType, User
+import credit_ledger
+from credit_ledger import InsufficientCreditsError
+
+
+def stored_balance(db, user):
+    return db.query(User.credits_balance, User.credits_held).filter(User.id == user.id).one()
+
+
+def test_debit_takes_credits_and_records_usage(db, make_user):
+    user = make_user(credits=100)
+
+    balance = credit_ledger.debit(db, user, 30, "static_image generation", price_snapshot_id=None)
+    db.commit()
+
+    assert balance == 70
+    assert stored_balance(db, user) == (70, 0)
+    transaction = db.query(Transaction).one()
+    assert transaction.credits_change == -30
+    assert transaction.type == TransactionType.CREDIT_USAGE
+
+
+def test_debit_records_the_given_type(db, make_user):
+    user = make_user(credits=100)
+
+    credit_ledger.debit(db, user, 5, "Library unlock: creative_id:1", transaction_type=TransactionType.LIBRARY_UNLOCK)
+    db.commit()
+
+    assert db.query(Transaction).one().type == TransactionType.LIBRARY_UNLOCK
+
+
+def test_debit_rejects_overdraft_without_writing(db, make_user):
+    user = make_user(credits=20)
+
+    with pytest.raises(InsufficientCreditsError) as error:
+        credit_ledger.debit(db, user, 30, "too expensive")
+
+    assert error.value.required == 30
+    assert error.value.available == 20
+    db.rollback()
+    assert stored_balance(db, user) == (20, 0)
+    assert db.query(Transaction).count() == 0
+
+
+def test_credit_adds_to_the_balance(db, make_user):
+    user = make_user(credits=10)
+
+    assert credit_ledger.credit(db, user, 15, "refund") == 25
+    db.commit()
+
+    assert stored_balance(db, user) == (25, 0)
+    assert db.query(Transaction).one().credits_change == 15
+
+
+def test_hold_reserves_available_credits(db, make_user):
+    user = make_user(credits=100)
+
+    credit_ledger.place_hold(db, user, 60)
+    db.commit()
+
+    assert stored_balance(db, user) == (100, 60)
+    assert credit_ledger.available_credits(db, user) == 40
+    with pytest.raises(InsufficientCreditsError):
+        credit_ledger.place_hold(db, user, 50)
+
+
+def test_partial_capture_charges_only_the_used_part(db, make_user):
+    user = make_user(credits=100)
+    hold = credit_ledger.place_hold(db, user, 60)
+    db.commit()
+
+    balance = credit_ledger.capture_hold(db, user, hold, "batch generation", amount=45)
+    db.commit()
+
+    assert balance == 55
+    assert stored_balance(db, user) == (55, 0)
+    assert hold.status == "captured"
+    assert db.query(Transaction).one().credits_change == -45
+
+
+def test_release_frees_the_hold_once(db, make_user):
+    user = make_user(credits=100)
+    hold = credit_ledger.place_hold(db, user, 60)
+    db.commit()
+
+    assert credit_ledger.release_hold(db, hold, user) is True
+    assert credit_ledger.release_hold(db, hold, user) is False
+    db.commit()
+
+    assert stored_balance(db, user) == (100, 0)
+    assert db.query(Transaction).count() == 0
+
+
+def test_capture_after_release_falls_back_to_debit(db, make_user):
+    user = make_user(credits=100)
+    hold = credit_ledger.place_hold(db, user, 60)
+    credit_ledger.release_hold(db, hold, user)
+    db.commit()
+
+    assert credit_ledger.capture_hold(db, user, hold, "late result") == 40
+    db.commit()
+
+    assert stored_balance(db, user) == (40, 0)
+
+
+def test_expired_holds_are_released(db, make_user):
+    user = make_user(credits=100)
+    expired = credit_ledger.place_hold(db, user, 30, ttl_seconds=-1)
+    live = credit_ledger.place_hold(db, user, 20)
+    db.commit()
+
+    assert credit_ledger.release_expired_holds(db) == 1
+    db.commit()
+
+    assert stored_balance(db, user) == (100, 20)
+    assert expired.status == "released"
+    assert live.status == "open"
+
+
+def test_placing_a_hold_reclaims_expired_ones(db, make_user):
+    user = make_user(credits=100)
+    credit_ledger.place_hold(db, user, 80, ttl_seconds=-1)
+    db.commit()
+
+    credit_ledger.place_hold(db, user, 90)
+    db.commit()
+
+    assert stored_balance(db, user) == (100, 90)
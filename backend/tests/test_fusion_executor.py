@@ -0,0 +1,69 @@
+import json
+import pytest
+from fusion_executor import parse_chain_config
+
+
+def config(*steps):
+    return json.dumps(list(steps))
+
+
+def test_explicit_dependencies_are_ordered_topologically():
+    steps = parse_chain_config(config(
+        {"id": "colors", "engine_name": "Colors", "depends_on": ["creative"]},
+        {"id": "creative", "engine_name": "Creative"},
+        {"id": "upscale", "engine_name": "Upscale", "depends_on": ["creative"]}
+    ))
+
+    assert [step.id for step in steps] == ["creative", "colors", "upscale"]
+    assert [step.id for step in steps if step.is_output] == ["colors", "upscale"]
+
+
+def test_legacy_orders_chain_sequentially_and_share_levels():
+    steps = parse_chain_config(config(
+        {"engine_name": "Creative", "order": 1},
+        {"engine_name": "Colors", "order": 2},
+        {"engine_name": "Fonts", "order": 2},
+        {"engine_name": "Merge", "order": 3}
+    ))
+
+    by_id = {step.id: step for step in steps}
+    assert by_id["step_1"].depends_on == []
+    assert by_id["step_2"].depends_on == ["step_1"]
+    assert by_id["step_3"].depends_on == ["step_1"]
+    assert by_id["step_4"].depends_on == ["step_2", "step_3"]
+    assert [step.id for step in steps if step.is_output] == ["step_4"]
+
+
+def test_output_flag_overrides_leaf_detection():
+    steps = parse_chain_config(config(
+        {"id": "creative", "engine_name": "Creative", "output": True},
+        {"id": "colors", "engine_name": "Colors", "depends_on": ["creative"]}
+    ))
+
+    assert [step.id for step in steps if step.is_output] == ["creative"]
+
+
+def test_cycle_is_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        parse_chain_config(config(
+            {"id": "a", "engine_name": "A", "depends_on": ["c"]},
+            {"id": "b", "engine_name": "B", "depends_on": ["a"]},
+            {"id": "c", "engine_name": "C", "depends_on": ["b"]}
+        ))
+
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError, match="unknown step 'missing'"):
+        parse_chain_config(config(
+            {"id": "a", "engine_name": "A", "depends_on": ["missing"]}
+        ))
+
+
+@pytest.mark.parametrize("chain_config", [
+    "[]",
+    "{}",
+    config({"id": "a", "engine_name": "A"}, {"id": "a", "engine_name": "B"})
+])
+def test_malformed_configs_are_rejected(chain_config):
+    with pytest.raises(ValueError):
+        parse_chain_config(chain_config)
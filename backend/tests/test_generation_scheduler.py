@@ -0,0 +1,99 @@
+from collections import Counter
+import pytest
+import generation_scheduler
+from generation_scheduler import FairScheduler
+from models import SubscriptionTier
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(generation_scheduler, "time", clock)
+    return clock
+
+
+def drain(scheduler):
+    items = []
+    while (item := scheduler.pop()) is not None:
+        items.append(item)
+    return items
+
+
+def test_empty_scheduler_returns_none(clock):
+    assert FairScheduler(aging_seconds=30).pop() is None
+
+
+def test_tiers_share_dispatches_by_weight(clock):
+    scheduler = FairScheduler(aging_seconds=30)
+    for index in range(20):
+        scheduler.push(SubscriptionTier.AGENCY, 1, ("agency", index))
+        scheduler.push(SubscriptionTier.PRO, 2, ("pro", index))
+        scheduler.push(SubscriptionTier.FREE, 3, ("free", index))
+
+    first = [scheduler.pop()[0] for _ in range(13)]
+
+    assert Counter(first) == {"agency": 8, "pro": 4, "free": 1}
+    assert first[0] == "agency"
+    assert len(scheduler) == 47
+
+
+def test_users_in_a_tier_take_turns(clock):
+    scheduler = FairScheduler(aging_seconds=30)
+    for index in range(3):
+        scheduler.push(SubscriptionTier.PRO, 1, ("a", index))
+    scheduler.push(SubscriptionTier.PRO, 2, ("b", 0))
+    scheduler.push(SubscriptionTier.PRO, 3, ("c", 0))
+
+    assert drain(scheduler) == [("a", 0), ("b", 0), ("c", 0), ("a", 1), ("a", 2)]
+
+
+def test_unknown_tier_is_treated_as_free(clock):
+    scheduler = FairScheduler(aging_seconds=30)
+    scheduler.push(None, 1, "job")
+
+    assert scheduler.depth()[SubscriptionTier.FREE.value] == 1
+
+
+def test_overdue_item_overtakes_higher_tiers(clock):
+    scheduler = FairScheduler(aging_seconds=30)
+    scheduler.push(SubscriptionTier.FREE, 1, "free")
+    for index in range(3):
+        scheduler.push(SubscriptionTier.AGENCY, 2, ("agency", index))
+
+    assert scheduler.pop() == ("agency", 0)
+    clock.now += 31
+
+    assert scheduler.pop() == "free"
+    assert scheduler.pop() == ("agency", 1)
+
+
+def test_aging_picks_the_starved_user_not_the_tier_head(clock):
+    scheduler = FairScheduler(aging_seconds=30)
+    scheduler.push(SubscriptionTier.FREE, 1, "starved")
+    clock.now += 20
+    scheduler.push(SubscriptionTier.FREE, 2, "recent")
+    scheduler.push(SubscriptionTier.AGENCY, 3, "agency 1")
+    scheduler.push(SubscriptionTier.AGENCY, 3, "agency 2")
+    clock.now += 11
+
+    assert scheduler.pop() == "starved"
+    assert scheduler.pop() == "agency 1"
+
+
+def test_wait_times_are_recorded_per_tier(clock):
+    scheduler = FairScheduler(aging_seconds=30)
+    scheduler.push(SubscriptionTier.PRO, 1, "job")
+    clock.now += 2
+    scheduler.pop()
+
+    waits = scheduler.stats()["wait_times"][SubscriptionTier.PRO.value]
+    assert waits["count"] == 1
+    assert waits["max_ms"] == 2000.0
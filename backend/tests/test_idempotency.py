@@ -0,0 +1,88 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from models import IdempotencyKey
+from idempotency import REPLAY_HEADER, IdempotencyScope, purge_expired_keys
+
+
+def test_retry_replays_the_stored_response(db, make_user):
+    user = make_user()
+    body = {"id": 7, "status": "pending"}
+
+    with IdempotencyScope(db, user.id, "key-1", "fingerprint") as scope:
+        assert scope.replay is None
+        assert scope.store(202, body) == body
+
+    with IdempotencyScope(db, user.id, "key-1", "fingerprint") as retry:
+        assert retry.replay is not None
+        assert retry.replay.status_code == 202
+        assert retry.replay.headers[REPLAY_HEADER] == "true"
+        assert json.loads(retry.replay.body) == body
+
+
+def test_key_reused_for_another_request_is_rejected(db, make_user):
+    user = make_user()
+    with IdempotencyScope(db, user.id, "key-1", "fingerprint") as scope:
+        scope.store(201, {"ok": True})
+
+    with pytest.raises(HTTPException) as error:
+        with IdempotencyScope(db, user.id, "key-1", "other fingerprint"):
+            pass
+
+    assert error.value.status_code == 422
+
+
+def test_retry_while_in_progress_conflicts(db, make_user):
+    user = make_user()
+    with IdempotencyScope(db, user.id, "key-1", "fingerprint"):
+        with pytest.raises(HTTPException) as error:
+            with IdempotencyScope(db, user.id, "key-1", "fingerprint"):
+                pass
+        assert error.value.status_code == 409
+
+
+def test_keys_are_per_user(db, make_user):
+    first, second = make_user(), make_user()
+    with IdempotencyScope(db, first.id, "key-1", "fingerprint") as scope:
+        scope.store(201, {"user": first.id})
+
+    with IdempotencyScope(db, second.id, "key-1", "fingerprint") as scope:
+        assert scope.replay is None
+
+
+def test_failed_request_releases_its_key(db, make_user):
+    user = make_user()
+    with pytest.raises(HTTPException):
+        with IdempotencyScope(db, user.id, "key-1", "fingerprint"):
+            raise HTTPException(status_code=402, detail="Insufficient credits")
+
+    assert db.query(IdempotencyKey).count() == 0
+    with IdempotencyScope(db, user.id, "key-1", "fingerprint") as retry:
+        assert retry.replay is None
+
+
+def test_scope_without_key_does_nothing(db, make_user):
+    user = make_user()
+    with IdempotencyScope(db, user.id, None, "fingerprint") as scope:
+        assert scope.store(201, {"ok": True}) == {"ok": True}
+
+    assert db.query(IdempotencyKey).count() == 0
+
+
+def test_purge_removes_only_expired_keys(db, make_user):
+    user = make_user()
+    with IdempotencyScope(db, user.id, "fresh", "fingerprint") as scope:
+        scope.store(201, {})
+    db.add(IdempotencyKey(
+        user_id=user.id,
+        key="old",
+        request_hash="fingerprint",
+        status="completed",
+        expires_at=datetime.utcnow() - timedelta(hours=1)
+    ))
+    db.commit()
+
+    assert purge_expired_keys(db) == 1
+    db.commit()
+    assert [key for (key,) in db.query(IdempotencyKey.key)] == ["fresh"]
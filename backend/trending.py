@@ -0,0 +1,65 @@
+"""
+Time-decayed trending score of library creatives.
+
+A creative's trending value is the sum of its activity weights (approval,
+views, unlocks), each decaying exponentially with TRENDING_HALF_LIFE_HOURS.
+Decaying every row as time passes would need full-table updates, so
+top_creatives.trending_score stores the sum in a form that never has to be
+touched again:
+
+    trending_score = ln(sum(weight * exp(decay * (t - TRENDING_EPOCH))))
+
+Every term grows at the same rate, so ordering by this column equals
+ordering by the decayed value at any moment, and new activity is folded in
+with one log-add in the UPDATE that records it (see log_add). View counter
+flushes, unlocks and approvals add their deltas; nothing rescans the table.
+Keeping the log instead of the sum avoids float overflow as time passes.
+
+current_value() turns a stored score back into today's decayed value.
+"""
+import math
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import case, func
+from config import settings
+
+TRENDING_EPOCH = datetime(2026, 1, 1)
+
+# Activity weights: an unlock converts, so it counts far more than a view
+APPROVAL_WEIGHT = 10.0
+VIEW_WEIGHT = 1.0
+UNLOCK_WEIGHT = 20.0
+
+
+def decay_rate() -> float:
+    """Exponential decay per second"""
+    return math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def activity_score(weight: float, at: Optional[datetime] = None) -> float:
+    """Log-space contribution of `weight` worth of activity at `at` (now by default)"""
+    at = at or datetime.utcnow()
+    return math.log(weight) + decay_rate() * (at - TRENDING_EPOCH).total_seconds()
+
+
+def initial_score(views_count: int, unlocks_count: int, at: Optional[datetime] = None) -> float:
+    """Score of a creative whose counters so far are all attributed to `at`"""
+    weight = APPROVAL_WEIGHT + (views_count or 0) * VIEW_WEIGHT + (unlocks_count or 0) * UNLOCK_WEIGHT
+    return activity_score(weight, at)
+
+
+def current_value(trending_score: float, at: Optional[datetime] = None) -> float:
+    """Decayed activity weight represented by a stored score"""
+    at = at or datetime.utcnow()
+    return math.exp(trending_score - decay_rate() * (at - TRENDING_EPOCH).total_seconds())
+
+
+def log_add(column, delta):
+    """
+    SQL for ln(exp(column) + exp(delta)), computed without overflow:
+    max + ln(1 + exp(min - max)).
+    """
+    return case(
+        (column > delta, column + func.ln(1 + func.exp(delta - column))),
+        else_=delta + func.ln(1 + func.exp(column - delta))
+    )
@@ -0,0 +1,97 @@
+"""
+Buffered view counting for the public library.
+
+Listing top creatives used to increment views_count on every returned row
+and commit, so each anonymous page view was a write transaction locking up
+to 50 rows. Views are now added to an in-process counter and a background
+thread flushes them every LIBRARY_VIEW_FLUSH_SECONDS as one batched
+UPDATE ... SET views_count = views_count + :n (rows in id order, so pods
+flushing at once do not deadlock), which also adds the views to
+trending_score. The read path never writes; counts shown lag by at most one
+flush interval.
+
+Counts of a failed flush are put back and retried; counts still buffered
+when a process is killed without shutdown are lost, which is acceptable
+for a popularity counter.
+"""
+import threading
+from collections import Counter
+from typing import Iterable
+from sqlalchemy import bindparam, update
+from database import SessionLocal
+from models import TopCreative
+from trending import VIEW_WEIGHT, activity_score, log_add
+from config import settings
+from logging_config import logger
+
+
+class ViewCounter:
+    """Thread-safe view aggregator with a periodic flushing thread"""
+
+    def __init__(self):
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def record(self, creative_ids: Iterable[int]) -> None:
+        """Count one view of each creative"""
+        with self._lock:
+            self._pending.update(creative_ids)
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(self._pending.values())
+
+    def flush(self) -> int:
+        """Write buffered views to top_creatives. Returns the number of rows updated."""
+        with self._lock:
+            batch, self._pending = self._pending, Counter()
+        if not batch:
+            return 0
+
+        table = TopCreative.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("creative_id"))
+            .values(
+                views_count=table.c.views_count + bindparam("views"),
+                trending_score=log_add(table.c.trending_score, bindparam("trend"))
+            )
+        )
+        db = SessionLocal()
+        try:
+            db.execute(statement, [
+                {"creative_id": creative_id, "views": views, "trend": activity_score(views * VIEW_WEIGHT)}
+                for creative_id, views in sorted(batch.items())
+            ])
+            db.commit()
+            return len(batch)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to flush library views: {str(e)}")
+            with self._lock:
+                self._pending.update(batch)
+            return 0
+        finally:
+            db.close()
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="library-view-counter", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flushing thread and write what is left"""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=settings.LIBRARY_VIEW_FLUSH_SECONDS + 5)
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stopping.wait(settings.LIBRARY_VIEW_FLUSH_SECONDS):
+            self.flush()
+
+
+view_counter = ViewCounter()
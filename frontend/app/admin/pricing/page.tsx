@@ -34,6 +34,25 @@ interface AiEngine {
   markup_percentage: number;
   is_active: boolean;
   generation_type: string | null;
+  max_concurrency: number;
+  max_queue: number;
+  breaker_error_threshold: number;
+  breaker_latency_ms: number;
+  breaker_cooldown_seconds: number;
+}
+
+interface EngineHealth {
+  engine_id: number;
+  engine_name: string;
+  in_flight: number;
+  queued: number;
+  max_concurrency: number;
+  max_queue: number;
+  state: 'closed' | 'open' | 'half_open';
+  failure_rate: number;
+  avg_latency_ms: number;
+  window_calls: number;
+  open_for_seconds: number;
 }
 
 export default function AdminPricingPage() {
@@ -42,6 +61,7 @@ export default function AdminPricingPage() {
   const [marginData, setMarginData] = useState<MarginCalculation[]>([]);
   const [exchangeRate, setExchangeRate] = useState<PricingConfig | null>(null);
   const [aiEngines, setAiEngines] = useState<AiEngine[]>([]);
+  const [engineHealth, setEngineHealth] = useState<Record<number, EngineHealth>>({});
   const [loading, setLoading] = useState(true);
   const [editing, setEditing] = useState<{ type: string; field: string } | null>(null);
 
@@ -63,16 +83,20 @@ export default function AdminPricingPage() {
   const fetchData = async () => {
     try {
       setLoading(true);
-      const [marginRes, configRes, enginesRes] = await Promise.all([
+      const [marginRes, configRes, enginesRes, healthRes] = await Promise.all([
         api.get('/api/admin/pricing/margin-calculator'),
         api.get('/api/admin/pricing/config'),
-        api.get('/api/admin/pricing/engines')
+        api.get('/api/admin/pricing/engines'),
+        api.get('/api/admin/pricing/engines/health')
       ]);
 
       setMarginData(marginRes.data);
       const usdConfig = configRes.data.find((c: PricingConfig) => c.key === 'usd_to_rub_exchange_rate');
       setExchangeRate(usdConfig);
       setAiEngines(enginesRes.data);
+      setEngineHealth(
+        Object.fromEntries(healthRes.data.map((item: EngineHealth) => [item.engine_id, item]))
+      );
     } catch (error: any) {
       console.error('Error fetching pricing data:', error);
       showError('Ошибка загрузки данных');
@@ -105,6 +129,15 @@ export default function AdminPricingPage() {
     }
   };
 
+  const getBreakerLabel = (state: EngineHealth['state']): { label: string; className: string } => {
+    const labels = {
+      closed: { label: 'Breaker: закрыт', className: 'bg-green-500/20 text-green-400' },
+      half_open: { label: 'Breaker: пробный вызов', className: 'bg-yellow-500/20 text-yellow-400' },
+      open: { label: 'Breaker: открыт', className: 'bg-red-500/20 text-red-400' }
+    };
+    return labels[state] || labels.closed;
+  };
+
   const getGenerationTypeLabel = (type: string): string => {
     const labels: Record<string, string> = {
       static_image: 'Статичное изображение',
@@ -227,12 +260,29 @@ export default function AdminPricingPage() {
                     Тип: {engine.generation_type ? getGenerationTypeLabel(engine.generation_type) : 'Не указан'}
                   </p>
                 </div>
-                <div className={`px-3 py-1 rounded-full text-xs font-semibold ${
-                  engine.is_active ? 'bg-green-500/20 text-green-400' : 'bg-red-500/20 text-red-400'
-                }`}>
-                  {engine.is_active ? 'Активен' : 'Неактивен'}
+                <div className="flex gap-2">
+                  {engineHealth[engine.id] && (
+                    <div className={`px-3 py-1 rounded-full text-xs font-semibold ${
+                      getBreakerLabel(engineHealth[engine.id].state).className
+                    }`}>
+                      {getBreakerLabel(engineHealth[engine.id].state).label}
+                    </div>
+                  )}
+                  <div className={`px-3 py-1 rounded-full text-xs font-semibold ${
+                    engine.is_active ? 'bg-green-500/20 text-green-400' : 'bg-red-500/20 text-red-400'
+                  }`}>
+                    {engine.is_active ? 'Активен' : 'Неактивен'}
+                  </div>
                 </div>
               </div>
+              {engineHealth[engine.id] && (
+                <p className="text-xs text-text-muted mb-3">
+                  В работе: {engineHealth[engine.id].in_flight}/{engineHealth[engine.id].max_concurrency},
+                  в очереди: {engineHealth[engine.id].queued}/{engineHealth[engine.id].max_queue},
+                  ошибки: {(engineHealth[engine.id].failure_rate * 100).toFixed(0)}%,
+                  средняя задержка: {engineHealth[engine.id].avg_latency_ms} мс
+                </p>
+              )}
               <div className="grid grid-cols-2 gap-4">
                 <div>
                   <label className="text-sm text-text-secondary block mb-2">
@@ -259,6 +309,48 @@ export default function AdminPricingPage() {
                   />
                 </div>
               </div>
+              <div className="grid grid-cols-3 gap-4 mt-4">
+                <div>
+                  <label className="text-sm text-text-secondary block mb-2">
+                    Одновременных вызовов
+                  </label>
+                  <input
+                    type="number"
+                    step="1"
+                    min="1"
+                    value={engine.max_concurrency}
+                    onChange={(e) => updateEngine(engine.id, 'max_concurrency', parseInt(e.target.value))}
+                    className="input-field w-full"
+                  />
+                </div>
+                <div>
+                  <label className="text-sm text-text-secondary block mb-2">
+                    Размер очереди
+                  </label>
+                  <input
+                    type="number"
+                    step="1"
+                    min="0"
+                    value={engine.max_queue}
+                    onChange={(e) => updateEngine(engine.id, 'max_queue', parseInt(e.target.value))}
+                    className="input-field w-full"
+                  />
+                </div>
+                <div>
+                  <label className="text-sm text-text-secondary block mb-2">
+                    Порог ошибок breaker (0–1)
+                  </label>
+                  <input
+                    type="number"
+                    step="0.05"
+                    min="0.05"
+                    max="1"
+                    value={engine.breaker_error_threshold}
+                    onChange={(e) => updateEngine(engine.id, 'breaker_error_threshold', parseFloat(e.target.value))}
+                    className="input-field w-full"
+                  />
+                </div>
+              </div>
             </div>
           ))}
         </div>
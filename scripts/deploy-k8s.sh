@@ -98,6 +98,11 @@ echo "⚙️ Развертывание Backend..."
 kubectl apply -f k8s/backend.yaml
 kubectl rollout status deployment/backend -n $NAMESPACE --timeout=300s
 
+# Развертывание воркеров генерации
+echo "🛠️ Развертывание воркеров генерации..."
+kubectl apply -f k8s/generation-worker.yaml
+kubectl rollout status deployment/generation-worker -n $NAMESPACE --timeout=300s
+
 # Развертывание Frontend
 echo "🎨 Развертывание Frontend..."
 kubectl apply -f k8s/frontend.yaml